@@ -0,0 +1 @@
+# Benchmarks package __init__.py
@@ -0,0 +1,142 @@
+"""Throughput of the pairwise-preference analytics engine on synthetic feedback.
+
+Generates preference rows the way save_preference_feedback writes them (a
+``good`` row then a ``bad`` row per comparison) for models with known
+Bradley-Terry strengths, interleaving concurrent users. It then reports:
+
+    ingest_rows_per_sec     rows per second read through update(), in
+                            dictionary pages like the Supabase client returns
+    ratings_seconds         Bradley-Terry fit plus the bootstrap intervals
+    rank_correlation        Spearman correlation of fitted and true strengths
+    paged_matches_single    whether reading in pages gave the same win matrix
+                            as reading everything at once (must be true)
+    repeat_adds_nothing     whether reading the same rows again, as two
+                            concurrent refreshes would, left the win matrix
+                            unchanged (must be true)
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_analytics --rows 1000000 --models 8
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.common import peak_rss_mb, write_results
+
+
+def synthetic_rows(
+    comparisons: int, models: int, users: int, seed: int = 0
+) -> Dict[str, Any]:
+    """Rows for ``comparisons`` preferences between models of random strength."""
+    rng = np.random.default_rng(seed)
+    strength = np.exp(rng.normal(0, 0.5, models))
+    first = rng.integers(0, models, comparisons)
+    second = (first + rng.integers(1, models, comparisons)) % models
+    first_wins = rng.random(comparisons) < strength[first] / (
+        strength[first] + strength[second]
+    )
+    winner = np.where(first_wins, first, second)
+    loser = np.where(first_wins, second, first)
+    user = rng.integers(0, users, comparisons)
+    # Number each user's messages in order, as the app does
+    by_user = np.argsort(user, kind="stable")
+    starts = np.searchsorted(user[by_user], user[by_user])
+    message = np.empty(comparisons, dtype=np.int64)
+    message[by_user] = (np.arange(comparisons) - starts) * 2 + 1
+    # Rows of concurrent comparisons interleave: another user's rows can land
+    # between a good row and its bad row
+    good_time = np.arange(comparisons) + rng.random(comparisons) * 5
+    bad_time = good_time + rng.random(comparisons) * 5
+    times = np.concatenate([good_time, bad_time])
+    which = np.concatenate([np.arange(comparisons), np.arange(comparisons)])
+    is_good = np.arange(2 * comparisons) < comparisons
+    order = np.argsort(times)
+    rows = [
+        {
+            "id": row_id,
+            "user_id": f"code{user[i]}",
+            "message_index": int(message[i]),
+            "comparison_id": f"comparison{i}",
+            "model_version": f"model{winner[i] if good else loser[i]}",
+            "feedback_type": "good" if good else "bad",
+        }
+        for row_id, (i, good) in enumerate(zip(which[order], is_good[order]), 1)
+    ]
+    return {"rows": rows, "strength": strength}
+
+
+def run(
+    rows: int, models: int, users: int, page_size: int, bootstrap: int
+) -> Dict[str, Any]:
+    from jerechat.preference_analytics import PreferenceAnalytics
+
+    data = synthetic_rows(rows // 2, models, users)
+    feedback = data["rows"]
+
+    paged = PreferenceAnalytics()
+    start = time.perf_counter()
+    for offset in range(0, len(feedback), page_size):
+        paged.update(feedback[offset : offset + page_size], page_size)
+    ingest = time.perf_counter() - start
+
+    single = PreferenceAnalytics()
+    single.update(feedback, len(feedback))
+    order = [single.models.index(model) for model in paged.models]
+    matches = np.array_equal(paged.wins, single.wins[np.ix_(order, order)])
+
+    wins = paged.wins.copy()
+    repeated = paged.update(feedback, page_size)
+    repeat_adds_nothing = repeated == 0 and np.array_equal(paged.wins, wins)
+
+    start = time.perf_counter()
+    ratings = paged.ratings(bootstrap, seed=0)
+    ratings_seconds = time.perf_counter() - start
+
+    fitted = np.array([ratings[f"model{i}"]["rating"] for i in range(models)])
+    ranks = [np.argsort(np.argsort(values)) for values in (fitted, data["strength"])]
+    rank_correlation = float(np.corrcoef(*ranks)[0, 1])
+    return {
+        "rows": len(feedback),
+        "comparisons": int(paged.wins.sum()),
+        "ingest_seconds": ingest,
+        "ingest_rows_per_sec": len(feedback) / ingest,
+        "ratings_seconds": ratings_seconds,
+        "rank_correlation": rank_correlation,
+        "paged_matches_single": bool(matches),
+        "repeat_adds_nothing": bool(repeat_adds_nothing),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Preference analytics throughput")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--models", type=int, default=8)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--bootstrap", type=int, default=1000)
+    parser.add_argument("--output", default="bench_analytics.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.models, args.users, args.page_size, args.bootstrap)
+    print(
+        f"{results['rows']} rows ({results['comparisons']} comparisons)  "
+        f"ingest {results['ingest_rows_per_sec']:,.0f} rows/s  "
+        f"ratings + {args.bootstrap} bootstraps {results['ratings_seconds']:.2f}s  "
+        f"rank correlation {results['rank_correlation']:.3f}  "
+        f"paged == single {results['paged_matches_single']}"
+    )
+    write_results(args.output, "analytics", results)
+    lost = results["rows"] - 2 * results["comparisons"]
+    if not results["paged_matches_single"] or lost:
+        raise SystemExit("Paged reading lost or changed comparisons")
+    if not results["repeat_adds_nothing"]:
+        raise SystemExit("Reading the same rows twice counted them twice")
+
+
+if __name__ == "__main__":
+    main()
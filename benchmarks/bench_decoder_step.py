@@ -0,0 +1,102 @@
+"""Allocation count and latency of one decoder step, before and after.
+
+Compares the eager LuongAttnDecoderRNN.forward step (autograd on, as
+GreedySearchDecoder originally ran it) against inference_step under
+torch.inference_mode() with per-request scratch buffers. Allocations are
+counted with the torch profiler's memory tracking. Run it from the
+repository root:
+
+    python -m benchmarks.bench_decoder_step --output bench_decoder_step.json
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import summarize, write_results
+from constants import DEFAULT_CHECKPOINT_PATH, SOS_TOKEN
+
+
+def _count_allocations(step) -> Dict[str, float]:
+    from torch.profiler import ProfilerActivity, profile
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        step()
+    allocating = [e for e in prof.events() if e.cpu_memory_usage > 0]
+    return {
+        "allocating_ops": len(allocating),
+        "bytes": float(sum(e.cpu_memory_usage for e in allocating)),
+    }
+
+
+def run(checkpoint_path: str, prompt: str, steps: int) -> Dict[str, Any]:
+    import torch
+
+    from jerechat import rampion2_model
+
+    searcher, voc = rampion2_model.load_model(checkpoint_path)
+    if searcher is None or voc is None:
+        raise SystemExit(f"Could not load checkpoint {checkpoint_path}")
+    encoder, decoder = searcher.encoder, searcher.decoder
+    device = rampion2_model.device
+
+    indexes = rampion2_model.indexesFromSentence(voc, rampion2_model.normalizeString(prompt))
+    input_batch = torch.LongTensor([indexes]).transpose(0, 1).to(device)
+    lengths = torch.tensor([len(indexes)])
+    decoder_input = torch.ones(1, 1, device=device, dtype=torch.long) * SOS_TOKEN
+
+    # Before: eager forward with autograd bookkeeping enabled
+    encoder_outputs, encoder_hidden = encoder(input_batch, lengths)
+    hidden = encoder_hidden[: decoder.n_layers]
+
+    def eager_step():
+        return decoder(decoder_input, hidden, encoder_outputs)
+
+    # After: inference mode, split concat weight, reused scratch buffers
+    with torch.inference_mode():
+        inf_outputs, inf_hidden = encoder(input_batch, lengths)
+        scratch = rampion2_model.DecoderScratch(
+            decoder, inf_outputs, decoder.attn.precompute(inf_outputs)
+        )
+        inf_hidden = inf_hidden[: decoder.n_layers]
+
+    def inference_step():
+        with torch.inference_mode():
+            return decoder.inference_step(decoder_input, inf_hidden, scratch)
+
+    results = {}
+    for name, step in (("eager", eager_step), ("inference", inference_step)):
+        step()
+        latencies = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            step()
+            latencies.append(time.perf_counter() - start)
+        results[name] = {"latency": summarize(latencies), **_count_allocations(step)}
+    results["speedup_p50"] = (
+        results["eager"]["latency"]["p50"] / results["inference"]["latency"]["p50"]
+    )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Decoder step allocation benchmark")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--prompt", default="Tell a joke")
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--output", default="bench_decoder_step.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.checkpoint, args.prompt, args.steps)
+    for name in ("eager", "inference"):
+        r = results[name]
+        print(
+            f"{name:<10} p50 {r['latency']['p50'] * 1e6:8.1f}us  "
+            f"{r['allocating_ops']:3d} allocating ops  {r['bytes'] / 1024:8.1f} KiB"
+        )
+    print(f"speedup (p50): {results['speedup_p50']:.2f}x")
+    write_results(args.output, "decoder_step", results)
+
+
+if __name__ == "__main__":
+    main()
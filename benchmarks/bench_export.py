@@ -0,0 +1,252 @@
+"""Throughput and memory of the streaming feedback export.
+
+Fills a stand-in Supabase client with synthetic feedback rows (each with a
+chat history) and exports them with jerechat.feedback_export in each
+format. Each page comes back as freshly decoded JSON, as it would over the
+network, so memory is measured honestly. For each format it reports:
+
+    rows_per_sec       rows exported per second
+    peak_traced_mb     peak Python heap during the export (tracemalloc)
+    parts              part files written
+    bytes              total size of the part files
+
+For comparison, ``select_all`` is the peak heap of reading the whole table
+in one ``select("*")``, as database.py's stats queries do. Each format must
+also export, losslessly, a page of whole-number weights followed by a page of
+fractional weights with a new column. It fails otherwise. Run it from the
+repository root:
+
+    python -m benchmarks.bench_export --rows 200000 --formats parquet csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import write_results
+from constants import MODEL_17PRO, MODEL_RAMPION2
+
+
+class _Page:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+class _KeysetQuery:
+    """The select/gt/order/limit chain iter_feedback_rows uses, over JSON rows."""
+
+    def __init__(self, table: "_KeysetTable"):
+        self.table = table
+        self.after = None
+        self.count = None
+
+    def select(self, columns: str) -> "_KeysetQuery":
+        return self
+
+    def gt(self, column: str, value: int) -> "_KeysetQuery":
+        self.after = value
+        return self
+
+    def order(self, column: str) -> "_KeysetQuery":
+        return self
+
+    def limit(self, count: int) -> "_KeysetQuery":
+        self.count = count
+        return self
+
+    def execute(self) -> _Page:
+        ids, rows = self.table.ids, self.table.rows
+        start = 0 if self.after is None else bisect_right(ids, self.after)
+        end = len(rows) if self.count is None else start + self.count
+        return _Page([json.loads(row) for row in rows[start:end]])
+
+
+class _KeysetTable:
+    def __init__(self, rows: List[str]):
+        self.rows = rows
+        self.ids = list(range(1, len(rows) + 1))
+
+
+class KeysetClient:
+    """Stand-in Supabase client holding rows as JSON text, in id order."""
+
+    def __init__(self, tables: Dict[str, List[str]]):
+        self.tables = {name: _KeysetTable(rows) for name, rows in tables.items()}
+
+    def table(self, name: str) -> _KeysetQuery:
+        return _KeysetQuery(self.tables[name])
+
+
+def synthetic_feedback(rows: int) -> List[str]:
+    history = [
+        {"role": "user", "content": "how are you doing today ?"},
+        {
+            "role": "assistant",
+            "model_order": [MODEL_17PRO, MODEL_RAMPION2],
+            "responses": {
+                MODEL_17PRO: "i am doing fine thanks for asking",
+                MODEL_RAMPION2: "good and you ?",
+            },
+        },
+    ]
+    return [
+        json.dumps(
+            {
+                "id": i,
+                "created_at": "2026-01-01T00:00:00+00:00",
+                "message_index": i % 100,
+                "feedback_type": "good" if i % 2 else "bad",
+                "chat_history": history,
+                "user_id": f"code{i % 500}",
+                "details": None,
+                "model_version": MODEL_17PRO if i % 3 else MODEL_RAMPION2,
+                "model_assignment_timestamp": None,
+                "response_time": 0.1 + (i % 7) / 100,
+                "checkpoint_version": "4000_checkpoint.tar@ac9b5f10",
+            }
+        )
+        for i in range(1, rows + 1)
+    ]
+
+
+def schema_drift_rows() -> List[Dict[str, Any]]:
+    """Whole-number weights first, as PostgREST returns them, then fractions."""
+    rows: List[Dict[str, Any]] = [
+        {"id": i, "weight": 1, "response_time": 2} for i in (1, 2)
+    ]
+    rows += [
+        {"id": 3, "weight": 0.5, "response_time": 1.5, "checkpoint_version": "a"},
+        {"id": 4, "weight": 0.5, "response_time": None, "checkpoint_version": "b"},
+    ]
+    return rows
+
+
+def check_lossless(fmt: str) -> bool:
+    """Whether schema_drift_rows() reads back with every value and column."""
+    from jerechat import feedback_export
+
+    expected = schema_drift_rows()
+    output_dir = tempfile.mkdtemp(prefix="bench_export_")
+    try:
+        stats = feedback_export.export_table(
+            "feedback", output_dir, fmt, iter(expected), page_size=2
+        )
+        if fmt == "csv":
+            exported = [
+                {key: value for key, value in row.items() if value != ""}
+                for path in stats["parts"]
+                for row in csv.DictReader(open(path, newline="", encoding="utf-8"))
+            ]
+            expected = [
+                {key: str(value) for key, value in row.items() if value is not None}
+                for row in expected
+            ]
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            exported = [
+                {key: value for key, value in row.items() if value is not None}
+                for path in stats["parts"]
+                for row in (
+                    pq.read_table(path)
+                    if fmt == "parquet"
+                    else pa.ipc.open_file(path).read_all()
+                ).to_pylist()
+            ]
+            expected = [
+                {key: value for key, value in row.items() if value is not None}
+                for row in expected
+            ]
+    finally:
+        shutil.rmtree(output_dir)
+    return exported == expected
+
+
+def _export(fmt: str, page_size: int, rows_per_file: int):
+    """Export the feedback table once; returns seconds, stats and part sizes."""
+    from jerechat import feedback_export
+
+    output_dir = tempfile.mkdtemp(prefix="bench_export_")
+    try:
+        start = time.perf_counter()
+        stats = feedback_export.export(
+            output_dir, ["feedback"], fmt, None, page_size, rows_per_file
+        )["feedback"]
+        seconds = time.perf_counter() - start
+        parts = [os.path.getsize(path) for path in stats["parts"]]
+    finally:
+        shutil.rmtree(output_dir)
+    return seconds, stats, parts
+
+
+def run(
+    rows: int, formats: List[str], page_size: int, rows_per_file: int
+) -> Dict[str, Any]:
+    import database
+
+    client = KeysetClient({"feedback": synthetic_feedback(rows)})
+    database.supabase = client
+    results: Dict[str, Any] = {"rows": rows}
+
+    tracemalloc.start()
+    client.table("feedback").select("*").execute()
+    results["select_all_peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    for fmt in formats:
+        # Time one pass untraced (tracemalloc slows allocation-heavy code
+        # several times over), then measure the heap on a second pass
+        seconds, stats, parts = _export(fmt, page_size, rows_per_file)
+        tracemalloc.start()
+        _export(fmt, page_size, rows_per_file)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[fmt] = {
+            "rows_per_sec": stats["rows"] / seconds,
+            "peak_traced_mb": peak / 2**20,
+            "parts": len(parts),
+            "bytes": sum(parts),
+            "exported": stats["rows"],
+            "lossless": check_lossless(fmt),
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Streaming feedback export benchmark")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--formats", nargs="+", default=["parquet", "arrow", "csv"])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--rows-per-file", type=int, default=100_000)
+    parser.add_argument("--output", default="bench_export.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.formats, args.page_size, args.rows_per_file)
+    print(
+        f"select all {results['rows']} rows: "
+        f"peak {results['select_all_peak_traced_mb']:.1f} MiB"
+    )
+    for fmt in args.formats:
+        r = results[fmt]
+        print(
+            f"{fmt:<8} {r['rows_per_sec']:>10,.0f} rows/s  "
+            f"peak {r['peak_traced_mb']:6.1f} MiB  "
+            f"{r['parts']} parts, {r['bytes'] / 2**20:.1f} MiB"
+        )
+    write_results(args.output, "export", results)
+    if any(results[fmt]["exported"] != args.rows for fmt in args.formats):
+        raise SystemExit("Export lost rows")
+    if not all(results[fmt]["lossless"] for fmt in args.formats):
+        raise SystemExit("Export coerced or dropped values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Import cost of the invitation gate, from an ``-X importtime`` report.
+
+Renders the gate page of streamlit_app.py with AppTest in a fresh
+interpreter started with ``-X importtime`` and background warm-up disabled.
+It reports:
+
+    gate_ms            wall time of the first script run (the first paint)
+    app_import_ms      cumulative import time of modules the app run pulled in
+    heavy_loaded       whether torch / supabase were imported to draw the gate
+    top                the slowest top-level imports of that run
+
+Modules streamlit and AppTest load for themselves are excluded. Run it from
+the repository root; pass ``--max-ms`` to fail when the gate's imports grow
+past a budget:
+
+    python -m benchmarks.bench_import --max-ms 300
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import write_results
+
+MARKER = "--- jerechat app run ---"
+HEAVY_MODULES = ("torch", "supabase")
+
+# Runs in the child interpreter
+_CHILD = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.secrets["invitation_codes"] = [
+    {{"code_number": "123456", "code_expiry_date": "2099-12-31", "code_notes": "x"}}
+]
+at.secrets["background_warmup"] = False
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+at.run()
+gate_ms = (time.perf_counter() - start) * 1000
+print({marker!r}, file=sys.stderr, flush=True)
+print(json.dumps({{
+    "gate_ms": gate_ms,
+    "heavy_loaded": {{name: name in sys.modules for name in {heavy!r}}},
+    "exceptions": [e.value for e in at.exception],
+}}))
+"""
+
+
+def parse_importtime(lines: List[str]) -> List[Dict[str, Any]]:
+    """Top-level entries of an ``-X importtime`` log, slowest first."""
+    entries = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        # Nested imports are indented under their parent
+        if name.startswith("   "):
+            continue
+        entries.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return sorted(entries, key=lambda e: e["cumulative_ms"], reverse=True)
+
+
+def run(app_path: str, top: int = 15) -> Dict[str, Any]:
+    child = _CHILD.format(
+        app=os.path.abspath(app_path), marker=MARKER, heavy=HEAVY_MODULES
+    )
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", child],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    sections = proc.stderr.split(MARKER)
+    app_lines = sections[1].splitlines() if len(sections) > 2 else []
+    entries = parse_importtime(app_lines)
+    report["app_import_ms"] = sum(e["cumulative_ms"] for e in entries)
+    report["top"] = entries[:top]
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Import-time report for the gate page")
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--output", default="bench_import.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.app, args.top)
+    print(
+        f"gate painted in {results['gate_ms']:.0f}ms, "
+        f"app imports {results['app_import_ms']:.0f}ms"
+    )
+    for name, loaded in results["heavy_loaded"].items():
+        print(f"  {name:<10} {'IMPORTED' if loaded else 'not imported'}")
+    for entry in results["top"]:
+        print(f"  {entry['cumulative_ms']:8.1f}ms  {entry['module']}")
+    write_results(args.output, "import", results)
+
+    if args.max_ms is not None and results["app_import_ms"] > args.max_ms:
+        raise SystemExit(
+            f"Gate imports took {results['app_import_ms']:.0f}ms (budget {args.max_ms:.0f}ms)"
+        )
+    if any(results["heavy_loaded"].values()):
+        raise SystemExit("The gate page imported a heavy module")
+
+
+if __name__ == "__main__":
+    main()
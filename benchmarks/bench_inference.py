@@ -0,0 +1,202 @@
+"""Reproducible inference benchmark for the Rampion 2 stack.
+
+Drives load_model, normalizeString/indexesFromSentence,
+GreedySearchDecoder.forward and generate_response against a checkpoint using
+a seeded synthetic prompt corpus and the recorded prompts in
+jerechat/corpus.txt. Run it from the repository root:
+
+    python -m benchmarks.bench_inference --output bench_inference.json
+
+Each checkpoint is measured in a fresh interpreter, so its import time,
+cold load and peak RSS are not flattered (or inflated) by the one before.
+Compare two runs with any JSON diff tool to spot regressions between commits.
+"""
+
+import argparse
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import (
+    load_prompts,
+    peak_rss_mb,
+    recorded_prompts,
+    summarize,
+    write_results,
+)
+from constants import DEFAULT_CHECKPOINT_PATH, MAX_LENGTH, PRO17_CHECKPOINT_PATH, SOS_TOKEN
+
+
+def synthetic_prompts(voc, count: int, seed: int = 0) -> List[str]:
+    """Seeded prompts of 1..MAX_LENGTH in-vocabulary words."""
+    rng = random.Random(seed)
+    words = sorted(voc.word2index)
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(1, MAX_LENGTH)))
+        for _ in range(count)
+    ]
+
+
+def bench_preprocessing(rampion2_model, voc, prompts: List[str]) -> Dict[str, Any]:
+    normalize, index = [], []
+    for prompt in prompts:
+        start = time.perf_counter()
+        sentence = rampion2_model.normalizeString(prompt)
+        normalize.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        rampion2_model.indexesFromSentence(voc, sentence)
+        index.append(time.perf_counter() - start)
+    return {"normalize": summarize(normalize), "indexes": summarize(index)}
+
+
+def bench_decoder_steps(rampion2_model, searcher, voc, prompts: List[str]) -> Dict[str, Any]:
+    """Time each decoder step separately from the encoder pass."""
+    import torch
+
+    device = rampion2_model.device
+    encoder_times, step_times = [], []
+    with torch.no_grad():
+        for prompt in prompts:
+            indexes = rampion2_model.indexesFromSentence(
+                voc, rampion2_model.normalizeString(prompt)
+            )
+            input_batch = torch.LongTensor([indexes]).transpose(0, 1).to(device)
+            lengths = torch.tensor([len(indexes)])
+
+            start = time.perf_counter()
+            encoder_outputs, encoder_hidden = searcher.encoder(input_batch, lengths)
+            encoder_times.append(time.perf_counter() - start)
+
+            decoder_hidden = encoder_hidden[: searcher.decoder.n_layers]
+            decoder_input = torch.ones(1, 1, device=device, dtype=torch.long) * SOS_TOKEN
+            for _ in range(MAX_LENGTH):
+                start = time.perf_counter()
+                decoder_output, decoder_hidden = searcher.decoder(
+                    decoder_input, decoder_hidden, encoder_outputs
+                )
+                _, decoder_input = torch.max(decoder_output, dim=1)
+                decoder_input = torch.unsqueeze(decoder_input, 0)
+                step_times.append(time.perf_counter() - start)
+    return {"encoder": summarize(encoder_times), "decoder_step": summarize(step_times)}
+
+
+def bench_end_to_end(rampion2_model, searcher, voc, prompts: List[str]) -> Dict[str, Any]:
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        rampion2_model.generate_response(
+            searcher, voc, rampion2_model.normalizeString(prompt)
+        )
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def bench_batches(
+    rampion2_model, searcher, voc, prompts: List[str], max_batch_size: int
+) -> Dict[str, Any]:
+    """Throughput of generate_responses at batch sizes 1..max_batch_size."""
+    results = {}
+    sentences = [rampion2_model.normalizeString(p) for p in prompts]
+    for batch_size in range(1, max_batch_size + 1):
+        latencies = []
+        start = time.perf_counter()
+        for i in range(0, len(sentences) - batch_size + 1, batch_size):
+            batch_start = time.perf_counter()
+            rampion2_model.generate_responses(searcher, voc, sentences[i : i + batch_size])
+            latencies.append(time.perf_counter() - batch_start)
+        wall = time.perf_counter() - start
+        processed = len(latencies) * batch_size
+        results[str(batch_size)] = {
+            "throughput": processed / wall if wall else 0.0,
+            "batch_latency": summarize(latencies),
+        }
+    return results
+
+
+def run(
+    checkpoint_path: str,
+    prompts_file: Optional[str] = None,
+    synthetic_count: int = 200,
+    max_batch_size: int = 8,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    from jerechat import rampion2_model
+
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    searcher, voc = rampion2_model.load_model(checkpoint_path)
+    cold_load = time.perf_counter() - start
+    if searcher is None or voc is None:
+        raise SystemExit(f"Could not load checkpoint {checkpoint_path}")
+
+    corpora = {
+        "synthetic": synthetic_prompts(voc, synthetic_count, seed),
+        "recorded": load_prompts(prompts_file) if prompts_file else recorded_prompts(),
+    }
+
+    # One untimed decode so first-call allocator warm-up is not measured
+    rampion2_model.generate_response(searcher, voc, "hello")
+
+    results: Dict[str, Any] = {
+        "checkpoint": checkpoint_path,
+        "import_seconds": import_time,
+        "cold_load_seconds": cold_load,
+        "corpora": {},
+    }
+    for name, prompts in corpora.items():
+        results["corpora"][name] = {
+            "prompts": len(prompts),
+            "preprocessing": bench_preprocessing(rampion2_model, voc, prompts),
+            "decoder": bench_decoder_steps(rampion2_model, searcher, voc, prompts),
+            "end_to_end": bench_end_to_end(rampion2_model, searcher, voc, prompts),
+            "batches": bench_batches(
+                rampion2_model, searcher, voc, prompts, max_batch_size
+            ),
+        }
+    results["peak_rss_mb"] = peak_rss_mb()
+    results["rss_growth_mb"] = results["peak_rss_mb"] - rss_before
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rampion 2 inference benchmark")
+    parser.add_argument(
+        "--checkpoint",
+        action="append",
+        help="Checkpoint to benchmark; repeat for several (default: both bundled)",
+    )
+    parser.add_argument("--prompts", help="File with one recorded prompt per line")
+    parser.add_argument("--synthetic", type=int, default=200)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_inference.json")
+    args = parser.parse_args(argv)
+
+    checkpoints = args.checkpoint or [DEFAULT_CHECKPOINT_PATH, PRO17_CHECKPOINT_PATH]
+    results = {}
+    for path in checkpoints:
+        # A spawned process starts without torch imported and with its own
+        # ru_maxrss, which never goes down within a process
+        with ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results[path] = executor.submit(
+                run, path, args.prompts, args.synthetic, args.max_batch_size, args.seed
+            ).result()
+    for path, result in results.items():
+        e2e = result["corpora"]["recorded"]["end_to_end"]
+        print(
+            f"{path}: load {result['cold_load_seconds']:.2f}s, "
+            f"p50 {e2e['p50'] * 1000:.1f}ms, p95 {e2e['p95'] * 1000:.1f}ms, "
+            f"p99 {e2e['p99'] * 1000:.1f}ms, peak RSS {result['peak_rss_mb']:.0f} MiB"
+        )
+    write_results(args.output, "inference", results)
+
+
+if __name__ == "__main__":
+    main()
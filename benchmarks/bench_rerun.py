@@ -0,0 +1,135 @@
+"""Rerun cost of a preference click against conversation length.
+
+Seeds a logged-in AppTest session with N synthetic turns, then times two
+things for each N:
+
+    full_rerun      a whole-script run, which is what every click used to cost
+    preference      clicking the newest message's preference button, run the
+                    way a browser runs it: only that message's fragment
+
+AppTest always runs the whole script, so the fragment-scoped run is requested
+by tagging the rerun with the fragment id, as the browser does. No model is
+loaded and Supabase is replaced by the in-memory store from load_chat_flow.
+Run it from the repository root:
+
+    python -m benchmarks.bench_rerun --turns 1 10 50 100
+"""
+
+import argparse
+import functools
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from benchmarks.common import summarize, write_results
+from benchmarks.load_chat_flow import INVITATION_CODE, InMemoryStorage
+from constants import MODEL_17PRO, MODEL_RAMPION2
+
+CODE_INFO = {
+    "code_number": INVITATION_CODE,
+    "code_expiry_date": "2099-12-31",
+    "code_notes": "Rerun benchmark",
+}
+RESPONSE = "i am doing fine thanks for asking how about you"
+
+
+def _comparison(turn: int) -> Dict[str, Any]:
+    return {
+        "model_order": (MODEL_17PRO, MODEL_RAMPION2),
+        "pairs": [(MODEL_17PRO, MODEL_RAMPION2)],
+        "responses": {MODEL_17PRO: f"{RESPONSE} {turn}", MODEL_RAMPION2: f"{RESPONSE} {turn}!"},
+        "response_times": {MODEL_17PRO: 0.1, MODEL_RAMPION2: 0.1},
+    }
+
+
+def _seed_session(at, turns: int):
+    from jerechat.session_store import ChatStore
+
+    store = ChatStore(max_messages=2 * turns, max_bytes=1 << 30)
+    for turn in range(turns):
+        store.add("user", content=f"question number {turn}")
+        store.add("assistant", **_comparison(turn))
+    at.session_state["invitation_verified"] = True
+    at.session_state["active_code"] = CODE_INFO
+    at.session_state["chat"] = store
+    return store
+
+
+def _last_fragment_id(at) -> str:
+    sequence = at._fragment_storage._registration_sequence_by_id
+    return max(sequence, key=sequence.get)
+
+
+@contextmanager
+def _fragment_rerun(fragment_id: str) -> Iterator[None]:
+    """Make the next AppTest run a fragment-scoped one, like a browser click."""
+    from streamlit.testing.v1 import local_script_runner
+
+    original = local_script_runner.RerunData
+    local_script_runner.RerunData = functools.partial(original, fragment_id=fragment_id)
+    try:
+        yield
+    finally:
+        local_script_runner.RerunData = original
+
+
+def run(app_path: str, turn_counts: List[int], repeats: int) -> Dict[str, Any]:
+    import database
+    from streamlit.testing.v1 import AppTest
+
+    database.supabase = InMemoryStorage()
+    results = {}
+    for turns in turn_counts:
+        at = AppTest.from_file(os.path.abspath(app_path), default_timeout=120)
+        at.secrets["invitation_codes"] = [CODE_INFO]
+        store = _seed_session(at, turns)
+        last_id = store.messages[-1]["id"]
+        at.run()
+
+        full, click = [], []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            at.run()
+            full.append(time.perf_counter() - start)
+
+            fragment_id = _last_fragment_id(at)
+            at.button(key=f"prefer-left-{last_id}").click()
+            with _fragment_rerun(fragment_id):
+                start = time.perf_counter()
+                at.run()
+                click.append(time.perf_counter() - start)
+            if len(at.exception):
+                raise SystemExit(at.exception[0].value)
+            if not store.get(last_id).get("revealed"):
+                raise SystemExit("Preference click was not applied")
+            # Undo the preference so the next click hits a fresh comparison
+            store.replace(last_id, role="assistant", **_comparison(turns - 1))
+            store.update(last_id, revealed=None)
+
+        results[str(turns)] = {
+            "full_rerun": summarize(full),
+            "preference": summarize(click),
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rerun cost vs conversation length")
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default="bench_rerun.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.app, args.turns, args.repeats)
+    for turns, r in results.items():
+        print(
+            f"{turns:>4} turns  full rerun p50 {r['full_rerun']['p50'] * 1000:7.1f}ms  "
+            f"preference click p50 {r['preference']['p50'] * 1000:7.1f}ms"
+        )
+    write_results(args.output, "rerun", results)
+
+
+if __name__ == "__main__":
+    main()
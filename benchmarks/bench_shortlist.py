@@ -0,0 +1,145 @@
+"""Agreement report for the output-vocabulary shortlist, to pick its size.
+
+Decodes every prompt over the full vocabulary, then with a Shortlist of
+each size and fallback threshold. For each combination it reports:
+
+    sequence_agreement  share of responses identical to the full decode
+    token_agreement     share of tokens identical to the full decode
+    fallback_rate       share of steps redone over the full vocabulary
+    shortlist_words     words in the shortlist (top-K plus EOS)
+    speedup_p50         full p50 latency / shortlist p50 latency
+
+The recommendation is the smallest size (then the lowest threshold) whose
+sequence agreement reaches ``--min-agreement``. Run it from the repository
+root:
+
+    python -m benchmarks.bench_shortlist --sizes 500 1000 2000 --thresholds 0.1 0.3
+"""
+
+import argparse
+import itertools
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import load_prompts, recorded_prompts, summarize, write_results
+from constants import MAX_LENGTH, PRO17_CHECKPOINT_PATH
+
+
+def run(
+    checkpoint_path: str,
+    prompts: List[str],
+    sizes: List[int],
+    thresholds: List[float],
+    repeats: int,
+    max_length: int = MAX_LENGTH,
+) -> Dict[str, Any]:
+    import torch
+
+    from jerechat import rampion2_model
+
+    searcher, voc = rampion2_model.load_model(checkpoint_path)
+    if searcher is None or voc is None:
+        raise SystemExit(f"Could not load checkpoint {checkpoint_path}")
+
+    inputs = []
+    for prompt in prompts:
+        indexes = rampion2_model.indexesFromSentence(
+            voc, rampion2_model.normalizeString(prompt)
+        )
+        inputs.append(
+            (
+                torch.LongTensor([indexes]).transpose(0, 1).to(rampion2_model.device),
+                torch.tensor([len(indexes)]),
+            )
+        )
+
+    def timed(decoder) -> List[Any]:
+        latencies, outputs = [], []
+        for input_batch, lengths in inputs:
+            decoder(input_batch, lengths, max_length)
+            for _ in range(repeats):
+                start = time.perf_counter()
+                tokens, _ = decoder(input_batch, lengths, max_length)
+                latencies.append(time.perf_counter() - start)
+            outputs.append(tokens)
+        return [latencies, outputs]
+
+    full_latencies, reference = timed(searcher)
+    results: Dict[str, Any] = {
+        "full": summarize(full_latencies),
+        "vocabulary": voc.num_words,
+        "combinations": [],
+    }
+    for size, threshold in itertools.product(sizes, thresholds):
+        shortlist = rampion2_model.Shortlist(voc, searcher.decoder, size, threshold)
+        decoder = rampion2_model.InferenceGreedySearchDecoder(
+            searcher.encoder, searcher.decoder, shortlist
+        )
+        latencies, outputs = timed(decoder)
+        latency = summarize(latencies)
+        token_matches = sum(int((a == b).sum()) for a, b in zip(reference, outputs))
+        results["combinations"].append(
+            {
+                "size": size,
+                "threshold": threshold,
+                "shortlist_words": len(shortlist.ids),
+                "sequence_agreement": sum(
+                    torch.equal(a, b) for a, b in zip(reference, outputs)
+                )
+                / len(outputs),
+                "token_agreement": token_matches / (len(outputs) * max_length),
+                "fallback_rate": shortlist.fallback_rate,
+                "latency": latency,
+                "speedup_p50": results["full"]["p50"] / latency["p50"],
+            }
+        )
+    return results
+
+
+def recommend(results: Dict[str, Any], min_agreement: float) -> Optional[Dict[str, Any]]:
+    """Smallest size, then lowest threshold, that meets ``min_agreement``."""
+    passing = [
+        c for c in results["combinations"] if c["sequence_agreement"] >= min_agreement
+    ]
+    if not passing:
+        return None
+    return min(passing, key=lambda c: (c["size"], c["threshold"]))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Output-vocabulary shortlist agreement")
+    parser.add_argument("--checkpoint", default=PRO17_CHECKPOINT_PATH)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.1, 0.3])
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--prompts", default=None, help="File with one prompt per line")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default="bench_shortlist.json")
+    args = parser.parse_args(argv)
+
+    prompts = load_prompts(args.prompts) if args.prompts else recorded_prompts()
+    results = run(args.checkpoint, prompts, args.sizes, args.thresholds, args.repeats)
+    print(
+        f"full vocabulary ({results['vocabulary']} words)  "
+        f"p50 {results['full']['p50'] * 1000:7.2f}ms"
+    )
+    for c in results["combinations"]:
+        print(
+            f"K={c['size']:<6} threshold {c['threshold']:<5}  "
+            f"sequences {c['sequence_agreement']:6.1%}  tokens {c['token_agreement']:6.1%}  "
+            f"fallback {c['fallback_rate']:6.1%}  speedup {c['speedup_p50']:.2f}x"
+        )
+    best = recommend(results, args.min_agreement)
+    results["recommended"] = best
+    if best is None:
+        print(f"No combination reached {args.min_agreement:.0%} agreement")
+    else:
+        print(
+            f"Recommended: shortlist_size = {best['size']}, "
+            f"shortlist_threshold = {best['threshold']}"
+        )
+    write_results(args.output, "shortlist", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Speculative greedy decoding of 1.7 Pro with the Rampion 2 checkpoint as draft.
+
+For each draft length it decodes every prompt twice: once with the plain
+inference decoder of the target checkpoint, and once with
+SpeculativeGreedySearchDecoder. It reports:
+
+    acceptance_rate    share of draft tokens the target agreed with
+    tokens_per_pass    tokens emitted per target verification pass
+    mismatches         prompts whose tokens differ from plain greedy (must be 0)
+    speedup_p50        plain p50 latency / speculative p50 latency
+
+Both checkpoints must share a vocabulary. Run it from the repository root:
+
+    python -m benchmarks.bench_speculative --draft-tokens 2 4 8
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import load_prompts, recorded_prompts, summarize, write_results
+from constants import DEFAULT_CHECKPOINT_PATH, MAX_LENGTH, PRO17_CHECKPOINT_PATH
+
+
+def run(
+    draft_path: str,
+    target_path: str,
+    prompts: List[str],
+    draft_token_counts: List[int],
+    repeats: int,
+    max_length: int = MAX_LENGTH,
+) -> Dict[str, Any]:
+    import torch
+
+    from jerechat import rampion2_model
+
+    draft, draft_voc = rampion2_model.load_model(draft_path)
+    target, target_voc = rampion2_model.load_model(target_path)
+    if draft is None or target is None:
+        raise SystemExit("Could not load both checkpoints")
+
+    inputs = []
+    for prompt in prompts:
+        indexes = rampion2_model.indexesFromSentence(
+            target_voc, rampion2_model.normalizeString(prompt)
+        )
+        inputs.append(
+            (
+                torch.LongTensor([indexes]).transpose(0, 1).to(rampion2_model.device),
+                torch.tensor([len(indexes)]),
+            )
+        )
+
+    def timed(searcher) -> List[Any]:
+        latencies, outputs = [], []
+        for input_batch, lengths in inputs:
+            searcher(input_batch, lengths, max_length)
+            for _ in range(repeats):
+                start = time.perf_counter()
+                tokens, _ = searcher(input_batch, lengths, max_length)
+                latencies.append(time.perf_counter() - start)
+            outputs.append(tokens)
+        return [latencies, outputs]
+
+    plain_latencies, reference = timed(target)
+    results: Dict[str, Any] = {"plain": summarize(plain_latencies)}
+    for num_draft_tokens in draft_token_counts:
+        speculative = rampion2_model.SpeculativeGreedySearchDecoder(
+            draft, target, draft_voc, target_voc, num_draft_tokens
+        )
+        latencies, outputs = timed(speculative)
+        latency = summarize(latencies)
+        results[str(num_draft_tokens)] = {
+            "latency": latency,
+            "acceptance_rate": speculative.acceptance_rate,
+            "tokens_per_pass": (
+                len(inputs) * (repeats + 1) * max_length / speculative.verify_passes
+            ),
+            "mismatches": sum(
+                not torch.equal(a, b) for a, b in zip(reference, outputs)
+            ),
+            "speedup_p50": results["plain"]["p50"] / latency["p50"],
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Speculative decoding benchmark")
+    parser.add_argument("--draft", default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--target", default=PRO17_CHECKPOINT_PATH)
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--prompts", default=None, help="File with one prompt per line")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default="bench_speculative.json")
+    args = parser.parse_args(argv)
+
+    prompts = load_prompts(args.prompts) if args.prompts else recorded_prompts()
+    results = run(args.draft, args.target, prompts, args.draft_tokens, args.repeats)
+    print(f"plain greedy  p50 {results['plain']['p50'] * 1000:7.2f}ms")
+    for num_draft_tokens in args.draft_tokens:
+        r = results[str(num_draft_tokens)]
+        print(
+            f"draft {num_draft_tokens:>2}      p50 {r['latency']['p50'] * 1000:7.2f}ms  "
+            f"acceptance {r['acceptance_rate']:6.1%}  "
+            f"{r['tokens_per_pass']:4.2f} tokens/pass  "
+            f"speedup {r['speedup_p50']:.2f}x  mismatches {r['mismatches']}"
+        )
+    write_results(args.output, "speculative", results)
+    if any(results[str(n)]["mismatches"] for n in args.draft_tokens):
+        raise SystemExit("Speculative decoding diverged from plain greedy decoding")
+
+
+if __name__ == "__main__":
+    main()
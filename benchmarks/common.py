@@ -0,0 +1,83 @@
+"""Helpers shared by the benchmark scripts."""
+
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Sequence
+
+from constants import SUGGESTIONS
+
+CORPUS_PATH = os.path.join("jerechat", "corpus.txt")
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile; returns 0.0 for an empty sequence."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """Latency summary in seconds."""
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def recorded_prompts() -> List[str]:
+    """Questions from the bundled corpus plus the UI suggestion prompts."""
+    prompts = list(SUGGESTIONS.values())
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("-") and not line.startswith("--"):
+                prompts.append(line[1:])
+    return prompts
+
+
+def load_prompts(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_results(path: str, name: str, results: Dict[str, Any]) -> None:
+    """Write results as JSON with enough metadata to diff between commits."""
+    payload = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    print(f"Wrote {path}")
@@ -0,0 +1,343 @@
+"""Golden-output gate: optimized decoders must match eager GreedySearchDecoder.
+
+``--record`` decodes a fixed prompt corpus with the eager
+GreedySearchDecoder of each checkpoint. The corpus is the recorded prompts
+plus seeded synthetic prompts. Each prompt's tokens and scores are saved to
+a golden file. A check run (the default) decodes the same corpus again with
+every inference mode and compares each with the golden outputs:
+
+    mode          decoder                                     tolerance
+    eager         GreedySearchDecoder, re-run                 exact
+    inference     InferenceGreedySearchDecoder (load_model)   exact
+    batched       BatchGreedySearchDecoder, padded batches    exact
+    speculative   SpeculativeGreedySearchDecoder, the other   exact
+                  checkpoint as draft (same vocabulary only)
+    shortlist     InferenceGreedySearchDecoder with Shortlist 1% of responses
+
+"exact" means identical tokens for every prompt, with scores within
+``SCORE_ATOL``. Batching and fused kernels reorder float sums, so scores
+are not bit-identical. For each mode the check reports mismatched
+responses and tokens, the largest score difference, the first differing
+prompt, and the speedup over eager. It exits non-zero if any mode is out of
+tolerance. Record once per checkpoint, then check on every change to the
+decoding code. Run it from the repository root:
+
+    python -m benchmarks.golden_outputs --record --golden golden_outputs.json
+    python -m benchmarks.golden_outputs --golden golden_outputs.json
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.bench_inference import synthetic_prompts
+from benchmarks.common import load_prompts, recorded_prompts, write_results
+from constants import DEFAULT_CHECKPOINT_PATH, MAX_LENGTH, PRO17_CHECKPOINT_PATH
+
+SCORE_ATOL = 1e-4
+
+Outputs = List[Tuple[List[int], List[float]]]
+Decode = Callable[[List[List[int]], int], Outputs]
+
+
+class Tolerance(NamedTuple):
+    max_mismatch_rate: float  # share of responses allowed to differ
+    score_atol: Optional[float]  # None: scores are not compared
+
+
+EXACT = Tolerance(0.0, SCORE_ATOL)
+TOLERANCES = {
+    "eager": EXACT,
+    "inference": EXACT,
+    "batched": EXACT,
+    "speculative": EXACT,
+    # Shortlist scores are probabilities within the shortlist (see
+    # shortlist_inference_loop); bench_shortlist picks the size for 99%
+    "shortlist": Tolerance(0.01, None),
+}
+
+
+def _inputs(rampion2_model, voc, sentences: List[str]) -> List[List[int]]:
+    return [rampion2_model.indexesFromSentence(voc, sentence) for sentence in sentences]
+
+
+def _one_at_a_time(rampion2_model, decoder) -> Decode:
+    import torch
+
+    def decode(inputs: List[List[int]], max_length: int) -> Outputs:
+        outputs = []
+        with torch.inference_mode():
+            for indexes in inputs:
+                input_batch = torch.LongTensor([indexes]).transpose(0, 1)
+                lengths = torch.tensor([len(indexes)])
+                tokens, scores = decoder(
+                    input_batch.to(rampion2_model.device), lengths, max_length
+                )
+                outputs.append((tokens.tolist(), scores.tolist()))
+        return outputs
+
+    return decode
+
+
+def _batched(rampion2_model, decoder, batch_size: int) -> Decode:
+    import torch
+
+    def decode(inputs: List[List[int]], max_length: int) -> Outputs:
+        outputs = []
+        for offset in range(0, len(inputs), batch_size):
+            batch = inputs[offset : offset + batch_size]
+            lengths = torch.tensor([len(indexes) for indexes in batch])
+            input_batch = torch.zeros(int(lengths.max()), len(batch), dtype=torch.long)
+            for i, indexes in enumerate(batch):
+                input_batch[: len(indexes), i] = torch.tensor(indexes)
+            tokens, scores = decoder(
+                input_batch.to(rampion2_model.device), lengths, max_length
+            )
+            outputs.extend(
+                (tokens[:, i].tolist(), scores[:, i].tolist())
+                for i in range(len(batch))
+            )
+        return outputs
+
+    return decode
+
+
+def build_modes(
+    rampion2_model,
+    searcher,
+    voc,
+    draft: Optional[Tuple[Any, Any]],
+    batch_size: int,
+    shortlist_size: int,
+    shortlist_threshold: float,
+) -> Dict[str, Decode]:
+    """Every inference mode of one checkpoint, as ``decode(inputs, max_length)``."""
+    modes = {
+        "eager": _one_at_a_time(
+            rampion2_model,
+            rampion2_model.GreedySearchDecoder(searcher.encoder, searcher.decoder),
+        ),
+        "inference": _one_at_a_time(rampion2_model, searcher),
+        "batched": _batched(
+            rampion2_model,
+            rampion2_model.BatchGreedySearchDecoder(searcher.encoder, searcher.decoder),
+            batch_size,
+        ),
+    }
+    if draft is not None and rampion2_model.vocabularies_match(draft[1], voc):
+        modes["speculative"] = _one_at_a_time(
+            rampion2_model,
+            rampion2_model.SpeculativeGreedySearchDecoder(
+                draft[0], searcher, draft[1], voc
+            ),
+        )
+    shortlist = rampion2_model.Shortlist(
+        voc, searcher.decoder, shortlist_size, shortlist_threshold
+    )
+    modes["shortlist"] = _one_at_a_time(
+        rampion2_model,
+        rampion2_model.InferenceGreedySearchDecoder(
+            searcher.encoder, searcher.decoder, shortlist
+        ),
+    )
+    return modes
+
+
+def compare(
+    golden: Outputs, outputs: Outputs, tolerance: Tolerance, sentences: List[str]
+) -> Dict[str, Any]:
+    """Token and score differences of ``outputs`` against ``golden``."""
+    mismatched, tokens_differing, max_score_diff = [], 0, 0.0
+    for i, ((gold_tokens, gold_scores), (tokens, scores)) in enumerate(
+        zip(golden, outputs)
+    ):
+        differing = sum(a != b for a, b in zip(gold_tokens, tokens))
+        if differing:
+            mismatched.append(i)
+            tokens_differing += differing
+        else:
+            max_score_diff = max(
+                max_score_diff, max(abs(a - b) for a, b in zip(gold_scores, scores))
+            )
+    mismatch_rate = len(mismatched) / len(golden)
+    passed = mismatch_rate <= tolerance.max_mismatch_rate and (
+        tolerance.score_atol is None or max_score_diff <= tolerance.score_atol
+    )
+    result = {
+        "mismatched_responses": len(mismatched),
+        "mismatch_rate": mismatch_rate,
+        "mismatched_tokens": tokens_differing,
+        "max_score_diff": max_score_diff,
+        "passed": passed,
+    }
+    if mismatched:
+        i = mismatched[0]
+        result["first_mismatch"] = {
+            "prompt": sentences[i],
+            "expected": golden[i][0],
+            "actual": outputs[i][0],
+        }
+    return result
+
+
+def _load(rampion2_model, path: str):
+    searcher, voc = rampion2_model.load_model(path)
+    if searcher is None or voc is None:
+        raise SystemExit(f"Could not load checkpoint {path}")
+    return searcher, voc
+
+
+def record(
+    checkpoints: List[str],
+    prompts: List[str],
+    synthetic_count: int,
+    seed: int,
+    max_length: int,
+) -> Dict[str, Any]:
+    """Golden outputs of the eager GreedySearchDecoder for each checkpoint."""
+    from jerechat import rampion2_model
+    from jerechat.model_cache import checkpoint_version
+
+    golden: Dict[str, Any] = {"max_length": max_length, "checkpoints": {}}
+    for path in checkpoints:
+        searcher, voc = _load(rampion2_model, path)
+        sentences = [rampion2_model.normalizeString(prompt) for prompt in prompts]
+        sentences += synthetic_prompts(voc, synthetic_count, seed)
+        eager = rampion2_model.GreedySearchDecoder(searcher.encoder, searcher.decoder)
+        outputs = _one_at_a_time(rampion2_model, eager)(
+            _inputs(rampion2_model, voc, sentences), max_length
+        )
+        golden["checkpoints"][path] = {
+            "version": checkpoint_version(path),
+            "sentences": sentences,
+            "tokens": [tokens for tokens, _ in outputs],
+            "scores": [scores for _, scores in outputs],
+        }
+    return golden
+
+
+def check(
+    golden: Dict[str, Any],
+    batch_size: int,
+    shortlist_size: int,
+    shortlist_threshold: float,
+    repeats: int,
+) -> Dict[str, Any]:
+    """Decode the golden corpus with every mode; compare and time each one."""
+    from jerechat import rampion2_model
+    from jerechat.model_cache import checkpoint_version
+
+    max_length = golden["max_length"]
+    paths = list(golden["checkpoints"])
+    loaded = {path: _load(rampion2_model, path) for path in paths}
+    results: Dict[str, Any] = {}
+    for path, reference in golden["checkpoints"].items():
+        if checkpoint_version(path) != reference["version"]:
+            raise SystemExit(
+                f"{path} is not the checkpoint the golden outputs were recorded "
+                f"from ({reference['version']}); record them again"
+            )
+        searcher, voc = loaded[path]
+        others = [loaded[other] for other in paths if other != path]
+        modes = build_modes(
+            rampion2_model,
+            searcher,
+            voc,
+            others[0] if others else None,
+            batch_size,
+            shortlist_size,
+            shortlist_threshold,
+        )
+        sentences = reference["sentences"]
+        inputs = _inputs(rampion2_model, voc, sentences)
+        expected = list(zip(reference["tokens"], reference["scores"]))
+        results[path] = {}
+        for name, decode in modes.items():
+            # One untimed pass warms up allocators and gives the outputs
+            outputs = decode(inputs, max_length)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                decode(inputs, max_length)
+            seconds = (time.perf_counter() - start) / repeats
+            results[path][name] = compare(
+                expected, outputs, TOLERANCES[name], sentences
+            )
+            results[path][name]["seconds"] = seconds
+        eager_seconds = results[path]["eager"]["seconds"]
+        for result in results[path].values():
+            result["speedup"] = eager_seconds / result["seconds"]
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Golden-output equivalence gate")
+    parser.add_argument("--record", action="store_true", help="Record golden outputs")
+    parser.add_argument("--golden", default="golden_outputs.json")
+    parser.add_argument(
+        "--checkpoint",
+        action="append",
+        help="Checkpoint to record; repeat for several (default: both bundled)",
+    )
+    parser.add_argument("--prompts", help="File with one prompt per line")
+    parser.add_argument("--synthetic", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--shortlist-size", type=int, default=1000)
+    parser.add_argument("--shortlist-threshold", type=float, default=0.5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="bench_golden_outputs.json")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        checkpoints = args.checkpoint or [
+            DEFAULT_CHECKPOINT_PATH,
+            PRO17_CHECKPOINT_PATH,
+        ]
+        prompts = load_prompts(args.prompts) if args.prompts else recorded_prompts()
+        golden = record(
+            checkpoints, prompts, args.synthetic, args.seed, args.max_length
+        )
+        with open(args.golden, "w") as f:
+            json.dump(golden, f)
+        for path, reference in golden["checkpoints"].items():
+            print(f"{path}: {len(reference['sentences'])} prompts recorded")
+        print(f"Wrote {args.golden}")
+        return
+
+    with open(args.golden) as f:
+        golden = json.load(f)
+    results = check(
+        golden,
+        args.batch_size,
+        args.shortlist_size,
+        args.shortlist_threshold,
+        args.repeats,
+    )
+    failed = []
+    for path, modes in results.items():
+        print(path)
+        for name, r in modes.items():
+            status = "ok" if r["passed"] else "FAIL"
+            print(
+                f"  {name:<12} {status:<4}  {r['mismatched_responses']:>4} responses "
+                f"({r['mismatched_tokens']} tokens) differ  "
+                f"max score diff {r['max_score_diff']:.1e}  "
+                f"speedup {r['speedup']:.2f}x"
+            )
+            if not r["passed"]:
+                failed.append(f"{path} {name}")
+                if "first_mismatch" in r:
+                    mismatch = r["first_mismatch"]
+                    print(
+                        f"    {mismatch['prompt']!r}: "
+                        f"expected {mismatch['expected']}, got {mismatch['actual']}"
+                    )
+    write_results(args.output, "golden_outputs", results)
+    if failed:
+        raise SystemExit(f"Outside tolerance: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
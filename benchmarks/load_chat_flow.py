@@ -0,0 +1,249 @@
+"""Headless load generator for the Streamlit chat flow.
+
+Simulates users going through the real flow in streamlit_app.py with
+Streamlit's AppTest harness: invitation check, a first question or suggestion
+pill, the A/B generation, a preference click and follow-up turns. Supabase is
+replaced by an in-memory store that counts every call, so no network or
+credentials are needed. Run it from the repository root:
+
+    python -m benchmarks.load_chat_flow --sessions 20 --turns 3
+
+Reports sessions/sec, rerun latency percentiles per interaction, resident
+memory per live session and database calls per interaction.
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import summarize, write_results
+from constants import DEFAULT_CHECKPOINT_PATH, PRO17_CHECKPOINT_PATH, SUGGESTIONS
+
+INVITATION_CODE = "123456"
+
+
+class _Result:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+class _Query:
+    """Just enough of the supabase query builder for database.py."""
+
+    def __init__(self, store: "InMemoryStorage", table: str):
+        self.store = store
+        self.table = table
+        self.filters: List = []
+        self.rows_to_insert: Optional[Dict[str, Any]] = None
+        self.negate = False
+        self.order_by: Optional[str] = None
+        self.descending = False
+        self.max_rows: Optional[int] = None
+
+    @property
+    def not_(self) -> "_Query":
+        self.negate = True
+        return self
+
+    def select(self, *columns, **kwargs) -> "_Query":
+        return self
+
+    def insert(self, data: Dict[str, Any]) -> "_Query":
+        self.rows_to_insert = data
+        return self
+
+    def eq(self, column: str, value: Any) -> "_Query":
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column: str, value: Any) -> "_Query":
+        self.filters.append(lambda row: row.get(column) > value)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self.order_by = column
+        self.descending = desc
+        return self
+
+    def limit(self, count: int) -> "_Query":
+        self.max_rows = count
+        return self
+
+    def is_(self, column: str, value: Any) -> "_Query":
+        negate = self.negate
+        self.negate = False
+        self.filters.append(lambda row: (row.get(column) is None) != negate)
+        return self
+
+    def execute(self) -> _Result:
+        self.store.calls += 1
+        rows = self.store.tables.setdefault(self.table, [])
+        if self.rows_to_insert is not None:
+            row = dict(self.rows_to_insert, id=len(rows) + 1)
+            rows.append(row)
+            return _Result([row])
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.order_by is not None:
+            matched.sort(key=lambda row: row[self.order_by], reverse=self.descending)
+        return _Result(matched[: self.max_rows])
+
+
+class InMemoryStorage:
+    """Stand-in for the Supabase client that counts round trips."""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls = 0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        from benchmarks.common import peak_rss_mb
+
+        return peak_rss_mb()
+
+
+class SessionDriver:
+    """One simulated user, recording latency and DB calls per interaction."""
+
+    def __init__(self, app_path: str, secrets: Dict[str, Any], storage: InMemoryStorage, rng: random.Random):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(os.path.abspath(app_path), default_timeout=120)
+        for key, value in secrets.items():
+            self.at.secrets[key] = value
+        self.storage = storage
+        self.rng = rng
+        self.timings: Dict[str, List[float]] = {}
+        self.db_calls: Dict[str, List[int]] = {}
+        self.errors = 0
+
+    def _step(self, name: str, action) -> None:
+        calls_before = self.storage.calls
+        start = time.perf_counter()
+        action()
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+        self.db_calls.setdefault(name, []).append(self.storage.calls - calls_before)
+        if len(self.at.exception):
+            self.errors += 1
+
+    def run(self, turns: int) -> None:
+        at = self.at
+        self._step("gate", at.run)
+
+        def login():
+            at.text_input[0].input(INVITATION_CODE)
+            at.button[0].click()
+            at.run()
+
+        self._step("login", login)
+
+        if self.rng.random() < 0.5:
+            label = self.rng.choice(list(SUGGESTIONS))
+            self._step("first_question", lambda: at.button_group[0].select(label).run())
+        else:
+            self._step("first_question", lambda: at.chat_input[0].set_value("Hello").run())
+
+        for turn in range(turns):
+            preference_buttons = [
+                b for b in at.button if b.key and b.key.startswith("prefer-")
+            ]
+            if preference_buttons:
+                button = self.rng.choice(preference_buttons)
+                self._step("preference", lambda: button.click().run())
+            if turn < turns - 1:
+                prompt = self.rng.choice(list(SUGGESTIONS.values()))
+                self._step("follow_up", lambda: at.chat_input[0].set_value(prompt).run())
+
+
+def run(
+    app_path: str,
+    sessions: int,
+    turns: int,
+    secrets: Dict[str, Any],
+    seed: int = 0,
+) -> Dict[str, Any]:
+    import database
+
+    storage = InMemoryStorage()
+    database.supabase = storage
+    rng = random.Random(seed)
+
+    drivers = []
+    rss_start = current_rss_mb()
+    start = time.perf_counter()
+    for _ in range(sessions):
+        driver = SessionDriver(app_path, secrets, storage, rng)
+        driver.run(turns)
+        # Keep sessions alive so their state counts towards resident memory
+        drivers.append(driver)
+    wall = time.perf_counter() - start
+    rss_end = current_rss_mb()
+
+    timings: Dict[str, List[float]] = {}
+    db_calls: Dict[str, List[int]] = {}
+    for driver in drivers:
+        for name, values in driver.timings.items():
+            timings.setdefault(name, []).extend(values)
+        for name, values in driver.db_calls.items():
+            db_calls.setdefault(name, []).extend(values)
+
+    return {
+        "sessions": sessions,
+        "turns": turns,
+        "sessions_per_second": sessions / wall if wall else 0.0,
+        "rerun_latency": {name: summarize(values) for name, values in timings.items()},
+        "db_calls_per_interaction": {
+            name: sum(values) / len(values) for name, values in db_calls.items()
+        },
+        "rss_mb_per_session": (rss_end - rss_start) / sessions if sessions else 0.0,
+        "errors": sum(driver.errors for driver in drivers),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit chat flow")
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--rampion2-checkpoint", default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--pro17-checkpoint", default=PRO17_CHECKPOINT_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_load_chat_flow.json")
+    args = parser.parse_args(argv)
+
+    secrets = {
+        "invitation_codes": [
+            {
+                "code_number": INVITATION_CODE,
+                "code_expiry_date": "2099-12-31",
+                "code_notes": "Load test",
+            }
+        ],
+        "rampion2_checkpoint_path": args.rampion2_checkpoint,
+        "pro17_checkpoint_path": args.pro17_checkpoint,
+    }
+    results = run(args.app, args.sessions, args.turns, secrets, args.seed)
+
+    print(f"{results['sessions_per_second']:.2f} sessions/s, "
+          f"{results['rss_mb_per_session']:.1f} MiB/session, {results['errors']} errors")
+    for name, summary in results["rerun_latency"].items():
+        print(
+            f"  {name:<15} p50 {summary['p50'] * 1000:7.1f}ms  "
+            f"p95 {summary['p95'] * 1000:7.1f}ms  "
+            f"db calls {results['db_calls_per_interaction'][name]:.1f}"
+        )
+    write_results(args.output, "load_chat_flow", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,29 @@
 import datetime
-from typing import Any, Dict, List, Optional
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence
 
 import streamlit as st
-from supabase import Client, create_client
 
 from constants import MODEL_17PRO, MODEL_RAMPION2
+from jerechat.instrumentation import traced
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Initialize Supabase client with error handling
-supabase: Optional[Client] = None
+supabase: Optional["Client"] = None
+
+# Bumped after every feedback write so cached stats know when to refresh
+_feedback_version = 0
+_feedback_version_lock = threading.Lock()
 
 
-def _init_supabase() -> Optional[Client]:
-    """Initialize and return Supabase client, or None if configuration is missing."""
+def _init_supabase() -> Optional["Client"]:
+    """Initialize and return Supabase client, or None if configuration is missing.
+
+    The supabase package is imported here, on first use, so pages that never
+    touch the database do not pay for importing it.
+    """
     global supabase
 
     if supabase is not None:
@@ -27,6 +39,8 @@ def _init_supabase() -> Optional[Client]:
             )
             return None
 
+        from supabase import create_client
+
         supabase = create_client(supabase_url, supabase_key)
         return supabase
     except Exception as e:
@@ -36,6 +50,22 @@ def _init_supabase() -> Optional[Client]:
         return None
 
 
+def get_feedback_version() -> int:
+    """
+    Return a counter that changes whenever this process writes feedback.
+
+    Returns:
+        Number of successful feedback writes since the process started
+    """
+    return _feedback_version
+
+
+def _bump_feedback_version() -> None:
+    global _feedback_version
+    with _feedback_version_lock:
+        _feedback_version += 1
+
+
 # ORIGINAL SAVE_FEEDBACK (commented out, kept for reference)
 # def save_feedback(
 #     message_index: int,
@@ -82,6 +112,7 @@ def _init_supabase() -> Optional[Client]:
 #         return None
 
 
+@traced("feedback_insert")
 def save_original_feedback(
     message_index: int,
     feedback_type: str,
@@ -115,12 +146,14 @@ def save_original_feedback(
             "details": details,
         }
         result = client.table("original_feedback").insert(data).execute()
+        _bump_feedback_version()
         return result.data
     except Exception as e:
         st.error(f"Failed to save original feedback: {e}")
         return None
 
 
+@traced("feedback_insert")
 def save_preference_feedback(
     message_index: int,
     preferred_model: str,
@@ -129,6 +162,9 @@ def save_preference_feedback(
     user_id: str = "anonymous",
     details: Optional[str] = None,
     response_times: Optional[Dict[str, float]] = None,
+    checkpoint_versions: Optional[Dict[str, str]] = None,
+    weight: float = 1.0,
+    comparison_id: Optional[str] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Save preference feedback to Supabase. Preferred model gets 'good', other gets 'bad'.
@@ -141,6 +177,12 @@ def save_preference_feedback(
         user_id: User identifier (defaults to "anonymous")
         details: Optional additional feedback details
         response_times: Dict with response times for each model
+        checkpoint_versions: Dict with the checkpoint version behind each
+            model's response
+        weight: How much both rows count in the feedback stats; a preference
+            among K arms is saved as K - 1 pairs of weight 1 / (K - 1)
+        comparison_id: Identifies the comparison both rows belong to, so
+            analytics can pair them
 
     Returns:
         Response data from Supabase, or None if save failed
@@ -161,6 +203,11 @@ def save_preference_feedback(
             "response_time": response_times.get(preferred_model)
             if response_times
             else None,
+            "checkpoint_version": checkpoint_versions.get(preferred_model)
+            if checkpoint_versions
+            else None,
+            "weight": weight,
+            "comparison_id": comparison_id,
         }
         client.table("feedback").insert(preferred_data).execute()
 
@@ -175,20 +222,34 @@ def save_preference_feedback(
             "response_time": response_times.get(other_model)
             if response_times
             else None,
+            "checkpoint_version": checkpoint_versions.get(other_model)
+            if checkpoint_versions
+            else None,
+            "weight": weight,
+            "comparison_id": comparison_id,
         }
         result = client.table("feedback").insert(other_data).execute()
+        _bump_feedback_version()
         return result.data
     except Exception as e:
         st.error(f"Failed to save preference feedback: {e}")
         return None
 
 
-def get_feedback_stats() -> Dict[str, int]:
+def _weighted_count(rows: Optional[List[Dict[str, Any]]]) -> float:
+    """Sum of the rows' weights; rows saved before the weight column count 1."""
+    return sum(
+        1.0 if row.get("weight") is None else row["weight"] for row in rows or ()
+    )
+
+
+@traced("stats_query")
+def get_feedback_stats() -> Dict[str, float]:
     """
     Get feedback statistics.
 
     Returns:
-        Dictionary with 'good' and 'bad' feedback counts
+        Dictionary with 'good' and 'bad' feedback counts, weighted by row
     """
     client = _init_supabase()
     if client is None:
@@ -203,15 +264,16 @@ def get_feedback_stats() -> Dict[str, int]:
         )
 
         return {
-            "good": len(good_count.data) if good_count.data else 0,
-            "bad": len(bad_count.data) if bad_count.data else 0,
+            "good": _weighted_count(good_count.data),
+            "bad": _weighted_count(bad_count.data),
         }
     except Exception as e:
         st.error(f"Failed to get feedback stats: {e}")
         return {"good": 0, "bad": 0}
 
 
-def get_model_feedback_stats(model_version: str) -> Dict[str, int]:
+@traced("stats_query")
+def get_model_feedback_stats(model_version: str) -> Dict[str, float]:
     """
     Get feedback statistics for a specific model version.
 
@@ -219,7 +281,8 @@ def get_model_feedback_stats(model_version: str) -> Dict[str, int]:
         model_version: Model version to filter by ("1.7pro" or "rampion2")
 
     Returns:
-        Dictionary with 'good' and 'bad' feedback counts for the specified model
+        Dictionary with 'good' and 'bad' feedback counts for the specified
+        model, weighted by row
     """
     client = _init_supabase()
     if client is None:
@@ -242,27 +305,73 @@ def get_model_feedback_stats(model_version: str) -> Dict[str, int]:
         )
 
         return {
-            "good": len(good_count.data) if good_count.data else 0,
-            "bad": len(bad_count.data) if bad_count.data else 0,
+            "good": _weighted_count(good_count.data),
+            "bad": _weighted_count(bad_count.data),
         }
     except Exception as e:
         st.error(f"Failed to get model feedback stats: {e}")
         return {"good": 0, "bad": 0}
 
 
-def get_ab_test_results() -> Dict[str, Dict[str, int]]:
+def get_ab_test_results(
+    models: Sequence[str] = (MODEL_17PRO, MODEL_RAMPION2),
+) -> Dict[str, Dict[str, float]]:
     """
-    Get A/B test results comparing both model versions.
+    Get A/B test results comparing model versions.
+
+    Args:
+        models: Model versions to report (default: the two bundled models)
 
     Returns:
         Dictionary with feedback stats for each model version
     """
-    return {
-        MODEL_17PRO: get_model_feedback_stats(MODEL_17PRO),
-        MODEL_RAMPION2: get_model_feedback_stats(MODEL_RAMPION2),
-    }
+    return {model: get_model_feedback_stats(model) for model in models}
+
+
+def iter_feedback_rows(
+    columns: str = "*",
+    after_id: int = 0,
+    page_size: int = 1000,
+    table: str = "feedback",
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield rows with an id above ``after_id``, in id order, one page per query.
+
+    Pages are keyset-paginated: each query starts after the last id seen, so
+    a page costs the same however deep into the table it is, and only one
+    page is held in memory. PostgREST caps each response at its max-rows
+    setting whatever ``page_size`` asks for, so reading stops only at an
+    empty page. Errors are raised to the caller.
+
+    Args:
+        columns: Columns to select; must include "id"
+        after_id: Only rows with a larger id are returned
+        page_size: Rows fetched per query
+        table: Table to read
+
+    Yields:
+        One row dictionary at a time
+    """
+    client = _init_supabase()
+    if client is None:
+        return
+
+    while True:
+        page = (
+            client.table(table)
+            .select(columns)
+            .gt("id", after_id)
+            .order("id")
+            .limit(page_size)
+            .execute()
+        ).data
+        if not page:
+            return
+        yield from page
+        after_id = page[-1]["id"]
 
 
+@traced("stats_query")
 def get_response_time_stats(model_version: Optional[str] = None) -> Dict[str, float]:
     """
     Get response time statistics.
@@ -313,9 +422,11 @@ def get_response_time_stats(model_version: Optional[str] = None) -> Dict[str, fl
 # Explicitly export functions for clarity (exclude deprecated save_feedback)
 __all__ = [
     "get_feedback_stats",
+    "get_feedback_version",
     "get_model_feedback_stats",
     "get_ab_test_results",
     "get_response_time_stats",
+    "iter_feedback_rows",
     "save_original_feedback",
     "save_preference_feedback",
 ]
@@ -1,8 +1,15 @@
+import hashlib
+import itertools
 import random
+import threading
+import time
+from statistics import NormalDist
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import streamlit as st
 
 from constants import MODEL_17PRO, MODEL_RAMPION2
+from jerechat import instrumentation
 
 
 def get_random_model_order():
@@ -17,7 +24,236 @@ def get_random_model_order():
     return models[0], models[1]
 
 
-def get_model_order():
+def draw_models(models: Sequence[str], k: int = 2) -> Tuple[str, ...]:
+    """
+    Draw ``k`` distinct models from a registry, in random display order.
+
+    Args:
+        models: Model ids to draw from
+        k: Number of arms in the comparison (at most ``len(models)``)
+
+    Returns:
+        tuple: The drawn model ids, left to right
+    """
+    if not 2 <= k <= len(models):
+        raise ValueError(f"Cannot compare {k} of {len(models)} models")
+    return tuple(random.sample(list(models), k))
+
+
+def pairwise_assignments(model_order: Sequence[str]) -> List[Tuple[str, str]]:
+    """
+    Every pair of arms shown together, each in display order.
+
+    A preference for one arm is logged against each pair that contains it.
+    """
+    return list(itertools.combinations(model_order, 2))
+
+
+def get_model_order(models: Sequence[str] = (MODEL_17PRO, MODEL_RAMPION2), k: int = 2):
     """Get a random model order for this message."""
-    left, right = get_random_model_order()
-    return left, right
+    return draw_models(models, k)
+
+
+def _unit(*parts: Any) -> float:
+    """A uniform number in (0, 1) fixed by ``parts``, for sticky draws."""
+    digest = hashlib.sha256(":".join(map(str, parts)).encode()).digest()
+    return (int.from_bytes(digest[:8], "big") + 0.5) / 2**64
+
+
+class _Arm:
+    __slots__ = ("good", "bad", "latency_sum", "latency_count")
+
+    def __init__(self):
+        self.good = 0.0
+        self.bad = 0.0
+        self.latency_sum = 0.0
+        self.latency_count = 0.0
+
+    def add(
+        self,
+        feedback_type: str,
+        response_time: Optional[float],
+        sign: int = 1,
+        weight: Optional[float] = None,
+    ) -> None:
+        # Rows saved before the weight column count in full
+        weight = sign * (1.0 if weight is None else weight)
+        if feedback_type == "good":
+            self.good += weight
+        elif feedback_type == "bad":
+            self.bad += weight
+        if response_time is not None:
+            self.latency_sum += weight * response_time
+            self.latency_count += weight
+
+
+class AdaptiveAllocator:
+    """
+    Thompson-sampling choice of comparison arms, with an optional latency cost.
+
+    Each model's preference rate has a Beta posterior over its good/bad
+    feedback rows, each counted by its ``weight``. An arm's score is a draw
+    from that posterior minus ``cost_per_second`` times its mean recorded
+    response time; the ``k`` best scores are shown. With probability
+    ``epsilon`` the arms are drawn uniformly instead, so no model is starved
+    of fresh feedback.
+
+    Draws are sticky: each invitation code gets a fixed quantile of every
+    model's posterior (a hash of the code and model id), so the same user
+    keeps seeing the same models until the posteriors move. The posterior
+    lives in memory. It is updated right away by this process's own
+    feedback and, at most every ``sync_interval`` seconds, from the new rows
+    ``fetch_rows`` returns, on a background thread. Assignment itself never
+    queries the database.
+    """
+
+    def __init__(
+        self,
+        fetch_rows: Callable[[int], Iterable[Dict[str, Any]]],
+        sync_interval: float = 300.0,
+        epsilon: float = 0.1,
+        cost_per_second: float = 0.0,
+        prior: Tuple[float, float] = (1.0, 1.0),
+    ):
+        self.sync_interval = sync_interval
+        self.epsilon = epsilon
+        self.cost_per_second = cost_per_second
+        self.prior = prior
+        self.last_id = 0
+        self.last_sync: Optional[float] = None
+        self._fetch_rows = fetch_rows
+        self._arms: Dict[str, _Arm] = {}
+        # Feedback recorded by this process and not yet read back by a sync
+        self._pending: List[Tuple[str, str, Optional[float], float]] = []
+        self._syncing = False
+        self._lock = threading.Lock()
+
+    def choose(self, models: Sequence[str], k: int, key: str) -> Tuple[str, ...]:
+        """
+        Pick ``k`` of ``models`` for the user ``key``, in random display order.
+
+        Starts a background sync if the posterior is stale; never blocks on it.
+        """
+        if not 2 <= k <= len(models):
+            raise ValueError(f"Cannot compare {k} of {len(models)} models")
+        self.maybe_sync()
+        if _unit(key, "explore") < self.epsilon:
+            arms = random.Random(_unit(key, "uniform")).sample(list(models), k)
+            strategy = "explore"
+        else:
+            scores = self.scores(models, key)
+            arms = sorted(models, key=lambda model: -scores[model])[:k]
+            strategy = "exploit"
+        instrumentation.increment(
+            "ab_allocations_total", labels={"strategy": strategy}
+        )
+        random.shuffle(arms)
+        return tuple(arms)
+
+    def scores(self, models: Sequence[str], key: str) -> Dict[str, float]:
+        """Each model's sticky posterior draw for ``key``, less its latency cost."""
+        scores = {}
+        with self._lock:
+            for model in models:
+                a, b = self._posterior(model)
+                mean = a / (a + b)
+                sd = (a * b / ((a + b) ** 2 * (a + b + 1))) ** 0.5
+                # Normal approximation of the Beta quantile, kept inside (0, 1)
+                draw = NormalDist(mean, sd).inv_cdf(_unit(key, model))
+                cost = self.cost_per_second * self._latency(model)
+                scores[model] = min(max(draw, 0.0), 1.0) - cost
+        return scores
+
+    def observe(
+        self,
+        model: str,
+        feedback_type: str,
+        response_time: Optional[float] = None,
+        weight: float = 1.0,
+    ) -> None:
+        """Count one feedback row (of ``weight``) this process just saved."""
+        with self._lock:
+            self._arms.setdefault(model, _Arm()).add(
+                feedback_type, response_time, weight=weight
+            )
+            self._pending.append((model, feedback_type, response_time, weight))
+
+    def maybe_sync(self) -> None:
+        """Sync on a daemon thread if the last sync is older than the interval."""
+        with self._lock:
+            stale = (
+                self.last_sync is None
+                or time.monotonic() - self.last_sync >= self.sync_interval
+            )
+            if self._syncing or not stale:
+                return
+            self._syncing = True
+        threading.Thread(target=self.sync, name="jerechat-ab-sync", daemon=True).start()
+
+    def sync(self) -> int:
+        """Fold feedback rows newer than the last sync in; returns how many."""
+        with self._lock:
+            self._syncing = True
+            # Rows this process saved before the fetch are read back by it
+            pending, self._pending = self._pending, []
+        rows = 0
+        try:
+            with instrumentation.span("ab_sync"):
+                arms: Dict[str, _Arm] = {}
+                last_id = self.last_id
+                for row in self._fetch_rows(last_id):
+                    arms.setdefault(row["model_version"], _Arm()).add(
+                        row.get("feedback_type"),
+                        row.get("response_time"),
+                        weight=row.get("weight"),
+                    )
+                    last_id = max(last_id, row["id"])
+                    rows += 1
+            with self._lock:
+                for model, feedback_type, response_time, weight in pending:
+                    self._arms[model].add(
+                        feedback_type, response_time, sign=-1, weight=weight
+                    )
+                for model, arm in arms.items():
+                    total = self._arms.setdefault(model, _Arm())
+                    total.good += arm.good
+                    total.bad += arm.bad
+                    total.latency_sum += arm.latency_sum
+                    total.latency_count += arm.latency_count
+                self.last_id = last_id
+        except Exception as e:
+            print(f"A/B allocation sync failed: {e}")
+            with self._lock:
+                self._pending[:0] = pending
+        finally:
+            with self._lock:
+                self.last_sync = time.monotonic()
+                self._syncing = False
+        instrumentation.increment("ab_sync_rows_total", rows)
+        return rows
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per-model feedback counts, posterior mean and mean latency."""
+        with self._lock:
+            snapshot = {}
+            for model, arm in self._arms.items():
+                a, b = self._posterior(model)
+                snapshot[model] = {
+                    "good": arm.good,
+                    "bad": arm.bad,
+                    "preference_rate": a / (a + b),
+                    "latency": self._latency(model),
+                }
+            return snapshot
+
+    def _posterior(self, model: str) -> Tuple[float, float]:
+        arm = self._arms.get(model)
+        if arm is None:
+            return self.prior
+        return self.prior[0] + max(arm.good, 0), self.prior[1] + max(arm.bad, 0)
+
+    def _latency(self, model: str) -> float:
+        arm = self._arms.get(model)
+        if arm is None or arm.latency_count <= 0:
+            return 0.0
+        return arm.latency_sum / arm.latency_count
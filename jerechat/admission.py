@@ -0,0 +1,145 @@
+"""Admission control and load shedding for model inference.
+
+At most ``max_concurrent`` generations run at once. Up to ``max_queue`` more
+may wait for a slot, each until its own deadline. Anything beyond that is
+rejected immediately with OverloadedError, so a traffic spike produces fast
+explicit "busy" responses instead of every session slowing down together.
+
+With fair queuing on, waiting requests are grouped by client (the invitation
+code) and freed slots are handed out round-robin across clients, so one
+heavy user cannot starve everyone else.
+
+Exported metrics (see jerechat.instrumentation):
+    admission_active, admission_queue_depth          gauges
+    admission_admitted_total, admission_rejected_total{reason}   counters
+    admission_wait                                   histogram (seconds)
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+from jerechat import instrumentation
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot be admitted in time."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Inference is overloaded ({reason})")
+        self.reason = reason
+
+
+class _Ticket:
+    __slots__ = ("client_id", "granted")
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.granted = False
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded, optionally fair, wait queue."""
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        max_queue: int = 16,
+        timeout: float = 10.0,
+        fair: bool = True,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.fair = fair
+        self._active = 0
+        self._waiting: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def admit(
+        self, client_id: str = "anonymous", timeout: Optional[float] = None
+    ) -> Iterator[None]:
+        """Hold a generation slot for the duration of the block."""
+        self.acquire(client_id, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, client_id: str = "anonymous", timeout: Optional[float] = None) -> None:
+        key = client_id if self.fair else ""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        start = time.monotonic()
+        with self._cond:
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self._admitted(start)
+                return
+            if self._queued >= self.max_queue:
+                self._reject("queue_full")
+
+            ticket = _Ticket(key)
+            self._waiting.setdefault(key, deque()).append(ticket)
+            self._queued += 1
+            self._publish()
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self._reject("deadline")
+                self._cond.wait(remaining)
+            self._admitted(start)
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._grant_next()
+            self._publish()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "clients_waiting": len(self._waiting),
+            }
+
+    def _grant_next(self) -> None:
+        while self._active < self.max_concurrent and self._waiting:
+            # Round-robin: serve the client at the head, then move it to the back
+            key, tickets = next(iter(self._waiting.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                self._waiting.move_to_end(key)
+            else:
+                del self._waiting[key]
+            self._queued -= 1
+            ticket.granted = True
+            self._active += 1
+
+    def _remove(self, ticket: _Ticket) -> None:
+        tickets = self._waiting.get(ticket.client_id)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            self._queued -= 1
+            if not tickets:
+                del self._waiting[ticket.client_id]
+        self._publish()
+
+    def _admitted(self, start: float) -> None:
+        instrumentation.increment("admission_admitted_total")
+        instrumentation.observe("admission_wait", time.monotonic() - start)
+        self._publish()
+
+    def _reject(self, reason: str) -> None:
+        instrumentation.increment("admission_rejected_total", labels={"reason": reason})
+        raise OverloadedError(reason)
+
+    def _publish(self) -> None:
+        instrumentation.set_gauge("admission_active", self._active)
+        instrumentation.set_gauge("admission_queue_depth", self._queued)
@@ -0,0 +1,286 @@
+"""Offline batch evaluation of checkpoints over a prompt file.
+
+Streams prompts from a text file (one per line) or a JSONL file (one
+``{"id": ..., "prompt": ...}`` object per line), normalizes them, and
+decodes them in batches through every checkpoint given. Batches run on a
+process pool. On Linux the checkpoints are loaded once in the parent and
+shared with the workers copy-on-write through ``fork``; elsewhere each
+worker loads its own copy. Only a bounded window of batches is in flight,
+so memory stays flat however long the prompt file is.
+
+Results are written as JSONL in prompt order, one line per prompt and
+checkpoint:
+
+    {"id": 0, "checkpoint": "rampion2", "version": "4000_checkpoint.tar@ac9b5f10",
+     "prompt": "Hello!", "normalized": "hello !", "response": "hi .",
+     "latency": 0.0008, "batch_latency": 0.0123, "batch_size": 16}
+
+``batch_latency`` is the wall time of the decode that produced the
+response, which covers the whole batch the prompt was in. ``latency`` is
+the prompt's share of it: the batch time divided by the batch size. A
+checkpoint that fails to load aborts the run on every platform. Compare
+checkpoints, or a checkpoint against an earlier run, without the chat UI:
+
+    python -m jerechat.batch_eval prompts.txt --checkpoint old=2000_checkpoint.tar \\
+        --checkpoint new=4000_checkpoint.tar --workers 4 --output results.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from constants import MAX_LENGTH
+from jerechat.text import normalizeString
+
+# Loaded checkpoints of this worker process: name -> (searcher, voc)
+_models: Dict[str, Tuple[Any, Any]] = {}
+
+
+def parse_checkpoint(value: str) -> Tuple[str, str]:
+    """``name=path`` or a bare path, named after its file."""
+    name, sep, path = value.partition("=")
+    if not sep:
+        path = value
+        name = os.path.splitext(os.path.basename(value))[0]
+    return name, path
+
+
+def read_prompts(f: IO[str], jsonl: bool) -> Iterator[Tuple[Any, str]]:
+    """Yield ``(id, prompt)`` pairs; ids default to the prompt's position."""
+    position = itertools.count()
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        index = next(position)
+        if jsonl:
+            record = json.loads(line)
+            yield record.get("id", index), record["prompt"]
+        else:
+            yield index, line
+
+
+def batched(prompts: Iterator[Tuple[Any, str]], size: int) -> Iterator[List[Tuple]]:
+    """Group prompts into lists of ``(id, prompt, normalized)``."""
+    while True:
+        batch = [
+            (prompt_id, prompt, normalizeString(prompt))
+            for prompt_id, prompt in itertools.islice(prompts, size)
+        ]
+        if not batch:
+            return
+        yield batch
+
+
+def _init_worker(
+    checkpoints: Dict[str, str],
+    threads: int,
+    load_options: Dict[str, Any],
+    preloaded: Optional[Dict[str, Tuple[Any, Any]]],
+) -> None:
+    from jerechat import rampion2_model
+    from jerechat.worker_pool import configure_worker
+
+    configure_worker(None, threads)
+    _models.update(
+        preloaded
+        or {
+            name: rampion2_model.load_model(path, **load_options)
+            for name, path in checkpoints.items()
+        }
+    )
+
+
+def _evaluate(
+    name: str, sentences: List[str], max_length: int
+) -> Tuple[List[str], float]:
+    """Decode one batch with one checkpoint; returns responses and seconds."""
+    from jerechat import rampion2_model
+
+    searcher, voc = _models[name]
+    if searcher is None or voc is None:
+        raise RuntimeError(f"Could not load checkpoints: {name}")
+    start = time.perf_counter()
+    if len(sentences) == 1:
+        responses = [
+            rampion2_model.generate_response(searcher, voc, sentences[0], max_length)
+        ]
+    else:
+        responses = rampion2_model.generate_responses(
+            searcher, voc, sentences, max_length
+        )
+    return responses, time.perf_counter() - start
+
+
+def evaluate(
+    prompts: Iterator[Tuple[Any, str]],
+    checkpoints: Dict[str, str],
+    batch_size: int = 16,
+    workers: int = 1,
+    threads: int = 1,
+    max_length: int = MAX_LENGTH,
+    load_options: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Decode ``prompts`` with every checkpoint; yields one record per pair.
+
+    Records come out in prompt order, each batch's checkpoints in the order
+    given. At most ``2 * workers`` batches per checkpoint are in flight.
+    """
+    from jerechat import rampion2_model
+    from jerechat.model_cache import checkpoint_version
+
+    load_options = load_options or {}
+    versions = {name: checkpoint_version(path) for name, path in checkpoints.items()}
+    ctx = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    preloaded = None
+    if ctx.get_start_method() == "fork":
+        # Loaded once here; workers share the weights copy-on-write
+        preloaded = {
+            name: rampion2_model.load_model(path, **load_options)
+            for name, path in checkpoints.items()
+        }
+        failed = [name for name, (model, _) in preloaded.items() if model is None]
+        if failed:
+            raise RuntimeError(f"Could not load checkpoints: {', '.join(failed)}")
+
+    window: deque = deque()
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(checkpoints, threads, load_options, preloaded),
+    ) as pool:
+
+        def drain(limit: int) -> Iterator[Dict[str, Any]]:
+            while len(window) > limit:
+                batch, futures = window.popleft()
+                for name, future in futures:
+                    responses, seconds = future.result()
+                    for (prompt_id, prompt, normalized), response in zip(
+                        batch, responses
+                    ):
+                        yield {
+                            "id": prompt_id,
+                            "checkpoint": name,
+                            "version": versions[name],
+                            "prompt": prompt,
+                            "normalized": normalized,
+                            "response": response,
+                            "latency": seconds / len(batch),
+                            "batch_latency": seconds,
+                            "batch_size": len(batch),
+                        }
+
+        for batch in batched(prompts, batch_size):
+            sentences = [normalized for _, _, normalized in batch]
+            futures = [
+                (name, pool.submit(_evaluate, name, sentences, max_length))
+                for name in checkpoints
+            ]
+            window.append((batch, futures))
+            yield from drain(2 * workers)
+        yield from drain(0)
+
+
+def summarize(latencies: Dict[str, List[float]], seconds: float) -> List[str]:
+    lines = []
+    for name, values in latencies.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        lines.append(
+            f"{name}: {len(values)} prompts ({len(values) / seconds:,.0f}/s), "
+            f"latency per prompt p50 {statistics.median(ordered) * 1000:.2f} ms, "
+            f"p95 {p95 * 1000:.2f} ms (batch time / batch size)"
+        )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Batch-evaluate checkpoints")
+    parser.add_argument(
+        "prompts", help="Prompt file, one per line, or JSONL; - for stdin"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="append",
+        required=True,
+        help="name=path or path; repeat to compare checkpoints",
+    )
+    parser.add_argument("--output", default="-", help="JSONL file; - for stdout")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--threads", type=int, default=1, help="Torch threads per worker"
+    )
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--shortlist-size", type=int, default=None)
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Read prompts as JSONL (default for .jsonl files)",
+    )
+    args = parser.parse_args(argv)
+
+    named = [parse_checkpoint(value) for value in args.checkpoint]
+    checkpoints = dict(named)
+    if len(checkpoints) < len(named):
+        names = [name for name, _ in named]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        raise SystemExit(f"Duplicate checkpoint name: {', '.join(duplicates)}")
+    missing = [path for path in checkpoints.values() if not os.path.exists(path)]
+    if missing:
+        raise SystemExit(f"Checkpoint not found: {', '.join(missing)}")
+    load_options = {}
+    if args.shortlist_size:
+        load_options["shortlist_size"] = args.shortlist_size
+
+    jsonl = args.jsonl or args.prompts.endswith(".jsonl")
+    if args.prompts == "-":
+        source = sys.stdin
+    else:
+        source = open(args.prompts, encoding="utf-8")
+    if args.output == "-":
+        sink = sys.stdout
+    else:
+        sink = open(args.output, "w", encoding="utf-8")
+    latencies: Dict[str, List[float]] = {name: [] for name in checkpoints}
+    start = time.perf_counter()
+    try:
+        for record in evaluate(
+            read_prompts(source, jsonl),
+            checkpoints,
+            args.batch_size,
+            args.workers,
+            args.threads,
+            args.max_length,
+            load_options,
+        ):
+            sink.write(json.dumps(record) + "\n")
+            latencies[record["checkpoint"]].append(record["latency"])
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    seconds = time.perf_counter() - start
+    for line in summarize(latencies, seconds):
+        print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
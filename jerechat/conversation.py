@@ -0,0 +1,74 @@
+"""Per-session conversation context for multi-turn decoding.
+
+A ConversationContext keeps the encoder outputs of a session's most recent
+turns for one checkpoint. Each new turn is encoded on its own and the decoder
+attends over the stored turns plus the new one, so context carries over
+without re-encoding the whole history. Both the number of turns and the
+bytes held are capped; the oldest turns are dropped first.
+
+Encoder outputs only make sense to the weights that produced them, so a
+context remembers its checkpoint version. Turns from another version (for
+example after a hot reload) are dropped rather than mixed in.
+"""
+
+import itertools
+import threading
+from collections import deque
+from typing import Any, Deque, Optional, Tuple
+
+_turn_ids = itertools.count(1)
+
+
+class ConversationContext:
+    """Rolling window of encoder outputs for the last ``max_turns`` turns.
+
+    ``max_turns`` counts the turn being answered, so at most
+    ``max_turns - 1`` earlier turns are kept in memory.
+    """
+
+    def __init__(self, max_turns: int, max_bytes: int = 1 << 20):
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._turns: Deque[Tuple[int, Any]] = deque()
+        # Checkpoint version of the encoder that produced the stored turns
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def append(self, encoder_outputs: Any, version: Optional[str] = None) -> None:
+        """Add one turn's encoder outputs, evicting the oldest as needed.
+
+        Stored turns from a different checkpoint ``version`` are dropped.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                self._turns.clear()
+                self.version = version
+            self._turns.append((next(_turn_ids), encoder_outputs))
+            while len(self._turns) > max(self.max_turns - 1, 0):
+                self._turns.popleft()
+            while self._turns and self._nbytes() > self.max_bytes:
+                self._turns.popleft()
+
+    def snapshot(self) -> Tuple[Any, ...]:
+        """Encoder outputs of the stored turns, oldest first."""
+        with self._lock:
+            return tuple(outputs for _, outputs in self._turns)
+
+    def fingerprint(self) -> Tuple[int, ...]:
+        """Identifies the stored turns; equal only for identical contexts."""
+        with self._lock:
+            return tuple(turn_id for turn_id, _ in self._turns)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return self._nbytes()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._turns.clear()
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def _nbytes(self) -> int:
+        return sum(t.numel() * t.element_size() for _, t in self._turns)
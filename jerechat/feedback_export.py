@@ -0,0 +1,314 @@
+"""Streaming export of the feedback tables to partitioned files.
+
+Rows are read with keyset pagination on ``id`` (database.iter_feedback_rows),
+so memory is bounded by one page however large the table is. Each page is
+appended to the current part file, and a new part starts every
+``rows_per_file`` rows:
+
+    exports/feedback/part-000000000001-000000100000.parquet
+    exports/feedback/part-000000100001-000000153112.parquet
+    exports/original_feedback/part-000000000001-000000004127.parquet
+
+Parts are Parquet (one row group per page) or Arrow IPC when pyarrow is
+installed, and CSV otherwise. A page that does not fit the current part's
+columns or types starts a new part, so no column is dropped. JSON columns
+such as ``chat_history`` are written as JSON text. A part is written under a temporary name and renamed
+once complete. Only then does the watermark file (``{table: last exported
+id}``) advance, so an interrupted export resumes from the last complete part.
+Run from the repository root, with the Supabase credentials from
+``.streamlit/secrets.toml``:
+
+    python -m jerechat.feedback_export --output-dir exports --watermark exports/watermark.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+EXPORT_TABLES = ("feedback", "original_feedback")
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "csv": "csv"}
+# PostgREST returns a whole-number float as an int; these are always float64
+FLOAT_COLUMNS = ("weight", "response_time")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def default_format() -> str:
+    return "parquet" if _pyarrow() is not None else "csv"
+
+
+def _flatten(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: json.dumps(value) if isinstance(value, (dict, list)) else value
+        for key, value in row.items()
+    }
+
+
+class _CsvPart:
+    """CSV part; its header is every column of the first page."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer: Optional[csv.DictWriter] = None
+
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        """Append a page; returns False if it has columns the header lacks."""
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, columns)
+            self._writer.writeheader()
+        elif not set(columns) <= set(self._writer.fieldnames):
+            # A column first seen in this page; new part with a wider header
+            return False
+        self._writer.writerows(rows)
+        return True
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _page_table(rows: List[Dict[str, Any]]):
+    """A page as an Arrow table, with its types inferred from its own values."""
+    pa = _pyarrow()
+    table = pa.Table.from_pylist(rows)
+    for i, field in enumerate(table.schema):
+        if field.name in FLOAT_COLUMNS and not pa.types.is_floating(field.type):
+            table = table.set_column(
+                i, field.with_type(pa.float64()), table.column(i).cast(pa.float64())
+            )
+    return table
+
+
+def _conform(table, schema):
+    """``table`` in ``schema`` if that loses nothing, else None.
+
+    Missing columns become nulls, all-null columns take the schema's type and
+    integers widen to floats. Anything else (a new column, a float into an
+    integer column, a string into a null column) does not fit.
+    """
+    pa = _pyarrow()
+    if not set(table.schema.names) <= set(schema.names):
+        return None
+    columns = []
+    for field in schema:
+        if field.name not in table.schema.names:
+            columns.append(pa.nulls(len(table), field.type))
+            continue
+        column = table.column(field.name)
+        if column.type != field.type:
+            widens = pa.types.is_integer(column.type) and pa.types.is_floating(
+                field.type
+            )
+            if not (widens or column.null_count == len(column)):
+                return None
+            try:
+                column = column.cast(field.type)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                return None
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class _ArrowPart:
+    """Parquet or Arrow IPC part; its schema comes from the first page."""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self._writer = None
+        self._schema = None
+
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        """Append a page; returns False if it does not fit this part's schema."""
+        pa = _pyarrow()
+        table = _page_table(rows)
+        if self._schema is not None and table.schema != self._schema:
+            table = _conform(table, self._schema)
+            if table is None:
+                return False
+        if self._writer is None:
+            self._schema = table.schema
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+        self._writer.write_table(table)
+        return True
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def export_table(
+    table: str,
+    output_dir: str,
+    fmt: str,
+    rows: Iterable[Dict[str, Any]],
+    page_size: int = 1000,
+    rows_per_file: int = 100_000,
+    on_part: Optional[Callable[[str, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Stream ``rows`` (in id order) into part files under ``output_dir/table``.
+
+    Calls ``on_part(path, last_id)`` after each part is complete. Returns
+    the rows and parts written and the last exported id.
+    """
+    directory = os.path.join(output_dir, table)
+    os.makedirs(directory, exist_ok=True)
+    stats: Dict[str, Any] = {"rows": 0, "parts": [], "last_id": None}
+    part = None
+    part_path = ""
+    part_rows = 0
+    first_id = last_id = 0
+
+    def close_part() -> None:
+        nonlocal part, part_rows
+        part.close()
+        path = os.path.join(
+            directory, f"part-{first_id:012d}-{last_id:012d}.{EXTENSIONS[fmt]}"
+        )
+        os.replace(part_path, path)
+        stats["parts"].append(path)
+        stats["last_id"] = last_id
+        part = None
+        part_rows = 0
+        if on_part is not None:
+            on_part(path, last_id)
+
+    def write(page: List[Dict[str, Any]]) -> None:
+        nonlocal part, part_path, part_rows, first_id, last_id
+        if part is None:
+            first_id = page[0]["id"]
+            part_path = os.path.join(directory, f".part-{first_id:012d}.tmp")
+            part = _CsvPart(part_path) if fmt == "csv" else _ArrowPart(part_path, fmt)
+        if not part.write(page):
+            close_part()
+            write(page)
+            return
+        last_id = page[-1]["id"]
+        part_rows += len(page)
+        stats["rows"] += len(page)
+        if part_rows >= rows_per_file:
+            close_part()
+
+    page: List[Dict[str, Any]] = []
+    for row in rows:
+        page.append(_flatten(row))
+        # Never let a page run past the part boundary
+        if len(page) == min(page_size, rows_per_file - part_rows):
+            write(page)
+            page = []
+    if page:
+        write(page)
+    if part is not None:
+        close_part()
+    return stats
+
+
+def load_watermark(path: Optional[str]) -> Dict[str, int]:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_watermark(path: str, watermark: Dict[str, int]) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(watermark, f)
+    os.replace(temporary, path)
+
+
+def export(
+    output_dir: str,
+    tables: Sequence[str] = EXPORT_TABLES,
+    fmt: Optional[str] = None,
+    watermark_path: Optional[str] = None,
+    page_size: int = 1000,
+    rows_per_file: int = 100_000,
+) -> Dict[str, Dict[str, Any]]:
+    """Export each table's rows newer than the watermark; returns per-table stats."""
+    from database import iter_feedback_rows
+
+    fmt = fmt or default_format()
+    if fmt != "csv" and _pyarrow() is None:
+        raise RuntimeError(f"Exporting {fmt} needs pyarrow; use --format csv")
+    watermark = load_watermark(watermark_path)
+    results = {}
+    for table in tables:
+
+        def advance(path: str, last_id: int, table: str = table) -> None:
+            watermark[table] = last_id
+            if watermark_path:
+                save_watermark(watermark_path, watermark)
+
+        start = time.perf_counter()
+        stats = export_table(
+            table,
+            output_dir,
+            fmt,
+            iter_feedback_rows("*", watermark.get(table, 0), page_size, table),
+            page_size,
+            rows_per_file,
+            advance,
+        )
+        stats["seconds"] = time.perf_counter() - start
+        stats["last_id"] = watermark.get(table)
+        results[table] = stats
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export feedback tables to files")
+    parser.add_argument("--output-dir", default="exports")
+    parser.add_argument("--tables", nargs="+", default=list(EXPORT_TABLES))
+    parser.add_argument(
+        "--format",
+        choices=sorted(EXTENSIONS),
+        default=None,
+        help="Default: parquet when pyarrow is installed, else csv",
+    )
+    parser.add_argument(
+        "--watermark",
+        default=None,
+        help="JSON file of last exported ids, for resuming",
+    )
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--rows-per-file", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    try:
+        results = export(
+            args.output_dir,
+            args.tables,
+            args.format,
+            args.watermark,
+            args.page_size,
+            args.rows_per_file,
+        )
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    for table, stats in results.items():
+        rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(
+            f"{table}: {stats['rows']} rows in {len(stats['parts'])} parts "
+            f"({rate:,.0f} rows/s), last id {stats['last_id']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Thin client for the JereChat inference server.
+
+Connections are pooled and reused across requests, so a Streamlit rerun only
+pays for one round trip. This module deliberately avoids importing torch.
+"""
+
+import json
+import queue
+import socket
+from typing import Any, Dict, Optional, Tuple
+
+from constants import MAX_LENGTH
+
+
+class InferenceError(Exception):
+    """Raised when the inference server cannot produce a response."""
+
+
+class _StaleConnection(ConnectionError):
+    """The connection was closed before the request got any reply."""
+
+
+class _Connection:
+    def __init__(self, address: str, timeout: float):
+        if address.startswith("unix:"):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address[len("unix:") :])
+        else:
+            host, _, port = address.rpartition(":")
+            self.sock = socket.create_connection(
+                (host or "127.0.0.1", int(port)), timeout=timeout
+            )
+        self.reader = self.sock.makefile("rb")
+
+    def call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            self.sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        except socket.timeout:
+            raise
+        except OSError as e:
+            raise _StaleConnection(f"Inference server closed the connection: {e}")
+        try:
+            line = self.reader.readline()
+        except ConnectionResetError as e:
+            raise _StaleConnection(f"Inference server reset the connection: {e}")
+        if not line:
+            raise _StaleConnection("Inference server closed the connection")
+        return json.loads(line)
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class InferenceClient:
+    """Pooled client speaking the newline-delimited JSON protocol."""
+
+    def __init__(self, address: str, pool_size: int = 4, timeout: float = 30.0):
+        self.address = address
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[_Connection]" = queue.LifoQueue(pool_size)
+
+    def _acquire(self, fresh: bool = False) -> Tuple[_Connection, bool]:
+        """A connection, and whether it came from the pool."""
+        if not fresh:
+            try:
+                return self._pool.get_nowait(), True
+            except queue.Empty:
+                pass
+        return _Connection(self.address, self.timeout), False
+
+    def _release(self, conn: _Connection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one request, retrying once on a stale pooled connection.
+
+        A pooled connection is stale when the server closed it while idle:
+        the send fails, or the read ends before any reply. The request is
+        then sent once more on a fresh connection. Timeouts and failures on
+        a fresh connection are never retried, since the server may already
+        be running the request.
+        """
+        fresh = False
+        while True:
+            try:
+                conn, pooled = self._acquire(fresh)
+            except OSError as e:
+                raise InferenceError(f"Cannot reach inference server: {e}") from e
+            try:
+                reply = conn.call(request)
+            except _StaleConnection as e:
+                conn.close()
+                if pooled:
+                    fresh = True
+                    continue
+                raise InferenceError(f"Inference server request failed: {e}") from e
+            except (OSError, ValueError) as e:
+                conn.close()
+                raise InferenceError(f"Inference server request failed: {e}") from e
+            self._release(conn)
+            return reply
+
+    def generate(
+        self, model: str, prompt: str, max_length: int = MAX_LENGTH
+    ) -> str:
+        """Return the model's response text for a raw (unnormalized) prompt."""
+        return self.generate_with_version(model, prompt, max_length)[0]
+
+    def generate_with_version(
+        self, model: str, prompt: str, max_length: int = MAX_LENGTH
+    ) -> Tuple[str, Optional[str]]:
+        """Like generate, plus the checkpoint version that produced the text."""
+        reply = self.call(
+            {
+                "op": "generate",
+                "model": model,
+                "prompt": prompt,
+                "max_length": max_length,
+                "timeout": self.timeout,
+            }
+        )
+        if not reply.get("ok"):
+            raise InferenceError(reply.get("error", "Unknown inference error"))
+        return reply["response"], reply.get("version")
+
+    def health(self) -> Dict[str, Any]:
+        return self.call({"op": "health"})
+
+    def metrics(self) -> str:
+        """Return the server's metrics in Prometheus text format."""
+        return self.call({"op": "metrics"}).get("prometheus", "")
+
+    def reload(
+        self, model: Optional[str] = None, checkpoint: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return self.call({"op": "reload", "model": model, "checkpoint": checkpoint})
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
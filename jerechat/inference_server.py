@@ -0,0 +1,532 @@
+"""Standalone inference worker for JereChat.
+
+The server owns the loaded checkpoints and answers newline-delimited JSON
+requests over a Unix socket (``unix:/path/to.sock``) or local TCP
+(``127.0.0.1:8765``). Concurrent ``generate`` requests for the same model are
+collected into small batches and decoded together.
+
+Run it from the repository root:
+
+    python -m jerechat.inference_server --address unix:/tmp/jerechat.sock \\
+        --model rampion2=data/save/cb_model/corpus/2-2_500/2000_checkpoint.tar \\
+        --model 1.7pro=data/save/cb_model/corpus/2-2_500/4000_checkpoint.tar
+
+Request/response examples (one JSON object per line):
+
+    {"op": "generate", "model": "rampion2", "prompt": "Tell a joke"}
+    {"ok": true, "response": "...", "time": 0.012, "version": "2000_checkpoint.tar@1a2b3c4d"}
+
+    {"op": "health"}
+    {"ok": true, "status": "ready", "models": {"rampion2": {...}}}
+
+    {"op": "metrics"}
+    {"ok": true, "prometheus": "# TYPE jerechat_span_seconds histogram ..."}
+
+    {"op": "reload", "model": "rampion2", "checkpoint": "/new/path.tar"}
+    {"ok": true, "models": {...}}
+
+Each checkpoint is warmed up before it is reported ready: a few
+representative prompts are decoded at every batch size the worker will use
+(``--warmup-batch-sizes``, default powers of two up to ``--max-batch-size``).
+Health answers ``"warming"`` until every model is ready, then ``"ready"``,
+or ``"degraded"`` if a checkpoint failed to load; the warm-up time of each
+model is printed and exported as ``model_warmup_seconds``.
+
+Pass ``--workers N --threads-per-worker T`` to decode in a pool of pinned
+worker processes (see ``jerechat.worker_pool``) instead of in-process threads.
+
+Send SIGHUP to reload every model from its configured checkpoint and SIGTERM
+(or Ctrl+C) to stop accepting connections and drain queued requests.
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from constants import (
+    DEFAULT_CHECKPOINT_PATH,
+    MAX_LENGTH,
+    MODEL_17PRO,
+    MODEL_RAMPION2,
+    PRO17_CHECKPOINT_PATH,
+)
+from jerechat import instrumentation, rampion2_model
+from jerechat.model_cache import checkpoint_version
+from jerechat.warmup import warm_up_model
+from jerechat.worker_pool import InferencePool, configure_worker
+
+DEFAULT_ADDRESS = "unix:/tmp/jerechat.sock"
+DEFAULT_MODELS = {
+    MODEL_RAMPION2: DEFAULT_CHECKPOINT_PATH,
+    MODEL_17PRO: PRO17_CHECKPOINT_PATH,
+}
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """Split an address string into a socket family and a bind target."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:") :]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def default_warmup_batch_sizes(max_batch_size: int) -> List[int]:
+    """Powers of two up to (and including) ``max_batch_size``."""
+    sizes = []
+    size = 1
+    while size < max_batch_size:
+        sizes.append(size)
+        size *= 2
+    sizes.append(max_batch_size)
+    return sizes
+
+
+class _Pending:
+    """A generate request waiting for its batch to be decoded."""
+
+    def __init__(self, prompt: str, max_length: int):
+        self.prompt = prompt
+        self.max_length = max_length
+        self.done = threading.Event()
+        self.response: Optional[str] = None
+        self.version: Optional[str] = None
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+
+class ModelWorker:
+    """Owns one loaded checkpoint and decodes queued prompts in batches."""
+
+    def __init__(
+        self,
+        model_id: str,
+        checkpoint_path: str,
+        max_batch_size: int = 8,
+        batch_timeout: float = 0.005,
+        warmup_batch_sizes: Sequence[int] = (),
+        load_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.model_id = model_id
+        self.checkpoint_path = checkpoint_path
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self.warmup_batch_sizes = tuple(warmup_batch_sizes)
+        self.load_options = load_options or {}
+        self.searcher = None
+        self.voc = None
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.requests_served = 0
+        self.batches_served = 0
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=f"worker-{model_id}", daemon=True
+        )
+
+    def load(self, checkpoint_path: Optional[str] = None) -> bool:
+        """Load and warm up a checkpoint, then swap it in."""
+        path = checkpoint_path or self.checkpoint_path
+        version = checkpoint_version(path)
+        searcher, voc = rampion2_model.load_model(path, **self.load_options)
+        if searcher is None or voc is None:
+            return False
+        warmup_seconds = None
+        if self.warmup_batch_sizes:
+            warmup_seconds = warm_up_model(
+                self.model_id, searcher, voc, self.warmup_batch_sizes
+            )
+        with self._lock:
+            self.searcher, self.voc = searcher, voc
+            self.checkpoint_path = path
+            self.version = version
+            self.loaded_at = time.time()
+            self.warmup_seconds = warmup_seconds
+        return True
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Finish everything already queued, then stop the batching thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, prompt: str, max_length: int = MAX_LENGTH) -> _Pending:
+        pending = _Pending(prompt, max_length)
+        self._queue.put(pending)
+        return pending
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "checkpoint": self.checkpoint_path,
+            "version": self.version,
+            "loaded": self.searcher is not None,
+            "ready": self.searcher is not None,
+            "loaded_at": self.loaded_at,
+            "warmup_seconds": self.warmup_seconds,
+            "queue_depth": self._queue.qsize(),
+            "requests_served": self.requests_served,
+            "batches_served": self.batches_served,
+        }
+
+    def _next_batch(self, first: _Pending) -> Tuple[List[_Pending], bool]:
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_timeout
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stopping = self._next_batch(first)
+            self._decode(batch)
+        # Drain anything that raced in behind the stop marker
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._decode([item])
+
+    def _decode(self, batch: List[_Pending]) -> None:
+        with self._lock:
+            searcher, voc, version = self.searcher, self.voc, self.version
+        if searcher is None or voc is None:
+            for pending in batch:
+                pending.error = f"Model {self.model_id} is not loaded"
+                pending.done.set()
+            return
+
+        # Requests with different max lengths cannot share one decode loop
+        by_length: Dict[int, List[_Pending]] = {}
+        for pending in batch:
+            by_length.setdefault(pending.max_length, []).append(pending)
+
+        for max_length, group in by_length.items():
+            sentences = [
+                rampion2_model.normalizeString(pending.prompt) for pending in group
+            ]
+            responses = rampion2_model.generate_responses(
+                searcher, voc, sentences, max_length
+            )
+            for pending, response in zip(group, responses):
+                pending.response = response
+                pending.version = version
+                pending.elapsed = time.perf_counter() - pending.started
+                pending.done.set()
+
+        self.requests_served += len(batch)
+        self.batches_served += 1
+
+
+class InferenceServer:
+    """Routes protocol requests to one ModelWorker per configured model."""
+
+    def __init__(
+        self,
+        models: Dict[str, str],
+        max_batch_size: int = 8,
+        batch_timeout: float = 0.005,
+        pool: Optional[InferencePool] = None,
+        warmup_batch_sizes: Sequence[int] = (),
+        load_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.pool = pool
+        self.workers = {
+            model_id: ModelWorker(
+                model_id,
+                path,
+                max_batch_size,
+                batch_timeout,
+                warmup_batch_sizes,
+                load_options,
+            )
+            for model_id, path in models.items()
+        }
+        self.status = "starting"
+        self._server: Optional[socketserver.BaseServer] = None
+
+    def load_all(self) -> None:
+        """Load and warm every model.
+
+        Status turns "ready" once all are warm, or "degraded" if any model
+        failed to load (the others still serve).
+        """
+        self.status = "warming"
+        if self.pool is not None:
+            self.pool.wait_ready()
+            missing = set(self.workers) - self.pool.loaded_models()
+            for model_id in sorted(missing):
+                print(f"Pool workers failed to load {model_id}")
+            self.status = "degraded" if missing else "ready"
+            return
+        failed = []
+        for worker in self.workers.values():
+            if not worker.load():
+                print(f"Failed to load {worker.model_id} from {worker.checkpoint_path}")
+                failed.append(worker.model_id)
+            worker.start()
+        self.status = "degraded" if failed else "ready"
+
+    def reload(
+        self, model_id: Optional[str] = None, checkpoint_path: Optional[str] = None
+    ) -> bool:
+        """Reload one model (or all). In-flight batches finish on the old weights."""
+        targets = [model_id] if model_id else list(self.workers)
+        if self.pool is not None:
+            for target in targets:
+                path = checkpoint_path or self.workers[target].checkpoint_path
+                self.workers[target].checkpoint_path = path
+                self.pool.reload(target, path)
+            return True
+        ok = True
+        for target in targets:
+            if target not in self.workers:
+                return False
+            ok = self.workers[target].load(checkpoint_path) and ok
+        return ok
+
+    def current_status(self) -> str:
+        """The startup status, re-checked against what is loaded right now."""
+        if self.status not in ("ready", "degraded"):
+            return self.status
+        if self.pool is not None:
+            loaded = self.pool.loaded_models()
+            serving = self.pool.alive_workers() > 0
+        else:
+            loaded = {m for m, w in self.workers.items() if w.searcher is not None}
+            serving = True
+        return "ready" if serving and loaded >= set(self.workers) else "degraded"
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "generate":
+            worker = self.workers.get(request.get("model"))
+            if worker is None:
+                return {"ok": False, "error": f"Unknown model: {request.get('model')}"}
+            if self.pool is not None:
+                return self._generate_pooled(request)
+            pending = worker.submit(
+                str(request.get("prompt", "")),
+                int(request.get("max_length", MAX_LENGTH)),
+            )
+            if not pending.done.wait(float(request.get("timeout", 30.0))):
+                return {"ok": False, "error": "Timed out waiting for the model"}
+            if pending.error:
+                return {"ok": False, "error": pending.error}
+            return {
+                "ok": True,
+                "response": pending.response,
+                "time": pending.elapsed,
+                "version": pending.version,
+            }
+        if op == "health":
+            return {
+                "ok": True,
+                "status": self.current_status(),
+                "models": self.models_status(),
+            }
+        if op == "metrics":
+            return {"ok": True, "prometheus": instrumentation.export_prometheus()}
+        if op == "reload":
+            ok = self.reload(request.get("model"), request.get("checkpoint"))
+            return {"ok": ok, "models": self.models_status()}
+        return {"ok": False, "error": f"Unknown op: {op}"}
+
+    def _generate_pooled(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        future = self.pool.submit(
+            request["model"],
+            str(request.get("prompt", "")),
+            int(request.get("max_length", MAX_LENGTH)),
+        )
+        try:
+            response = future.result(float(request.get("timeout", 30.0)))
+        except Exception as e:
+            return {"ok": False, "error": str(e) or "Timed out waiting for the model"}
+        # Workers flip to a reloaded checkpoint one by one, so this is the
+        # configured version rather than the one each worker decoded with
+        return {
+            "ok": True,
+            "response": response,
+            "time": time.perf_counter() - start,
+            "version": checkpoint_version(self.workers[request["model"]].checkpoint_path),
+        }
+
+    def models_status(self) -> Dict[str, Dict[str, Any]]:
+        status = {model_id: w.status() for model_id, w in self.workers.items()}
+        if self.pool is not None:
+            ready = self.pool.is_ready()
+            # Only models every live worker reported loaded can be served
+            loaded = self.pool.loaded_models()
+            for model_id in status:
+                status[model_id]["loaded"] = model_id in loaded
+                status[model_id]["ready"] = ready and model_id in loaded
+                status[model_id]["warmup_seconds"] = self.pool.warmup_seconds.get(
+                    model_id
+                )
+                status[model_id]["pool_load"] = self.pool.load()
+                status[model_id]["pool_workers_alive"] = self.pool.alive_workers()
+        return status
+
+    def serve_forever(self, address: str) -> None:
+        family, target = parse_address(address)
+        handler = _make_handler(self)
+        if family == socket.AF_UNIX:
+            if os.path.exists(target):
+                os.unlink(target)
+            self._server = _ThreadingUnixServer(target, handler)
+        else:
+            self._server = _ThreadingTCPServer(target, handler)
+        print(f"JereChat inference server listening on {address}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(target):
+                os.unlink(target)
+
+    def shutdown(self) -> None:
+        """Stop accepting connections and drain every worker's queue."""
+        self.status = "draining"
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+        if self.pool is not None:
+            self.pool.close()
+        else:
+            for worker in self.workers.values():
+                worker.stop()
+        self.status = "stopped"
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _make_handler(server: InferenceServer):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # Connections are persistent so clients can pool them
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    reply = server.handle(json.loads(line))
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+    return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="JereChat inference server")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    parser.add_argument(
+        "--model",
+        action="append",
+        default=[],
+        metavar="ID=CHECKPOINT",
+        help="Model to serve; repeat for several. Defaults to both bundled checkpoints.",
+    )
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--batch-timeout-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Decode in this many pinned worker processes (0 = in-process threads)",
+    )
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument(
+        "--warmup-batch-sizes",
+        default=None,
+        metavar="N,N,...",
+        help="Batch sizes to warm up each model at (default: powers of two up to --max-batch-size)",
+    )
+    parser.add_argument(
+        "--no-warmup", action="store_true", help="Report ready as soon as models load"
+    )
+    parser.add_argument(
+        "--shortlist-size",
+        type=int,
+        default=None,
+        help="Project onto the N most frequent words (see benchmarks.bench_shortlist)",
+    )
+    parser.add_argument("--shortlist-threshold", type=float, default=0.5)
+    args = parser.parse_args(argv)
+    load_options = {
+        "shortlist_size": args.shortlist_size,
+        "shortlist_threshold": args.shortlist_threshold,
+    }
+
+    models = dict(spec.split("=", 1) for spec in args.model) or DEFAULT_MODELS
+    if args.no_warmup:
+        warmup_batch_sizes: List[int] = []
+    elif args.warmup_batch_sizes:
+        warmup_batch_sizes = [int(n) for n in args.warmup_batch_sizes.split(",")]
+    else:
+        warmup_batch_sizes = default_warmup_batch_sizes(args.max_batch_size)
+
+    pool = None
+    if args.workers > 0:
+        pool = InferencePool(
+            models,
+            args.workers,
+            args.threads_per_worker,
+            warmup_batch_sizes=warmup_batch_sizes,
+            load_options=load_options,
+        )
+    else:
+        configure_worker(None, args.threads_per_worker)
+    server = InferenceServer(
+        models,
+        args.max_batch_size,
+        args.batch_timeout_ms / 1000.0,
+        pool,
+        warmup_batch_sizes,
+        load_options,
+    )
+    # Warm up in the background so health checks see "warming" meanwhile
+    threading.Thread(target=server.load_all, name="warmup", daemon=True).start()
+
+    signal.signal(signal.SIGHUP, lambda *_: server.reload())
+    signal.signal(signal.SIGTERM, lambda *_: server.shutdown())
+    try:
+        server.serve_forever(args.address)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
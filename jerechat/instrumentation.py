@@ -0,0 +1,284 @@
+"""Lightweight in-process instrumentation for JereChat.
+
+Spans time a block with the monotonic clock and can be nested, either as a
+context manager or a decorator:
+
+    with instrumentation.span("encoder"):
+        ...
+
+    @instrumentation.traced("feedback_insert")
+    def save(...):
+        ...
+
+Finished spans are aggregated into per-name histograms. Counters and gauges
+sit alongside them for things that are counted rather than timed. Everything
+can be exported as Prometheus text, and spans can also be appended to a JSON
+lines file.
+
+Tracing is off by default, and a disabled span is a shared no-op object.
+Turn it on with the ``JERECHAT_TRACING=1`` environment variable or
+``enable()``. ``capture()`` turns it on for the current thread only and
+returns the spans it recorded, which is how the debug view gets a
+per-request breakdown.
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_enabled = os.environ.get("JERECHAT_TRACING", "").lower() in ("1", "true", "yes")
+_jsonl_path: Optional[str] = os.environ.get("JERECHAT_TRACE_JSONL") or None
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing the q-th quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+_histograms: Dict[str, Histogram] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+
+def enable(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled or getattr(_local, "captured", None) is not None
+
+
+def set_jsonl_sink(path: Optional[str]) -> None:
+    """Append every finished span to ``path`` as a JSON line (None to stop)."""
+    global _jsonl_path
+    _jsonl_path = path
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "depth")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.duration = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        _record(self)
+        return False
+
+
+def span(name: str):
+    """Time a block; returns a no-op context manager when tracing is off."""
+    if _enabled or getattr(_local, "captured", None) is not None:
+        return Span(name)
+    return _NOOP
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of ``span``; defaults to the function's name."""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _record(finished: Span) -> None:
+    with _lock:
+        histogram = _histograms.get(finished.name)
+        if histogram is None:
+            histogram = _histograms[finished.name] = Histogram()
+        histogram.observe(finished.duration)
+
+    captured = getattr(_local, "captured", None)
+    if captured is not None:
+        captured.append(
+            {
+                "name": finished.name,
+                "depth": finished.depth,
+                "start": finished.start,
+                "ms": finished.duration * 1000,
+            }
+        )
+
+    if _jsonl_path:
+        line = json.dumps(
+            {
+                "ts": time.time(),
+                "span": finished.name,
+                "depth": finished.depth,
+                "seconds": finished.duration,
+                "thread": threading.current_thread().name,
+            }
+        )
+        with _lock, open(_jsonl_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def capture() -> Iterator[List[Dict[str, Any]]]:
+    """Record spans finished in this thread, even when tracing is off.
+
+    Spans are appended in completion order, so children come before their
+    parent; sort by ``start`` to get them in call order, and use ``depth``
+    to see how deeply each one was nested.
+    """
+    previous = getattr(_local, "captured", None)
+    captured: List[Dict[str, Any]] = []
+    _local.captured = captured
+    try:
+        yield captured
+    finally:
+        _local.captured = previous
+        if previous is not None:
+            previous.extend(captured)
+
+
+def _labels_key(labels: Optional[Dict[str, str]]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((labels or {}).items()))
+
+
+def increment(name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+    """Add to a counter. Counters are recorded even when tracing is off."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+    with _lock:
+        _gauges[(name, _labels_key(labels))] = value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Add a duration to a histogram directly, even when tracing is off."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def get_counter(name: str, labels: Optional[Dict[str, str]] = None) -> float:
+    with _lock:
+        return _counters.get((name, _labels_key(labels)), 0.0)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Plain-dict view of every histogram, counter and gauge."""
+    with _lock:
+        return {
+            "spans": {
+                name: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for name, h in _histograms.items()
+            },
+            "counters": {_format_series(n, l): v for (n, l), v in _counters.items()},
+            "gauges": {_format_series(n, l): v for (n, l), v in _gauges.items()},
+        }
+
+
+def _format_series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{key}="{value}"' for key, value in labels)
+    return f"{name}{{{inner}}}"
+
+
+def export_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = ["# TYPE jerechat_span_seconds histogram"]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(
+                    f'jerechat_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'jerechat_span_seconds_bucket{{span="{name}",le="+Inf"}} {h.count}')
+            lines.append(f'jerechat_span_seconds_sum{{span="{name}"}} {h.sum}')
+            lines.append(f'jerechat_span_seconds_count{{span="{name}"}} {h.count}')
+        for kind, series in (("counter", _counters), ("gauge", _gauges)):
+            for name in sorted({n for n, _ in series}):
+                lines.append(f"# TYPE jerechat_{name} {kind}")
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f"jerechat_{_format_series(name, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,117 @@
+"""Invitation code lookup and attempt rate limiting.
+
+The configured codes are parsed once into a dict keyed by code number, with
+expiry dates already converted to ``datetime.date``. Checking a code or
+redrawing the sidebar is then a single dict lookup. The index is shared by
+every session in the process. It is rebuilt when the secrets are reloaded,
+which Streamlit does by replacing the parsed ``invitation_codes`` list, so an
+identity check on that list is enough to notice the change.
+
+AttemptLimiter caps how many codes one client may try per time window, so
+guessing 6-digit codes by brute force is slow and cheap to reject.
+"""
+
+import datetime
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Sequence, Tuple
+
+
+class Invitation(NamedTuple):
+    code_number: str
+    expiry_date: datetime.date
+    notes: str
+    info: Dict[str, Any]
+
+    def is_expired(self, today: Optional[datetime.date] = None) -> bool:
+        return (today or datetime.date.today()) > self.expiry_date
+
+    def days_remaining(self, today: Optional[datetime.date] = None) -> int:
+        return (self.expiry_date - (today or datetime.date.today())).days
+
+
+class InvitationIndex:
+    """Hash index over the configured codes, with expiry dates pre-parsed."""
+
+    def __init__(self, codes: Sequence[Dict[str, Any]]):
+        self._codes: Dict[str, Invitation] = {}
+        self.invalid = 0
+        for info in codes:
+            try:
+                expiry = datetime.datetime.strptime(
+                    info["code_expiry_date"], "%Y-%m-%d"
+                ).date()
+                code = str(info["code_number"])
+            except (KeyError, TypeError, ValueError):
+                # A malformed entry can never be redeemed
+                self.invalid += 1
+                continue
+            self._codes[code] = Invitation(
+                code, expiry, info.get("code_notes", ""), dict(info)
+            )
+
+    def get(self, code: str) -> Optional[Invitation]:
+        return self._codes.get(code)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+
+_index: Optional[Tuple[Any, InvitationIndex]] = None
+_index_lock = threading.Lock()
+
+
+def get_invitation_index(codes: Sequence[Dict[str, Any]]) -> InvitationIndex:
+    """Return the index for ``codes``, building it only when they change."""
+    global _index
+    cached = _index
+    if cached is not None and cached[0] is codes:
+        return cached[1]
+    with _index_lock:
+        if _index is None or _index[0] is not codes:
+            _index = (codes, InvitationIndex(codes))
+        return _index[1]
+
+
+class AttemptLimiter:
+    """Sliding-window limit on attempts per client.
+
+    At most ``max_clients`` clients are tracked; the least recently seen are
+    forgotten first, so the limiter's memory stays bounded.
+    """
+
+    def __init__(
+        self, max_attempts: int = 5, window: float = 60.0, max_clients: int = 10000
+    ):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_clients = max_clients
+        self._attempts: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def attempt(self, client_id: str) -> float:
+        """Record an attempt.
+
+        Returns 0 if it is allowed, otherwise the seconds until the client
+        may try again (the rejected attempt is not recorded).
+        """
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(client_id)
+            if attempts is None:
+                attempts = self._attempts[client_id] = deque()
+                while len(self._attempts) > self.max_clients:
+                    self._attempts.popitem(last=False)
+            else:
+                self._attempts.move_to_end(client_id)
+            while attempts and now - attempts[0] >= self.window:
+                attempts.popleft()
+            if len(attempts) >= self.max_attempts:
+                return self.window - (now - attempts[0])
+            attempts.append(now)
+            return 0.0
+
+    def reset(self, client_id: str) -> None:
+        with self._lock:
+            self._attempts.pop(client_id, None)
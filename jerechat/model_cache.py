@@ -0,0 +1,395 @@
+"""Model catalog and a memory-budgeted cache of loaded checkpoints.
+
+The catalog maps model ids to checkpoints and display names. It comes from
+the ``[models]`` table in the secrets or, by default, from the two bundled
+checkpoints. ModelCache loads a model the first time it is acquired (loading
+and warm-up happen in the loader, so a model only becomes resident once it
+is ready) and keeps loaded models in least-recently-used order. When the
+resident models exceed the byte budget, the least recently used ones are
+evicted. A model is pinned while a request holds it, so it is never evicted
+mid-decode. If every resident model is pinned the cache may run over budget
+until the pins are released.
+
+Each model id is a versioned slot. When set_catalog() points a resident
+model at a new checkpoint, the new version loads and warms up in the
+background while requests keep getting the old one. Once it is ready, new
+requests flip to it atomically. The old version drains: it is freed as
+soon as the last request pinning it finishes. A model whose checkpoint
+changes during its first load is reloaded as soon as that load finishes, and
+one removed meanwhile is freed after serving the requests that waited on it.
+Every acquired model carries its checkpoint_version(), so responses can be
+tagged with it.
+
+Exported metrics: ``model_cache_loads_total{model}``,
+``model_cache_evictions_total{model}``, ``model_cache_reloads_total{model}``,
+``model_cache_resident_bytes`` and ``model_cache_resident_models``.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from jerechat import instrumentation
+
+
+class ModelSpec(NamedTuple):
+    model_id: str
+    checkpoint: str
+    display_name: str
+
+
+class LoadedModel(NamedTuple):
+    searcher: Any
+    voc: Any
+    version: str
+
+
+def checkpoint_version(path: str) -> str:
+    """Name a checkpoint file's exact contents: its file name plus a short hash.
+
+    The hash covers the absolute path, size and modification time, so a
+    checkpoint replaced in place gets a new version without hashing
+    hundreds of megabytes.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return os.path.basename(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{os.path.basename(path)}@{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+
+
+def parse_catalog(config: Mapping[str, Mapping[str, Any]]) -> Dict[str, ModelSpec]:
+    """Build a catalog from ``{model_id: {"checkpoint": ..., "display_name": ...}}``."""
+    catalog = {}
+    for model_id, entry in config.items():
+        catalog[str(model_id)] = ModelSpec(
+            str(model_id),
+            str(entry["checkpoint"]),
+            str(entry.get("display_name", model_id)),
+        )
+    return catalog
+
+
+def model_nbytes(searcher: Any) -> int:
+    """Bytes held by a searcher's tensors, counting shared tensors once."""
+    tensors = list(searcher.parameters()) + list(searcher.buffers())
+    shortlist = getattr(searcher, "shortlist", None)
+    if shortlist is not None:
+        tensors += [shortlist.ids, shortlist.weight_t, shortlist.bias, shortlist.member]
+    seen = set()
+    total = 0
+    for tensor in tensors:
+        if tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def checkpoint_loader(
+    warmup_batch_sizes: Sequence[int] = (), **load_options: Any
+) -> Callable[[ModelSpec], Tuple[Any, Any]]:
+    """Loader for ModelCache: ``load_model`` plus an optional warm-up."""
+
+    def load(spec: ModelSpec) -> Tuple[Any, Any]:
+        from jerechat import rampion2_model
+        from jerechat.warmup import warm_up_model
+
+        searcher, voc = rampion2_model.load_model(spec.checkpoint, **load_options)
+        if searcher is not None and voc is not None and warmup_batch_sizes:
+            warm_up_model(spec.model_id, searcher, voc, warmup_batch_sizes)
+        return searcher, voc
+
+    return load
+
+
+class _Entry:
+    __slots__ = ("model", "spec", "nbytes", "pins", "load_seconds")
+
+    def __init__(self, model: LoadedModel, spec: ModelSpec, nbytes: int, load_seconds: float):
+        self.model = model
+        self.spec = spec
+        self.nbytes = nbytes
+        self.pins = 0
+        self.load_seconds = load_seconds
+
+
+class _Loading:
+    """A load in progress; the loader pins the entry for every waiter."""
+
+    __slots__ = ("done", "waiters", "entry")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.entry: Optional[_Entry] = None
+
+
+class ModelCache:
+    """Lazily loaded models, evicted least-recently-used past a byte budget."""
+
+    def __init__(
+        self,
+        catalog: Mapping[str, ModelSpec],
+        budget_bytes: int,
+        loader: Callable[[ModelSpec], Tuple[Any, Any]],
+    ):
+        self.catalog = dict(catalog)
+        self.budget_bytes = budget_bytes
+        self.loads = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.failures: Dict[str, int] = {}
+        self._loader = loader
+        self._resident: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._draining: List[_Entry] = []
+        self._loading: Dict[str, _Loading] = {}
+        self._reloading: Dict[str, ModelSpec] = {}
+        self._sizes: Dict[str, int] = {}
+        self._preload: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, model_id: str) -> Iterator[Optional[LoadedModel]]:
+        """Pin a model for the duration of the block, loading it if needed.
+
+        Yields a LoadedModel, or None if the checkpoint failed to load.
+        Raises KeyError for a model that is not in the catalog.
+        """
+        entry = self._pin(model_id)
+        try:
+            yield entry.model if entry is not None else None
+        finally:
+            if entry is not None:
+                with self._lock:
+                    entry.pins -= 1
+                    if not entry.pins and entry in self._draining:
+                        # Last request on a replaced version; free it
+                        self._draining.remove(entry)
+                    self._evict()
+
+    def set_catalog(self, catalog: Mapping[str, ModelSpec]) -> None:
+        """Switch to a new catalog, hot-reloading resident models that changed.
+
+        Changed models that are not resident just load the new checkpoint
+        on next use. Models removed from the catalog are retired.
+        """
+        with self._lock:
+            if catalog == self.catalog:
+                return
+            for model_id in list(self._resident):
+                if model_id not in catalog:
+                    self._retire(self._resident.pop(model_id))
+            self.catalog = dict(catalog)
+            changed = [
+                spec
+                for model_id, spec in self.catalog.items()
+                if model_id in self._resident
+                and self._resident[model_id].spec != spec
+                and self._reloading.get(model_id) != spec
+            ]
+            for spec in changed:
+                self._reloading[spec.model_id] = spec
+            self._evict()
+        for spec in changed:
+            self._start_reload(spec)
+
+    def reload(self, model_id: str) -> bool:
+        """Load the catalog's checkpoint for a model again and flip to it.
+
+        Blocks until the new version is serving; returns False if it failed
+        to load (the old version keeps serving).
+        """
+        spec = self.catalog[model_id]
+        with self._lock:
+            self._reloading[model_id] = spec
+        return self._reload(spec)
+
+    def is_resident(self, model_id: str) -> bool:
+        return model_id in self._resident
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            resident = sum(entry.nbytes for entry in self._resident.values())
+            return resident + sum(entry.nbytes for entry in self._draining)
+
+    def preload(self, model_ids: Sequence[str]) -> None:
+        """Load the given models now, most important first."""
+        for model_id in model_ids:
+            with self.acquire(model_id):
+                pass
+
+    def start_preload(self, model_ids: Sequence[str]) -> threading.Thread:
+        """Preload on a daemon thread, once per cache."""
+        with self._lock:
+            if self._preload is None:
+                self._preload = threading.Thread(
+                    target=self.preload,
+                    args=(tuple(model_ids),),
+                    name="jerechat-model-preload",
+                    daemon=True,
+                )
+                self._preload.start()
+            return self._preload
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            status = {}
+            for model_id, spec in self.catalog.items():
+                entry = self._resident.get(model_id)
+                if model_id in self._reloading:
+                    state = "reloading"
+                elif entry is not None:
+                    state = "ready"
+                elif model_id in self._loading:
+                    state = "loading"
+                elif self.failures.get(model_id):
+                    state = "failed"
+                else:
+                    state = "not loaded"
+                status[model_id] = {
+                    "checkpoint": spec.checkpoint,
+                    "version": entry.model.version if entry is not None else None,
+                    "state": state,
+                    "bytes": entry.nbytes if entry is not None else 0,
+                    "pins": entry.pins if entry is not None else 0,
+                    "load_seconds": entry.load_seconds if entry is not None else None,
+                    "draining": sum(
+                        1 for old in self._draining if old.spec.model_id == model_id
+                    ),
+                }
+            return status
+
+    def _pin(self, model_id: str) -> Optional[_Entry]:
+        spec = self.catalog[model_id]
+        with self._lock:
+            entry = self._resident.get(model_id)
+            if entry is not None:
+                entry.pins += 1
+                self._resident.move_to_end(model_id)
+                return entry
+            loading = self._loading.get(model_id)
+            if loading is None:
+                loading = self._loading[model_id] = _Loading()
+                # Make room up front, guessing the size from earlier loads
+                self._evict(self._sizes.get(model_id, max(self._sizes.values(), default=0)))
+                owner = True
+            else:
+                loading.waiters += 1
+                owner = False
+
+        if not owner:
+            # Another request is loading it; share that load (already pinned
+            # for us, so it cannot be evicted before we get it)
+            loading.done.wait()
+            return loading.entry
+
+        entry = self._load(spec)
+        stale = None
+        with self._lock:
+            del self._loading[model_id]
+            loading.entry = entry
+            loading.done.set()
+            if entry is None:
+                return None
+            entry.pins = 1 + loading.waiters
+            self._sizes[model_id] = entry.nbytes
+            self.loads += 1
+            instrumentation.increment("model_cache_loads_total", labels={"model": model_id})
+            # set_catalog() skips models that are not resident yet, so check
+            # whether the catalog moved on while this one was loading
+            current = self.catalog.get(model_id)
+            if current is None:
+                # Removed meanwhile: serve the requests waiting on it, then free
+                self._draining.append(entry)
+            else:
+                self._resident[model_id] = entry
+                if current != spec and self._reloading.get(model_id) != current:
+                    self._reloading[model_id] = stale = current
+            self._evict()
+        if stale is not None:
+            self._start_reload(stale)
+        return entry
+
+    def _load(self, spec: ModelSpec) -> Optional[_Entry]:
+        """Run the loader outside the lock; counts a failure on None."""
+        version = checkpoint_version(spec.checkpoint)
+        start = time.perf_counter()
+        try:
+            searcher, voc = self._loader(spec)
+        except Exception as e:
+            print(f"Failed to load {spec.model_id} from {spec.checkpoint}: {e}")
+            searcher, voc = None, None
+        load_seconds = time.perf_counter() - start
+        if searcher is None or voc is None:
+            with self._lock:
+                self.failures[spec.model_id] = self.failures.get(spec.model_id, 0) + 1
+            return None
+        return _Entry(
+            LoadedModel(searcher, voc, version), spec, model_nbytes(searcher), load_seconds
+        )
+
+    def _start_reload(self, spec: ModelSpec) -> None:
+        threading.Thread(
+            target=self._reload,
+            args=(spec,),
+            name=f"jerechat-reload-{spec.model_id}",
+            daemon=True,
+        ).start()
+
+    def _reload(self, spec: ModelSpec) -> bool:
+        model_id = spec.model_id
+        entry = self._load(spec)
+        with self._lock:
+            if self._reloading.get(model_id) == spec:
+                del self._reloading[model_id]
+            if entry is None:
+                return False
+            if self.catalog.get(model_id) != spec:
+                # Superseded by a newer catalog while loading
+                return False
+            old = self._resident.pop(model_id, None)
+            self._resident[model_id] = entry
+            if old is not None:
+                self._retire(old)
+            self._sizes[model_id] = entry.nbytes
+            self.reloads += 1
+            instrumentation.increment("model_cache_reloads_total", labels={"model": model_id})
+            self._evict()
+        print(f"Serving {model_id} from {entry.model.version}")
+        return True
+
+    def _retire(self, entry: _Entry) -> None:
+        """Stop handing out ``entry``; free it once its requests finish.
+
+        Called with the lock held.
+        """
+        if entry.pins:
+            self._draining.append(entry)
+
+    def _evict(self, incoming: int = 0) -> None:
+        """Evict unpinned models, oldest first, until ``incoming`` more bytes fit.
+
+        Draining versions count against the budget. Called with the lock held.
+        """
+        total = sum(entry.nbytes for entry in self._resident.values())
+        total += sum(entry.nbytes for entry in self._draining)
+        for model_id in list(self._resident):
+            if total + incoming <= self.budget_bytes:
+                break
+            entry = self._resident[model_id]
+            if entry.pins:
+                continue
+            del self._resident[model_id]
+            total -= entry.nbytes
+            self.evictions += 1
+            instrumentation.increment("model_cache_evictions_total", labels={"model": model_id})
+        instrumentation.set_gauge("model_cache_resident_bytes", total)
+        instrumentation.set_gauge(
+            "model_cache_resident_models", len(self._resident) + len(self._draining)
+        )
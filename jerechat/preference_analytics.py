@@ -0,0 +1,376 @@
+"""Pairwise-preference ratings, confidence intervals and stopping decisions.
+
+A saved preference is a ``good`` row for the preferred model followed by a
+``bad`` row for the other model, with the same ``comparison_id``. Rows
+saved before that column existed are matched on ``user_id`` and
+``message_index`` instead, which can mix up sessions: the index restarts in
+every session, and one invitation code can run several at once.
+PreferenceAnalytics reads feedback rows a page at a time and recovers those
+pairs with NumPy. Each page is sorted by (comparison key, id), and a
+``good`` row directly followed by a ``bad`` row with the same key is one
+comparison. Good rows still waiting for their partner carry over to the
+next page. The comparisons are accumulated into a win matrix, so later
+updates only read rows newer than ``last_id``.
+
+From the win matrix it computes:
+
+    Bradley-Terry strengths, fitted with the MM algorithm and reported on
+        the Elo scale (1000 + 400 * log10 strength, geometric mean 1000)
+    bootstrap confidence intervals, from multinomial resamples of the
+        comparisons, all fitted at once as one batched MM iteration
+    sequential stopping decisions for every pair of models, from a
+        two-sided Wald SPRT on their head-to-head record
+
+The Streamlit dashboard keeps one engine per process. For an offline report
+with the Supabase credentials from ``.streamlit/secrets.toml``, run from
+the repository root:
+
+    python -m jerechat.preference_analytics --state ratings_state.json
+
+With ``--state`` the engine is saved after the run, and the next run only
+reads the rows added since.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+ANALYTICS_COLUMNS = (
+    "id, user_id, message_index, comparison_id, model_version, feedback_type"
+)
+
+
+def message_key(user_id: Any, message_index: Any) -> int:
+    """Stable 64-bit key for the message a feedback row belongs to."""
+    digest = hashlib.blake2b(f"{user_id}:{message_index}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "big", signed=True)
+
+
+def comparison_key(row: Dict[str, Any]) -> int:
+    """Stable 64-bit key for the comparison a feedback row belongs to."""
+    comparison_id = row.get("comparison_id")
+    if comparison_id is None:
+        return message_key(row["user_id"], row["message_index"])
+    digest = hashlib.blake2b(f"comparison:{comparison_id}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "big", signed=True)
+
+
+def fit_bradley_terry(
+    wins: np.ndarray, prior: float = 1.0, max_iter: int = 1000, tol: float = 1e-9
+) -> np.ndarray:
+    """
+    Bradley-Terry strengths for one win matrix or a batch of them.
+
+    ``wins[..., i, j]`` counts the times model i was preferred over model j.
+    ``prior`` adds that many virtual comparisons, split evenly, between every
+    pair, so models that never won still get a finite strength. Returns
+    strengths with shape ``wins.shape[:-1]``, each row with geometric mean 1.
+    """
+    m = wins.shape[-1]
+    if m < 2:
+        return np.ones(wins.shape[:-1])
+    wins = wins + (prior / 2) * (1 - np.eye(m))
+    games = wins + np.swapaxes(wins, -1, -2)
+    won = wins.sum(-1)
+    strength = np.ones(wins.shape[:-1])
+    for _ in range(max_iter):
+        pair_sum = strength[..., :, None] + strength[..., None, :]
+        updated = won / (games / pair_sum).sum(-1)
+        updated /= np.exp(np.log(updated).mean(-1, keepdims=True))
+        if np.max(np.abs(updated - strength) / strength) < tol:
+            return updated
+        strength = updated
+    return strength
+
+
+def elo_scale(strength: np.ndarray) -> np.ndarray:
+    return 1000 + 400 * np.log10(strength)
+
+
+def sprt_decisions(
+    wins: np.ndarray, delta: float = 0.05, alpha: float = 0.05, beta: float = 0.2
+) -> List[Dict[str, Any]]:
+    """
+    Two-sided Wald SPRT on every pair's head-to-head record.
+
+    Tests a preference rate of 0.5 against 0.5 + ``delta`` and 0.5 - ``delta``.
+    Each pair is "first better", "second better", "no difference" (both
+    alternatives rejected) or "continue" (keep collecting).
+    """
+    first, second = np.triu_indices(wins.shape[0], k=1)
+    won = wins[first, second]
+    lost = wins[second, first]
+    up = 0.5 + delta
+    llr_up = won * math.log(up / 0.5) + lost * math.log((1 - up) / 0.5)
+    llr_down = won * math.log((1 - up) / 0.5) + lost * math.log(up / 0.5)
+    accept = math.log((1 - beta) / alpha)
+    reject = math.log(beta / (1 - alpha))
+    decision = np.full(len(won), "continue", dtype=object)
+    decision[(llr_up <= reject) & (llr_down <= reject)] = "no difference"
+    decision[llr_down >= accept] = "second better"
+    decision[llr_up >= accept] = "first better"
+    return [
+        {
+            "pair": (int(i), int(j)),
+            "wins": int(w),
+            "losses": int(l),
+            "decision": d,
+        }
+        for i, j, w, l, d in zip(first, second, won, lost, decision)
+    ]
+
+
+class PreferenceAnalytics:
+    """Win matrix over feedback rows, updated incrementally page by page."""
+
+    def __init__(self, carry_limit: int = 100_000):
+        self.models: List[str] = []
+        self.wins = np.zeros((0, 0), dtype=np.int64)
+        self.last_id = 0
+        self.rows = 0
+        self.carry_limit = carry_limit
+        self._index: Dict[str, int] = {}
+        # Good rows whose bad partner has not been read yet
+        self._carry = self._empty()
+        self._lock = threading.Lock()
+
+    def update(self, rows: Iterable[Dict[str, Any]], page_size: int = 10_000) -> int:
+        """Read feedback rows (any order within a page); returns how many.
+
+        Rows with an id at or below ``last_id`` were already read and are
+        skipped, so reading the same rows twice counts them once.
+        """
+        with self._lock:
+            return self._update(rows, page_size)
+
+    def refresh(
+        self,
+        fetch_rows: Callable[[int], Iterable[Dict[str, Any]]],
+        page_size: int = 10_000,
+    ) -> int:
+        """Read ``fetch_rows(last_id)``; concurrent refreshes run one at a time."""
+        with self._lock:
+            return self._update(fetch_rows(self.last_id), page_size)
+
+    def _update(self, rows: Iterable[Dict[str, Any]], page_size: int) -> int:
+        count = 0
+        page: List[Dict[str, Any]] = []
+        for row in rows:
+            page.append(row)
+            if len(page) == page_size:
+                count += self._add_page(page)
+                page = []
+        if page:
+            count += self._add_page(page)
+        return count
+
+    def update_arrays(
+        self,
+        ids: np.ndarray,
+        keys: np.ndarray,
+        models: Sequence[str],
+        good: np.ndarray,
+    ) -> int:
+        """Read one page already in columns; ``keys`` come from comparison_key()."""
+        with self._lock:
+            return self._add_arrays(ids, keys, self._model_codes(models), good)
+
+    def ratings(
+        self, bootstrap: int = 0, confidence: float = 0.95, seed: Optional[int] = None
+    ) -> Dict[str, Dict[str, float]]:
+        """Elo-scale ratings per model, with bootstrap intervals if requested."""
+        with self._lock:
+            wins = self.wins.astype(float)
+            models = list(self.models)
+        if not models:
+            return {}
+        rating = elo_scale(fit_bradley_terry(wins))
+        ratings = {
+            model: {
+                "rating": float(rating[i]),
+                "comparisons": int(wins[i].sum() + wins[:, i].sum()),
+                "wins": int(wins[i].sum()),
+            }
+            for i, model in enumerate(models)
+        }
+        total = int(wins.sum())
+        if bootstrap and total:
+            rng = np.random.default_rng(seed)
+            samples = rng.multinomial(total, wins.ravel() / total, size=bootstrap)
+            sampled = elo_scale(
+                fit_bradley_terry(samples.reshape(bootstrap, *wins.shape).astype(float))
+            )
+            tail = (1 - confidence) / 2 * 100
+            low, high = np.percentile(sampled, [tail, 100 - tail], axis=0)
+            for i, model in enumerate(models):
+                ratings[model]["low"] = float(low[i])
+                ratings[model]["high"] = float(high[i])
+        return ratings
+
+    def decisions(self, **sprt: float) -> List[Dict[str, Any]]:
+        """Sequential stopping decision for every pair of models."""
+        with self._lock:
+            wins = self.wins.copy()
+            models = list(self.models)
+        decisions = sprt_decisions(wins, **sprt)
+        for decision in decisions:
+            decision["pair"] = tuple(models[i] for i in decision["pair"])
+        return decisions
+
+    def report(
+        self, bootstrap: int = 200, seed: Optional[int] = None
+    ) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "last_id": self.last_id,
+            "comparisons": int(self.wins.sum()),
+            "ratings": self.ratings(bootstrap, seed=seed),
+            "decisions": self.decisions(),
+        }
+
+    def state(self) -> Dict[str, Any]:
+        """JSON-serializable state, for resuming with from_state()."""
+        with self._lock:
+            return {
+                "models": self.models,
+                "wins": self.wins.tolist(),
+                "last_id": self.last_id,
+                "rows": self.rows,
+                "carry": {name: column.tolist() for name, column in self._carry.items()},
+            }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "PreferenceAnalytics":
+        analytics = cls()
+        analytics.models = list(state["models"])
+        analytics._index = {model: i for i, model in enumerate(analytics.models)}
+        analytics.wins = np.array(state["wins"], dtype=np.int64).reshape(
+            len(analytics.models), len(analytics.models)
+        )
+        analytics.last_id = state["last_id"]
+        analytics.rows = state["rows"]
+        analytics._carry = {
+            name: np.array(column, dtype=np.int64)
+            for name, column in state["carry"].items()
+        }
+        return analytics
+
+    @staticmethod
+    def _empty() -> Dict[str, np.ndarray]:
+        return {name: np.zeros(0, dtype=np.int64) for name in ("ids", "keys", "models")}
+
+    def _model_codes(self, models: Sequence[str]) -> np.ndarray:
+        codes = np.empty(len(models), dtype=np.int64)
+        for i, model in enumerate(models):
+            code = self._index.get(model)
+            if code is None:
+                code = self._index[model] = len(self.models)
+                self.models.append(model)
+            codes[i] = code
+        grown = len(self.models) - self.wins.shape[0]
+        if grown:
+            self.wins = np.pad(self.wins, ((0, grown), (0, grown)))
+        return codes
+
+    def _add_page(self, page: List[Dict[str, Any]]) -> int:
+        return self._add_arrays(
+            np.fromiter((row["id"] for row in page), np.int64, len(page)),
+            np.fromiter((comparison_key(row) for row in page), np.int64, len(page)),
+            self._model_codes([row["model_version"] for row in page]),
+            np.fromiter(
+                (row["feedback_type"] == "good" for row in page), bool, len(page)
+            ),
+        )
+
+    def _add_arrays(
+        self, ids: np.ndarray, keys: np.ndarray, models: np.ndarray, good: np.ndarray
+    ) -> int:
+        new = ids > self.last_id
+        if not new.all():
+            ids, keys, models, good = ids[new], keys[new], models[new], good[new]
+        carry = self._carry
+        ids = np.concatenate([carry["ids"], ids])
+        keys = np.concatenate([carry["keys"], keys])
+        models = np.concatenate([carry["models"], models])
+        good = np.concatenate([np.ones(len(carry["ids"]), bool), good])
+
+        order = np.lexsort((ids, keys))
+        ids, keys, models, good = ids[order], keys[order], models[order], good[order]
+        paired = (keys[1:] == keys[:-1]) & good[:-1] & ~good[1:]
+        paired &= models[:-1] != models[1:]
+        m = len(self.models)
+        self.wins += np.bincount(
+            models[:-1][paired] * m + models[1:][paired], minlength=m * m
+        ).reshape(m, m)
+
+        used = np.zeros(len(ids), bool)
+        used[:-1] = paired
+        waiting = np.flatnonzero(good & ~used)
+        # Keep the newest unmatched good rows; older ones lost their partner
+        waiting = waiting[np.argsort(ids[waiting])[-self.carry_limit :]]
+        self._carry = {
+            "ids": ids[waiting],
+            "keys": keys[waiting],
+            "models": models[waiting],
+        }
+
+        read = len(ids) - len(carry["ids"])
+        if read:
+            self.last_id = max(self.last_id, int(ids.max()))
+        self.rows += read
+        return read
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Pairwise preference ratings report")
+    parser.add_argument(
+        "--state", default=None, help="JSON file to resume from and save to"
+    )
+    parser.add_argument("--bootstrap", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    from database import iter_feedback_rows
+
+    analytics = PreferenceAnalytics()
+    if args.state:
+        try:
+            with open(args.state) as f:
+                analytics = PreferenceAnalytics.from_state(json.load(f))
+        except FileNotFoundError:
+            pass
+    new_rows = analytics.refresh(
+        lambda after_id: iter_feedback_rows(ANALYTICS_COLUMNS, after_id, args.page_size)
+    )
+    report = analytics.report(args.bootstrap, args.seed)
+    print(
+        f"{new_rows} new rows, {report['rows']} total, "
+        f"{report['comparisons']} comparisons"
+    )
+    ranked = sorted(report["ratings"].items(), key=lambda item: -item[1]["rating"])
+    for model, r in ranked:
+        interval = f" [{r['low']:.0f}, {r['high']:.0f}]" if "low" in r else ""
+        print(
+            f"{model:<20} {r['rating']:7.1f}{interval}  "
+            f"{r['wins']}/{r['comparisons']} won"
+        )
+    for d in report["decisions"]:
+        first, second = d["pair"]
+        print(f"{first} vs {second}: {d['wins']}-{d['losses']}, {d['decision']}")
+    if args.state:
+        with open(args.state, "w") as f:
+            json.dump(analytics.state(), f)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
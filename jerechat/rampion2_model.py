@@ -2,8 +2,12 @@ import torch
 import torch.nn as nn
 import os
 import re
+import threading
+import weakref
 import streamlit as st
 from constants import PAD_TOKEN, SOS_TOKEN, EOS_TOKEN, MAX_LENGTH
+from jerechat.instrumentation import increment, span
+from jerechat.text import normalizeString
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -42,7 +46,7 @@ class EncoderRNN(nn.Module):
 
     def forward(self, input_seq, input_lengths, hidden=None):
         embedded = self.embedding(input_seq)
-        packed = nn.utils.rnn.pack_padded_sequence(embedded, input_lengths)
+        packed = nn.utils.rnn.pack_padded_sequence(embedded, input_lengths, enforce_sorted=False)
         outputs, hidden = self.gru(packed, hidden)
         outputs, _ = nn.utils.rnn.pad_packed_sequence(outputs)
         outputs = outputs[:, :, :self.hidden_size] + outputs[:, : ,self.hidden_size:]
@@ -73,8 +77,31 @@ class Attn(nn.Module):
         energy = self.attn(torch.cat((hidden.expand(encoder_output.size(0), -1, -1), encoder_output), 2)).tanh()
         return torch.sum(self.v * energy, dim=2)
 
-    def forward(self, hidden, encoder_outputs):
+    def precompute(self, encoder_outputs):
+        """Build the per-request attention keys once after the encoder pass.
+
+        For 'general' these are the projected encoder outputs. For 'concat'
+        they are the encoder half of the concatenated Linear (plus its bias),
+        so each step only has to project the decoder hidden state.
+        """
         if self.method == 'general':
+            return self.attn(encoder_outputs)
+        if self.method == 'concat':
+            encoder_weight = self.attn.weight[:, self.hidden_size:]
+            return nn.functional.linear(encoder_outputs, encoder_weight, self.attn.bias)
+        return encoder_outputs
+
+    def cached_score(self, hidden, keys):
+        if self.method == 'concat':
+            hidden_weight = self.attn.weight[:, :self.hidden_size]
+            energy = (keys + nn.functional.linear(hidden, hidden_weight)).tanh()
+            return torch.sum(self.v * energy, dim=2)
+        return torch.sum(hidden * keys, dim=2)
+
+    def forward(self, hidden, encoder_outputs, mask=None, keys=None):
+        if keys is not None:
+            attn_energies = self.cached_score(hidden, keys)
+        elif self.method == 'general':
             attn_energies = self.general_score(hidden, encoder_outputs)
         elif self.method == 'concat':
             attn_energies = self.concat_score(hidden, encoder_outputs)
@@ -82,6 +109,8 @@ class Attn(nn.Module):
             attn_energies = self.dot_score(hidden, encoder_outputs)
 
         attn_energies = attn_energies.t()
+        if mask is not None:
+            attn_energies = attn_energies.masked_fill(~mask, float('-inf'))
         return torch.softmax(attn_energies, dim=1).unsqueeze(1)
 
 
@@ -100,11 +129,11 @@ class LuongAttnDecoderRNN(nn.Module):
         self.out = nn.Linear(hidden_size, output_size)
         self.attn = Attn(attn_model, hidden_size)
 
-    def forward(self, input_step, last_hidden, encoder_outputs):
+    def forward(self, input_step, last_hidden, encoder_outputs, mask=None, attn_keys=None):
         embedded = self.embedding(input_step)
         embedded = self.embedding_dropout(embedded)
         rnn_output, hidden = self.gru(embedded, last_hidden)
-        attn_weights = self.attn(rnn_output, encoder_outputs)
+        attn_weights = self.attn(rnn_output, encoder_outputs, mask, attn_keys)
         context = attn_weights.bmm(encoder_outputs.transpose(0, 1))
         rnn_output = rnn_output.squeeze(0)
         context = context.squeeze(1)
@@ -114,6 +143,158 @@ class LuongAttnDecoderRNN(nn.Module):
         output = torch.softmax(output, dim=1)
         return output, hidden
 
+    def inference_step(self, input_step, last_hidden, scratch):
+        """One decoder step for inference, writing into ``scratch`` buffers.
+
+        Dropout is skipped (it is a no-op in eval mode), the concat Linear is
+        applied as two matmuls on its split weight so no concatenated input
+        is built, and the attention context, concat output and vocabulary
+        logits reuse the same buffers every step. Returns the raw logits;
+        their argmax is the same token as the softmax's.
+        """
+        embedded = self.embedding(input_step)
+        rnn_output, hidden = self.gru(embedded, last_hidden)
+        rnn_output = rnn_output.squeeze(0)
+        if scratch.keys_t is not None:
+            torch.bmm(scratch.keys_t, rnn_output.unsqueeze(2), out=scratch.energy)
+            attn_energies = scratch.energy.squeeze(2)
+        else:
+            attn_energies = self.attn.cached_score(rnn_output.unsqueeze(0), scratch.attn_keys).t()
+        if scratch.padding is not None:
+            attn_energies.masked_fill_(scratch.padding, float('-inf'))
+        attn_weights = torch.softmax(attn_energies, dim=1).unsqueeze(1)
+        torch.bmm(attn_weights, scratch.encoder_t, out=scratch.context)
+        context = scratch.context.squeeze(1)
+        torch.addmm(self.concat.bias, rnn_output, scratch.concat_rnn_weight, out=scratch.concat_output)
+        scratch.concat_output.addmm_(context, scratch.concat_context_weight).tanh_()
+        torch.addmm(scratch.out_bias, scratch.concat_output, scratch.out_weight, out=scratch.logits)
+        return scratch.logits, hidden
+
+
+class Shortlist:
+    """Reduced output projection over the most frequent words.
+
+    Built once per decoder from the ``size`` most frequent words in
+    ``voc.word2count`` plus EOS. Each request adds the words of its own
+    input, since replies often copy them. A step whose best probability
+    within the shortlist is below ``threshold`` is redone over the full
+    vocabulary. ``steps`` and ``fallback_steps`` count decoded rows.
+    """
+
+    def __init__(self, voc, decoder, size, threshold=0.5):
+        frequent = sorted(voc.word2count, key=voc.word2count.get, reverse=True)[:size]
+        ids = {EOS_TOKEN} | {voc.word2index[word] for word in frequent if word in voc.word2index}
+        self.size = size
+        self.threshold = threshold
+        self.steps = 0
+        self.fallback_steps = 0
+        with torch.no_grad():
+            self.ids = torch.tensor(sorted(ids), device=device, dtype=torch.long)
+            self.weight_t = decoder.out.weight[self.ids].t().contiguous()
+            self.bias = decoder.out.bias[self.ids]
+            self.member = torch.zeros(decoder.output_size, device=device, dtype=torch.bool)
+            self.member[self.ids] = True
+
+    @property
+    def fallback_rate(self):
+        return self.fallback_steps / self.steps if self.steps else 0.0
+
+    def projection(self, decoder, input_seq):
+        """Token ids, transposed weight and bias for one request's inputs."""
+        words = input_seq[input_seq != PAD_TOKEN]
+        extra = torch.unique(words[~self.member[words]])
+        if not len(extra):
+            return self.ids, self.weight_t, self.bias
+        return (
+            torch.cat((self.ids, extra)),
+            torch.cat((self.weight_t, decoder.out.weight[extra].t()), dim=1),
+            torch.cat((self.bias, decoder.out.bias[extra])),
+        )
+
+
+class DecoderScratch:
+    """Per-request buffers reused across LuongAttnDecoderRNN.inference_step calls.
+
+    ``projection`` replaces the output Linear with ``(weight_t, bias)`` for
+    a subset of the vocabulary (see Shortlist).
+    """
+
+    def __init__(self, decoder, encoder_outputs, attn_keys, mask=None, projection=None):
+        src_len, batch_size, hidden_size = encoder_outputs.shape
+        self.attn_keys = attn_keys
+        self.encoder_t = encoder_outputs.transpose(0, 1).contiguous()
+        self.keys_t = None if decoder.attn.method == 'concat' else attn_keys.transpose(0, 1).contiguous()
+        self.padding = None if mask is None else ~mask
+        self.concat_rnn_weight = decoder.concat.weight[:, :hidden_size].t()
+        self.concat_context_weight = decoder.concat.weight[:, hidden_size:].t()
+        self.out_weight, self.out_bias = projection or (decoder.out.weight.t(), decoder.out.bias)
+        options = dict(device=encoder_outputs.device, dtype=encoder_outputs.dtype)
+        self.energy = torch.empty(batch_size, src_len, 1, **options)
+        self.context = torch.empty(batch_size, 1, hidden_size, **options)
+        self.concat_output = torch.empty(batch_size, hidden_size, **options)
+        self.logits = torch.empty(batch_size, self.out_weight.size(1), **options)
+
+
+def greedy_inference_loop(decoder, encoder_outputs, encoder_hidden, max_length, mask=None):
+    """Greedy decode with inference_step into preallocated token/score buffers.
+
+    Returns tokens and scores shaped [max_length, batch]. Scores are the
+    softmax probability of each chosen token, as in GreedySearchDecoder.
+    """
+    batch_size = encoder_outputs.size(1)
+    attn_keys = decoder.attn.precompute(encoder_outputs)
+    scratch = DecoderScratch(decoder, encoder_outputs, attn_keys, mask)
+    decoder_hidden = encoder_hidden[:decoder.n_layers]
+    decoder_input = torch.full((1, batch_size), SOS_TOKEN, device=device, dtype=torch.long)
+    all_tokens = torch.empty(max_length, batch_size, device=device, dtype=torch.long)
+    all_scores = torch.empty(max_length, batch_size, device=device)
+    for step in range(max_length):
+        with span("decoder_step"):
+            logits, decoder_hidden = decoder.inference_step(decoder_input, decoder_hidden, scratch)
+            torch.max(logits, dim=1, out=(all_scores[step], all_tokens[step]))
+            all_scores[step].sub_(torch.logsumexp(logits, dim=1)).exp_()
+        decoder_input = all_tokens[step].unsqueeze(0)
+    return all_tokens, all_scores
+
+
+def shortlist_inference_loop(decoder, encoder_outputs, encoder_hidden, max_length, shortlist, input_seq, mask=None):
+    """greedy_inference_loop projecting onto ``shortlist`` instead of the full vocabulary.
+
+    Rows whose best shortlist probability is below the shortlist threshold
+    are projected again over the full vocabulary. Scores of shortlist steps
+    are probabilities within the shortlist, so they can only overestimate
+    the full-vocabulary probability.
+    """
+    batch_size = encoder_outputs.size(1)
+    attn_keys = decoder.attn.precompute(encoder_outputs)
+    ids, weight_t, bias = shortlist.projection(decoder, input_seq)
+    scratch = DecoderScratch(decoder, encoder_outputs, attn_keys, mask, (weight_t, bias))
+    decoder_hidden = encoder_hidden[:decoder.n_layers]
+    decoder_input = torch.full((1, batch_size), SOS_TOKEN, device=device, dtype=torch.long)
+    all_tokens = torch.empty(max_length, batch_size, device=device, dtype=torch.long)
+    all_scores = torch.empty(max_length, batch_size, device=device)
+    best = torch.empty(batch_size, device=device, dtype=torch.long)
+    fallbacks = 0
+    for step in range(max_length):
+        with span("decoder_step"):
+            logits, decoder_hidden = decoder.inference_step(decoder_input, decoder_hidden, scratch)
+            torch.max(logits, dim=1, out=(all_scores[step], best))
+            all_scores[step].sub_(torch.logsumexp(logits, dim=1)).exp_()
+            torch.index_select(ids, 0, best, out=all_tokens[step])
+            rows = (all_scores[step] < shortlist.threshold).nonzero().squeeze(1)
+            if len(rows):
+                full = torch.addmm(decoder.out.bias, scratch.concat_output[rows], decoder.out.weight.t())
+                full_scores, full_tokens = torch.max(full, dim=1)
+                all_scores[step, rows] = (full_scores - torch.logsumexp(full, dim=1)).exp()
+                all_tokens[step, rows] = full_tokens
+        fallbacks += len(rows)
+        decoder_input = all_tokens[step].unsqueeze(0)
+    shortlist.steps += batch_size * max_length
+    shortlist.fallback_steps += fallbacks
+    increment("shortlist_steps_total", batch_size * max_length)
+    increment("shortlist_fallback_steps_total", fallbacks)
+    return all_tokens, all_scores
+
 
 class GreedySearchDecoder(nn.Module):
     def __init__(self, encoder, decoder):
@@ -122,33 +303,257 @@ class GreedySearchDecoder(nn.Module):
         self.decoder = decoder
 
     def forward(self, input_seq, input_length, max_length):
-        encoder_outputs, encoder_hidden = self.encoder(input_seq, input_length)
+        with span("encoder"):
+            encoder_outputs, encoder_hidden = self.encoder(input_seq, input_length)
+            attn_keys = self.decoder.attn.precompute(encoder_outputs)
         decoder_hidden = encoder_hidden[:self.decoder.n_layers]
         decoder_input = torch.ones(1, 1, device=device, dtype=torch.long) * SOS_TOKEN
         all_tokens = torch.zeros([0], device=device, dtype=torch.long)
         all_scores = torch.zeros([0], device=device)
         for _ in range(max_length):
-            decoder_output, decoder_hidden = self.decoder(decoder_input, decoder_hidden, encoder_outputs)
-            decoder_scores, decoder_input = torch.max(decoder_output, dim=1)
+            with span("decoder_step"):
+                decoder_output, decoder_hidden = self.decoder(decoder_input, decoder_hidden, encoder_outputs, attn_keys=attn_keys)
+                decoder_scores, decoder_input = torch.max(decoder_output, dim=1)
             all_tokens = torch.cat((all_tokens, decoder_input), dim=0)
             all_scores = torch.cat((all_scores, decoder_scores), dim=0)
             decoder_input = torch.unsqueeze(decoder_input, 0)
         return all_tokens, all_scores
 
 
-def normalizeString(s):
-    s = s.lower()
-    s = re.sub(r"([.!?])", r" \1", s)
-    s = re.sub(r"[^a-zA-Z.!?]+", r" ", s)
-    return s
+class InferenceGreedySearchDecoder(GreedySearchDecoder):
+    """GreedySearchDecoder for serving: no autograd, allocation-free steps.
+
+    Produces the same tokens as the eager GreedySearchDecoder (which stays
+    the reference implementation) with the same call signature. With a
+    ``shortlist`` each step projects onto the shortlist instead (see
+    shortlist_inference_loop), which may pick different tokens.
+    """
+
+    def __init__(self, encoder, decoder, shortlist=None):
+        super(InferenceGreedySearchDecoder, self).__init__(encoder, decoder)
+        self.shortlist = shortlist
+
+    def forward(self, input_seq, input_length, max_length):
+        tokens, scores, _ = self.decode(input_seq, input_length, max_length)
+        return tokens, scores
+
+    def decode(self, input_seq, input_length, max_length, memory=None):
+        """Decode one input, optionally attending over earlier turns too.
+
+        ``memory`` holds the encoder outputs of previous turns (oldest
+        first). Returns tokens, scores and this turn's encoder outputs.
+        """
+        with torch.inference_mode():
+            with span("encoder"):
+                encoder_outputs, encoder_hidden = self.encoder(input_seq, input_length)
+            attended = torch.cat(list(memory) + [encoder_outputs], dim=0) if memory else encoder_outputs
+            if self.shortlist is not None:
+                all_tokens, all_scores = shortlist_inference_loop(
+                    self.decoder, attended, encoder_hidden, max_length, self.shortlist, input_seq
+                )
+            else:
+                all_tokens, all_scores = greedy_inference_loop(
+                    self.decoder, attended, encoder_hidden, max_length
+                )
+        return all_tokens[:, 0], all_scores[:, 0], encoder_outputs
+
+
+def vocabularies_match(voc_a, voc_b):
+    """True if both vocabularies map every index to the same word."""
+    return voc_a.num_words == voc_b.num_words and voc_a.index2word == voc_b.index2word
+
+
+def _gru_layers(gru):
+    """Single-layer GRUs sharing each layer's weights with ``gru``.
+
+    Running the layers one after another over a sequence gives every
+    layer's hidden state after every step, which nn.GRU only returns for
+    the last step.
+    """
+    layers = []
+    for i in range(gru.num_layers):
+        layer = nn.GRU(gru.input_size if i == 0 else gru.hidden_size, gru.hidden_size, 1, bias=gru.bias)
+        for name in ('weight_ih', 'weight_hh', 'bias_ih', 'bias_hh'):
+            if hasattr(gru, f'{name}_l{i}'):
+                setattr(layer, f'{name}_l0', getattr(gru, f'{name}_l{i}'))
+        layers.append(layer.eval())
+    return layers
+
+
+# Split layers of each GRU, built once; dropped when the GRU is freed
+_split_grus = weakref.WeakKeyDictionary()
+_split_lock = threading.Lock()
+
+
+def _cached_gru_layers(gru):
+    """_gru_layers(gru), built on first use and reused while ``gru`` lives."""
+    with _split_lock:
+        layers = _split_grus.get(gru)
+        if layers is None:
+            layers = _split_grus[gru] = _gru_layers(gru)
+        return layers
+
+
+class SpeculativeGreedySearchDecoder(InferenceGreedySearchDecoder):
+    """Greedy search where a draft model proposes tokens and the target checks them.
+
+    Each round the draft decoder proposes ``num_draft_tokens`` tokens one
+    step at a time. The target decoder then scores all of them in a single
+    multi-step pass. The longest prefix matching the target's own argmax is
+    kept, followed by the target's token at the first mismatch, and both
+    models resume from the hidden state after the last kept token. Every
+    emitted token is the target's argmax given the tokens before it, so the
+    output is the target's greedy decode, whatever the draft proposes.
+
+    Both models must share a vocabulary. ``drafted`` and ``accepted`` count
+    draft tokens across calls; ``acceptance_rate`` is their ratio. The
+    target's split GRU layers are built once per target, so a decoder is
+    cheap to construct for each request.
+    """
+
+    def __init__(self, draft, target, draft_voc, target_voc, num_draft_tokens=4):
+        if not vocabularies_match(draft_voc, target_voc):
+            raise ValueError("Draft and target models have different vocabularies")
+        super(SpeculativeGreedySearchDecoder, self).__init__(target.encoder, target.decoder)
+        self.draft = draft
+        self.num_draft_tokens = num_draft_tokens
+        self.target_layers = _cached_gru_layers(target.decoder.gru)
+        self.drafted = 0
+        self.accepted = 0
+        self.verify_passes = 0
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    def decode(self, input_seq, input_length, max_length, memory=None):
+        with torch.inference_mode():
+            with span("encoder"):
+                encoder_outputs, encoder_hidden = self.encoder(input_seq, input_length)
+                draft_outputs, draft_hidden = self.draft.encoder(input_seq, input_length)
+            # Only the target attends over earlier turns; the draft just guesses
+            attended = torch.cat(list(memory) + [encoder_outputs], dim=0) if memory else encoder_outputs
+            tokens, scores = self._speculate(attended, encoder_hidden, draft_outputs, draft_hidden, max_length)
+        return tokens, scores, encoder_outputs
+
+    def _verify(self, inputs, hidden, attn_keys, encoder_outputs):
+        """Run the target decoder over ``inputs`` [k, 1] in one pass.
+
+        Returns logits [k, vocab] and every layer's hidden state after each
+        input [n_layers, k, hidden].
+        """
+        decoder = self.decoder
+        layer_output = decoder.embedding(inputs)
+        hiddens = []
+        for i, layer in enumerate(self.target_layers):
+            layer_output, _ = layer(layer_output, hidden[i:i + 1].contiguous())
+            hiddens.append(layer_output[:, 0])
+        rnn_output = layer_output[:, 0]
+        # The k steps attend independently, so score them as a batch of k
+        steps = rnn_output.size(0)
+        attn_energies = decoder.attn.cached_score(rnn_output.unsqueeze(0), attn_keys.expand(-1, steps, -1)).t()
+        attn_weights = torch.softmax(attn_energies, dim=1)
+        context = attn_weights.mm(encoder_outputs[:, 0])
+        concat_output = torch.tanh(decoder.concat(torch.cat((rnn_output, context), 1)))
+        return decoder.out(concat_output), torch.stack(hiddens)
+
+    def _speculate(self, encoder_outputs, encoder_hidden, draft_outputs, draft_hidden, max_length):
+        draft_decoder = self.draft.decoder
+        draft_scratch = DecoderScratch(draft_decoder, draft_outputs, draft_decoder.attn.precompute(draft_outputs))
+        attn_keys = self.decoder.attn.precompute(encoder_outputs)
+        target_hidden = encoder_hidden[:self.decoder.n_layers]
+        draft_hidden = draft_hidden[:draft_decoder.n_layers]
+        last = torch.full((1,), SOS_TOKEN, device=device, dtype=torch.long)
+        all_tokens = torch.empty(max_length, device=device, dtype=torch.long)
+        all_scores = torch.empty(max_length, device=device)
+        produced = 0
+        while produced < max_length:
+            k = min(self.num_draft_tokens, max_length - produced)
+            drafted = torch.empty(k, device=device, dtype=torch.long)
+            draft_hiddens = []
+            draft_input = last.view(1, 1)
+            with span("draft"):
+                for i in range(k):
+                    logits, draft_hidden = draft_decoder.inference_step(draft_input, draft_hidden, draft_scratch)
+                    drafted[i] = torch.max(logits, dim=1)[1][0]
+                    draft_hiddens.append(draft_hidden)
+                    draft_input = drafted[i].view(1, 1)
+
+            with span("verify"):
+                # Input i is the token before draft token i; the last draft
+                # token is only checked, never fed back in this round
+                inputs = torch.cat((last, drafted[:k - 1])).unsqueeze(1)
+                logits, target_hiddens = self._verify(inputs, target_hidden, attn_keys, encoder_outputs)
+                best_scores, best = torch.max(logits, dim=1)
+                best_scores = (best_scores - torch.logsumexp(logits, dim=1)).exp()
+
+            matches = (best == drafted).tolist()
+            accepted = matches.index(False) if False in matches else k
+            emitted = min(accepted + 1, k)
+            all_tokens[produced:produced + emitted] = best[:emitted]
+            all_scores[produced:produced + emitted] = best_scores[:emitted]
+            produced += emitted
+
+            # Both models resume after the last emitted token's input
+            last = best[emitted - 1:emitted]
+            target_hidden = target_hiddens[:, emitted - 1:emitted].contiguous()
+            draft_hidden = draft_hiddens[emitted - 1]
+
+            self.drafted += k
+            self.accepted += accepted
+            self.verify_passes += 1
+            increment("speculative_draft_tokens_total", k)
+            increment("speculative_accepted_tokens_total", accepted)
+        return all_tokens, all_scores
+
+
+class BatchGreedySearchDecoder(nn.Module):
+    """Greedy search over a padded batch of inputs.
+
+    Padding positions are masked out of the attention so every sequence
+    decodes exactly as it would through GreedySearchDecoder on its own.
+    With a ``shortlist``, every row may also pick the words of any input in
+    the batch.
+    """
+
+    def __init__(self, encoder, decoder, shortlist=None):
+        super(BatchGreedySearchDecoder, self).__init__()
+        self.encoder = encoder
+        self.decoder = decoder
+        self.shortlist = shortlist
+
+    def forward(self, input_seq, input_lengths, max_length):
+        with torch.inference_mode():
+            with span("encoder"):
+                encoder_outputs, encoder_hidden = self.encoder(input_seq, input_lengths)
+            mask = torch.arange(encoder_outputs.size(0)).unsqueeze(0) < input_lengths.unsqueeze(1)
+            mask = mask.to(device)
+            if self.shortlist is not None:
+                return shortlist_inference_loop(
+                    self.decoder, encoder_outputs, encoder_hidden, max_length, self.shortlist, input_seq, mask
+                )
+            return greedy_inference_loop(
+                self.decoder, encoder_outputs, encoder_hidden, max_length, mask
+            )
 
 
 def indexesFromSentence(voc, sentence):
     return [voc.word2index[word] for word in sentence.split(' ') if word in voc.word2index] + [EOS_TOKEN]
 
 
-def load_model(checkpoint_path):
-    """Load the Rampion 2 model from checkpoint"""
+def decodeTokens(voc, tokens):
+    with span("detokenize"):
+        decoded_words = [voc.index2word[token.item()] for token in tokens]
+        decoded_words = [x for x in decoded_words if not (x == 'EOS' or x == 'PAD')]
+        return ' '.join(decoded_words)
+
+
+def load_model(checkpoint_path, shortlist_size=None, shortlist_threshold=0.5):
+    """Load the Rampion 2 model from checkpoint
+
+    With ``shortlist_size`` the searcher projects onto a Shortlist of that
+    many frequent words, falling back below ``shortlist_threshold``.
+    """
     try:
         checkpoint = torch.load(checkpoint_path, map_location=device)
         encoder_sd = checkpoint['en']
@@ -178,7 +583,10 @@ def load_model(checkpoint_path):
         encoder.eval()
         decoder.eval()
         
-        searcher = GreedySearchDecoder(encoder, decoder)
+        shortlist = None
+        if shortlist_size:
+            shortlist = Shortlist(voc, decoder, shortlist_size, shortlist_threshold)
+        searcher = InferenceGreedySearchDecoder(encoder, decoder, shortlist)
         
         return searcher, voc
     except Exception as e:
@@ -194,11 +602,53 @@ def generate_response(searcher, voc, sentence, max_length=MAX_LENGTH):
         input_batch = torch.LongTensor(indexes_batch).transpose(0, 1)
         input_batch = input_batch.to(device)
         lengths = lengths.to("cpu")
-        tokens, scores = searcher(input_batch, lengths, max_length)
-        decoded_words = [voc.index2word[token.item()] for token in tokens]
-        decoded_words = [x for x in decoded_words if not (x == 'EOS' or x == 'PAD')]
-        return ' '.join(decoded_words)
+        with torch.inference_mode():
+            tokens, scores = searcher(input_batch, lengths, max_length)
+        return decodeTokens(voc, tokens)
     except KeyError:
         return "I'm sorry, I don't understand that word."
     except Exception as e:
         return f"Error generating response: {str(e)}"
+
+
+def generate_response_with_context(searcher, voc, sentence, memory, max_length=MAX_LENGTH):
+    """Generate a response that also attends over earlier turns.
+
+    Only ``sentence`` is encoded; ``memory`` holds the encoder outputs of
+    previous turns (oldest first). Returns the response and this turn's
+    encoder outputs so the caller can add them to its conversation context.
+    """
+    try:
+        indexes = indexesFromSentence(voc, sentence)
+        input_batch = torch.LongTensor([indexes]).transpose(0, 1).to(device)
+        lengths = torch.tensor([len(indexes)])
+        tokens, scores, encoder_outputs = searcher.decode(input_batch, lengths, max_length, memory)
+        return decodeTokens(voc, tokens), encoder_outputs
+    except KeyError:
+        return "I'm sorry, I don't understand that word.", None
+    except Exception as e:
+        return f"Error generating response: {str(e)}", None
+
+
+def generate_responses(searcher, voc, sentences, max_length=MAX_LENGTH):
+    """Generate responses for a batch of sentences in a single decode"""
+    try:
+        indexes_batch = [indexesFromSentence(voc, sentence) for sentence in sentences]
+        lengths = torch.tensor([len(indexes) for indexes in indexes_batch])
+        input_batch = torch.zeros(int(lengths.max()), len(indexes_batch), dtype=torch.long)
+        for i, indexes in enumerate(indexes_batch):
+            input_batch[:len(indexes), i] = torch.tensor(indexes)
+        input_batch = input_batch.to(device)
+        batch_searcher = BatchGreedySearchDecoder(
+            searcher.encoder, searcher.decoder, getattr(searcher, "shortlist", None)
+        )
+        tokens, scores = batch_searcher(input_batch, lengths, max_length)
+        responses = []
+        for i in range(len(sentences)):
+            try:
+                responses.append(decodeTokens(voc, tokens[:, i]))
+            except KeyError:
+                responses.append("I'm sorry, I don't understand that word.")
+        return responses
+    except Exception as e:
+        return [f"Error generating response: {str(e)}"] * len(sentences)
@@ -0,0 +1,167 @@
+"""Bounded per-session chat state.
+
+A ChatStore holds one record per chat message. UI state that used to live in
+scattered ``st.session_state`` keys (response times, reveal state, the
+in-progress flag, timing breakdowns) is kept on the record itself. Each record
+has a stable ``id`` that never changes, which is also the ``message_index``
+stored with feedback.
+
+Only the newest ``max_messages`` records (and at most ``max_bytes`` of them)
+stay live and are rendered. Older turns are compacted, which strips their UI
+state and keeps only what feedback rows need, then moved to a bounded archive.
+Long conversations therefore cost a fixed amount of memory and render time.
+"""
+
+import itertools
+import json
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from jerechat import instrumentation
+
+# Record fields that only drive the UI and are never saved with feedback
+UI_FIELDS = ("id", "response_times", "revealed", "processing", "timings")
+
+_stores: "weakref.WeakSet[ChatStore]" = weakref.WeakSet()
+_store_ids = itertools.count(1)
+
+
+def record_nbytes(record: Dict[str, Any]) -> int:
+    """Approximate size of a record as its UTF-8 JSON encoding."""
+    return len(json.dumps(record, default=str).encode("utf-8"))
+
+
+def compact(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the record without its UI-only fields."""
+    return {k: v for k, v in record.items() if k not in UI_FIELDS}
+
+
+class ChatStore:
+    """Live window of message records plus a bounded archive of old turns."""
+
+    def __init__(
+        self,
+        max_messages: int = 100,
+        max_bytes: int = 1 << 20,
+        max_archived: int = 500,
+    ):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.session = next(_store_ids)
+        self.messages: List[Dict[str, Any]] = []
+        self.archive: Deque[Dict[str, Any]] = deque(maxlen=max_archived)
+        self.archived_count = 0
+        self._next_id = 0
+        self._live_bytes = 0
+        self._archive_bytes = 0
+        _stores.add(self)
+
+    def add(self, role: str, **fields: Any) -> Dict[str, Any]:
+        """Append a new message record and compact if over the cap."""
+        record = {
+            "id": self._next_id,
+            "role": role,
+            "response_times": {},
+            "revealed": None,
+            "processing": False,
+            "timings": {},
+            **fields,
+        }
+        self._next_id += 1
+        self.messages.append(record)
+        self._live_bytes += record_nbytes(record)
+        self._compact()
+        _publish()
+        return record
+
+    def get(self, message_id: int) -> Optional[Dict[str, Any]]:
+        """Return the live record with this id, or None if archived/unknown."""
+        if not self.messages:
+            return None
+        position = message_id - self.messages[0]["id"]
+        if 0 <= position < len(self.messages):
+            return self.messages[position]
+        return None
+
+    def update(self, message_id: int, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Change fields of a live record in place."""
+        record = self.get(message_id)
+        if record is None:
+            return None
+        self._live_bytes -= record_nbytes(record)
+        record.update(fields)
+        self._live_bytes += record_nbytes(record)
+        return record
+
+    def replace(self, message_id: int, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Swap a record's message content, keeping its id and UI state."""
+        record = self.get(message_id)
+        if record is None:
+            return None
+        ui_state = {k: record[k] for k in UI_FIELDS if k in record}
+        self._live_bytes -= record_nbytes(record)
+        record.clear()
+        record.update(fields)
+        record.update(ui_state)
+        self._live_bytes += record_nbytes(record)
+        return record
+
+    def history(self, upto_id: int) -> List[Dict[str, Any]]:
+        """Messages up to and including ``upto_id``, as saved with feedback."""
+        return list(self.archive) + [
+            compact(record) for record in self.messages if record["id"] <= upto_id
+        ]
+
+    def nbytes(self) -> Dict[str, int]:
+        """Bytes held by this session's live and archived messages."""
+        return {
+            "live": self._live_bytes,
+            "archived": self._archive_bytes,
+            "total": self._live_bytes + self._archive_bytes,
+        }
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self.archive.clear()
+        self.archived_count = 0
+        self._live_bytes = 0
+        self._archive_bytes = 0
+        _publish()
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def _compact(self) -> None:
+        while self.messages and (
+            len(self.messages) > self.max_messages or self._live_bytes > self.max_bytes
+        ):
+            # Never leave the newest message out of the live window
+            if len(self.messages) == 1:
+                break
+            self._archive(self.messages.pop(0))
+            # Archive whole turns so the live window starts with a user message
+            while len(self.messages) > 1 and self.messages[0]["role"] != "user":
+                self._archive(self.messages.pop(0))
+
+    def _archive(self, record: Dict[str, Any]) -> None:
+        self._live_bytes -= record_nbytes(record)
+        self.archived_count += 1
+        if not self.archive.maxlen:
+            return
+        archived = compact(record)
+        if len(self.archive) == self.archive.maxlen:
+            self._archive_bytes -= record_nbytes(self.archive[0])
+        self.archive.append(archived)
+        self._archive_bytes += record_nbytes(archived)
+
+
+def session_bytes() -> Dict[int, int]:
+    """Total bytes per live session store, keyed by store id."""
+    return {store.session: store.nbytes()["total"] for store in list(_stores)}
+
+
+def _publish() -> None:
+    sizes = session_bytes()
+    instrumentation.set_gauge("session_state_sessions", len(sizes))
+    instrumentation.set_gauge("session_state_bytes", sum(sizes.values()))
@@ -0,0 +1,88 @@
+"""Single-flight deduplication of identical in-flight calls.
+
+When several callers ask for the same key at once, only the first (the
+leader) runs the computation; the others wait for it and share its result or
+exception. Keys are forgotten as soon as the call finishes, so this never
+caches results, it only coalesces concurrent work.
+
+Only ``Exception``s are shared. Control-flow exceptions such as Streamlit's
+``RerunException`` belong to the leader's own session. They are raised in
+the leader alone, and the waiters retry: one of them becomes the new
+leader.
+
+Every call is counted in the ``singleflight_requests_total`` counter and every
+call that attached to another caller's computation in
+``singleflight_coalesced_total``, both labelled by group name.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from jerechat import instrumentation
+
+# Set as a call's result when its leader stopped without a shareable outcome
+_RETRY = object()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """A table of in-flight calls keyed by what they compute."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` unless an identical call is in flight.
+
+        Returns ``(result, shared)`` where ``shared`` is True when the result
+        came from another caller's computation.
+        """
+        labels = {"group": self.name}
+        instrumentation.increment("singleflight_requests_total", labels=labels)
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                else:
+                    call.waiters += 1
+
+            if leader:
+                try:
+                    call.result = fn()
+                except Exception as e:
+                    call.error = e
+                except BaseException:
+                    call.result = _RETRY
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+            else:
+                instrumentation.increment(
+                    "singleflight_coalesced_total", labels=labels
+                )
+                call.done.wait()
+                if call.result is _RETRY:
+                    continue
+
+            if call.error is not None:
+                raise call.error
+            return call.result, not leader
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,14 @@
+"""Prompt normalization shared by every model path.
+
+Kept free of torch so the Streamlit app can normalize prompts (for example
+to build single-flight keys) without importing the model stack.
+"""
+
+import re
+
+
+def normalizeString(s):
+    s = s.lower()
+    s = re.sub(r"([.!?])", r" \1", s)
+    s = re.sub(r"[^a-zA-Z.!?]+", r" ", s)
+    return s
@@ -0,0 +1,105 @@
+"""Background warm-up of the heavy import stacks and model checkpoints.
+
+The Streamlit app imports torch (via the model code) and supabase lazily, so
+the invitation gate and landing page paint without waiting for them. Once a
+page has rendered, start_background_imports() imports them on a daemon
+thread. By the time the user asks a question or saves feedback, the modules
+are usually already in sys.modules.
+
+warm_up_model() runs a few representative decodes at each batch size. This
+way the first real request does not pay for first-call kernel selection and
+allocator growth. The inference server and the model cache call it before a
+model is reported ready.
+"""
+
+import importlib
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from constants import MAX_LENGTH
+from jerechat import instrumentation
+from jerechat.text import normalizeString
+
+HEAVY_MODULES = ("torch", "jerechat.rampion2_model", "supabase")
+
+WARMUP_PROMPTS = (
+    "hello",
+    "tell me a joke",
+    "what is your name ?",
+    "how are you doing today ?",
+    "where do you live ?",
+)
+
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+import_seconds: Dict[str, float] = {}
+
+
+def import_modules(modules: Sequence[str] = HEAVY_MODULES) -> Dict[str, float]:
+    """Import each module, returning the seconds each one took.
+
+    Modules that are not installed are skipped; the feature that needs them
+    reports its own error when it is used.
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        timings[name] = time.perf_counter() - start
+        instrumentation.observe("warmup_import", timings[name])
+    return timings
+
+
+def start_background_imports(
+    modules: Sequence[str] = HEAVY_MODULES,
+) -> threading.Thread:
+    """Start importing ``modules`` on a daemon thread, once per process."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(
+                target=lambda: import_seconds.update(import_modules(modules)),
+                name="jerechat-warmup",
+                daemon=True,
+            )
+            _thread.start()
+        return _thread
+
+
+def warm_up_model(
+    model_id: str,
+    searcher: Any,
+    voc: Any,
+    batch_sizes: Sequence[int] = (1,),
+    rounds: int = 2,
+    max_length: int = MAX_LENGTH,
+) -> float:
+    """Decode representative prompts at each batch size; returns seconds taken.
+
+    Batch size 1 also goes through the single-prompt path that the app uses.
+    """
+    from jerechat import rampion2_model
+
+    start = time.perf_counter()
+    for batch_size in batch_sizes:
+        sentences = [
+            normalizeString(WARMUP_PROMPTS[i % len(WARMUP_PROMPTS)])
+            for i in range(batch_size)
+        ]
+        for _ in range(rounds):
+            if batch_size == 1:
+                rampion2_model.generate_response(searcher, voc, sentences[0], max_length)
+            rampion2_model.generate_responses(searcher, voc, sentences, max_length)
+    seconds = time.perf_counter() - start
+    instrumentation.set_gauge("model_warmup_seconds", seconds, labels={"model": model_id})
+    print(
+        f"Warmed up {model_id} in {seconds:.2f}s "
+        f"(batch sizes {', '.join(map(str, batch_sizes))})",
+        flush=True,
+    )
+    return seconds
+
@@ -0,0 +1,461 @@
+"""Multi-process inference pool with CPU pinning and torch thread budgets.
+
+Each worker process is pinned to its own set of cores and capped at a fixed
+number of intra-op threads, so concurrent sessions stop oversubscribing the
+host. On Linux the checkpoints are loaded once in the parent and shared with
+the workers copy-on-write through ``fork``; elsewhere each worker loads its
+own copy. Requests go to the worker with the fewest outstanding requests.
+Each worker warms its models up after pinning itself (see
+``jerechat.warmup``) and reports back; the pool is ready once all have.
+
+Sweep workers x threads to find the throughput/latency knee on a host:
+
+    python -m jerechat.worker_pool --sweep --workers 1,2,4 --threads 1,2,4
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from constants import DEFAULT_CHECKPOINT_PATH, MAX_LENGTH, MODEL_RAMPION2
+from jerechat import instrumentation
+
+MAX_WORKER_BATCH = 8
+# Seconds between checks that every worker process is still alive
+WORKER_CHECK_INTERVAL = 0.5
+
+
+def plan_cpu_sets(num_workers: int, threads_per_worker: int) -> List[List[int]]:
+    """Split the cores this process may use into one set per worker."""
+    try:
+        available = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        available = list(range(os.cpu_count() or 1))
+    cpu_sets = []
+    for i in range(num_workers):
+        start = (i * threads_per_worker) % len(available)
+        cpus = [
+            available[(start + j) % len(available)] for j in range(threads_per_worker)
+        ]
+        cpu_sets.append(sorted(set(cpus)))
+    return cpu_sets
+
+
+def configure_worker(cpus: Optional[Sequence[int]], threads: int) -> None:
+    """Pin the current process and set its torch thread budget."""
+    import torch
+
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already fixed for this process (e.g. inherited through fork)
+        pass
+
+
+def _warm_up(loaded, warmup_batch_sizes) -> Dict[str, float]:
+    from jerechat.warmup import warm_up_model
+
+    return {
+        model_id: warm_up_model(model_id, searcher, voc, warmup_batch_sizes)
+        for model_id, (searcher, voc) in loaded.items()
+        if searcher is not None and voc is not None
+    }
+
+
+def _worker_main(
+    index,
+    cpus,
+    threads,
+    models,
+    preloaded,
+    warmup_batch_sizes,
+    load_options,
+    requests,
+    results,
+):
+    from jerechat import rampion2_model
+
+    configure_worker(cpus, threads)
+    loaded = preloaded or {
+        model_id: rampion2_model.load_model(path, **load_options)
+        for model_id, path in models.items()
+    }
+    timings = _warm_up(loaded, warmup_batch_sizes) if warmup_batch_sizes else {}
+    # A request id of None reports this worker's status: warm, and which
+    # models it actually has loaded
+    results.put((None, True, (index, timings, _loaded_ids(loaded)), 0.0))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        if item[0] == "reload":
+            _reload(index, loaded, item, warmup_batch_sizes, load_options, results)
+            continue
+
+        batch = [item]
+        control = None
+        while len(batch) < MAX_WORKER_BATCH:
+            try:
+                extra = requests.get_nowait()
+            except queue.Empty:
+                break
+            if extra is None or extra[0] == "reload":
+                # Handled right after this batch, before anything queued
+                # behind it, so later requests see the new weights
+                control = extra
+                break
+            batch.append(extra)
+
+        groups: Dict[Tuple[str, int], List[Tuple]] = {}
+        for request in batch:
+            _, _, model_id, _, max_length = request
+            groups.setdefault((model_id, max_length), []).append(request)
+
+        for (model_id, max_length), group in groups.items():
+            start = time.perf_counter()
+            searcher, voc = loaded.get(model_id, (None, None))
+            if searcher is None or voc is None:
+                for request in group:
+                    results.put((request[1], False, f"Unknown model: {model_id}", 0.0))
+                continue
+            sentences = [rampion2_model.normalizeString(r[3]) for r in group]
+            responses = rampion2_model.generate_responses(
+                searcher, voc, sentences, max_length
+            )
+            elapsed = time.perf_counter() - start
+            for request, response in zip(group, responses):
+                results.put((request[1], True, response, elapsed))
+
+        if control is None:
+            continue
+        if control[0] == "reload":
+            _reload(index, loaded, control, warmup_batch_sizes, load_options, results)
+        else:
+            break
+
+
+def _loaded_ids(loaded) -> List[str]:
+    return sorted(
+        model_id
+        for model_id, (searcher, voc) in loaded.items()
+        if searcher is not None and voc is not None
+    )
+
+
+def _reload(index, loaded, item, warmup_batch_sizes, load_options, results) -> None:
+    """Swap in a new checkpoint; on failure the old one keeps serving."""
+    from jerechat import rampion2_model
+
+    _, model_id, path = item
+    timings = {}
+    searcher, voc = rampion2_model.load_model(path, **load_options)
+    if searcher is not None and voc is not None:
+        if warmup_batch_sizes:
+            timings = _warm_up({model_id: (searcher, voc)}, warmup_batch_sizes)
+        loaded[model_id] = (searcher, voc)
+    results.put((None, True, (index, timings, _loaded_ids(loaded)), 0.0))
+
+
+class InferencePool:
+    """N pinned worker processes serving generate requests for several models."""
+
+    def __init__(
+        self,
+        models: Dict[str, str],
+        num_workers: int = 2,
+        threads_per_worker: int = 1,
+        pin_cpus: bool = True,
+        warmup_batch_sizes: Sequence[int] = (),
+        load_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.models = dict(models)
+        load_options = load_options or {}
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.warmup_seconds: Dict[str, float] = {}
+        self._ready = [threading.Event() for _ in range(num_workers)]
+        self._ctx = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        self._results = self._ctx.Queue()
+        self._requests = [self._ctx.Queue() for _ in range(num_workers)]
+        self._outstanding = [0] * num_workers
+        # Models each worker reported loaded; None until it is warm
+        self._loaded: List[Optional[Set[str]]] = [None] * num_workers
+        self._alive = [True] * num_workers
+        self._closing = False
+        self._owner: Dict[int, int] = {}
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+        preloaded = None
+        if self._ctx.get_start_method() == "fork":
+            from jerechat import rampion2_model
+
+            # Loaded once here; workers share the weights copy-on-write
+            preloaded = {
+                model_id: rampion2_model.load_model(path, **load_options)
+                for model_id, path in self.models.items()
+            }
+
+        cpu_sets = (
+            plan_cpu_sets(num_workers, threads_per_worker)
+            if pin_cpus
+            else [None] * num_workers
+        )
+        self._processes = []
+        for i in range(num_workers):
+            process = self._ctx.Process(
+                target=_worker_main,
+                args=(
+                    i,
+                    cpu_sets[i],
+                    threads_per_worker,
+                    self.models,
+                    preloaded,
+                    tuple(warmup_batch_sizes),
+                    load_options,
+                    self._requests[i],
+                    self._results,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, model: str, prompt: str, max_length: int = MAX_LENGTH) -> Future:
+        """Queue a prompt on the least-loaded worker and return a Future."""
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            alive = [i for i in range(self.num_workers) if self._alive[i]]
+            if not alive:
+                future.set_exception(RuntimeError("Every pool worker has exited"))
+                return future
+            worker = min(alive, key=self._outstanding.__getitem__)
+            self._outstanding[worker] += 1
+            self._owner[request_id] = worker
+            self._futures[request_id] = future
+        self._requests[worker].put(("generate", request_id, model, prompt, max_length))
+        return future
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        max_length: int = MAX_LENGTH,
+        timeout: Optional[float] = None,
+    ) -> str:
+        return self.submit(model, prompt, max_length).result(timeout)
+
+    def reload(self, model: str, checkpoint_path: str) -> None:
+        """Ask every worker to load a new checkpoint after its queued work."""
+        self.models[model] = checkpoint_path
+        for requests in self._requests:
+            requests.put(("reload", model, checkpoint_path))
+
+    def is_ready(self) -> bool:
+        return all(event.is_set() for event in self._ready)
+
+    def loaded_models(self) -> Set[str]:
+        """Models every live worker has loaded (empty until the pool is warm)."""
+        with self._lock:
+            reports = [
+                loaded
+                for loaded, alive in zip(self._loaded, self._alive)
+                if alive and loaded is not None
+            ]
+        if not reports:
+            return set()
+        return set.intersection(*reports)
+
+    def alive_workers(self) -> int:
+        with self._lock:
+            return sum(self._alive)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until every worker has loaded and warmed its models."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for event in self._ready:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not event.wait(remaining):
+                return False
+        return True
+
+    def load(self) -> List[int]:
+        with self._lock:
+            return list(self._outstanding)
+
+    def close(self) -> None:
+        self._closing = True
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join()
+        self._results.put(None)
+        self._collector.join()
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                item = self._results.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if item is None:
+                break
+            request_id, ok, payload, _ = item
+            if request_id is None:
+                worker, timings, loaded = payload
+                # Report the slowest worker's warm-up for each model
+                for model_id, seconds in timings.items():
+                    self.warmup_seconds[model_id] = max(
+                        seconds, self.warmup_seconds.get(model_id, 0.0)
+                    )
+                with self._lock:
+                    self._loaded[worker] = set(loaded)
+                self._ready[worker].set()
+                continue
+            with self._lock:
+                future = self._futures.pop(request_id, None)
+                if future is None:
+                    # Already failed when its worker was found dead
+                    continue
+                worker = self._owner.pop(request_id)
+                self._outstanding[worker] -= 1
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+            self._check_workers()
+
+    def _check_workers(self) -> None:
+        """Fail the outstanding requests of workers that exited unexpectedly."""
+        if self._closing:
+            return
+        for worker, process in enumerate(self._processes):
+            if not self._alive[worker] or process.is_alive():
+                continue
+            with self._lock:
+                self._alive[worker] = False
+                orphans = [
+                    request_id
+                    for request_id, owner in self._owner.items()
+                    if owner == worker
+                ]
+                futures = [self._futures.pop(request_id) for request_id in orphans]
+                for request_id in orphans:
+                    del self._owner[request_id]
+                self._outstanding[worker] = 0
+            print(f"Inference worker {worker} exited with code {process.exitcode}")
+            instrumentation.increment("worker_pool_exits_total")
+            error = RuntimeError(
+                f"Inference worker {worker} exited with code {process.exitcode}"
+            )
+            for future in futures:
+                future.set_exception(error)
+            # Nothing to wait for from a worker that will never warm up
+            self._ready[worker].set()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_sweep(
+    checkpoint_path: str,
+    worker_counts: Sequence[int],
+    thread_counts: Sequence[int],
+    num_requests: int = 200,
+    concurrency: int = 16,
+    prompts: Sequence[str] = ("hello", "tell a joke", "what is your name ?"),
+) -> List[Dict[str, Any]]:
+    """Measure throughput and latency for every workers x threads combination."""
+    rows = []
+    for num_workers, threads in itertools.product(worker_counts, thread_counts):
+        pool = InferencePool(
+            {MODEL_RAMPION2: checkpoint_path}, num_workers, threads
+        )
+        pool.generate(MODEL_RAMPION2, prompts[0])
+
+        def timed(i: int) -> float:
+            start = time.perf_counter()
+            pool.generate(MODEL_RAMPION2, prompts[i % len(prompts)])
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            latencies = list(executor.map(timed, range(num_requests)))
+        wall = time.perf_counter() - start
+        pool.close()
+
+        rows.append(
+            {
+                "workers": num_workers,
+                "threads": threads,
+                "throughput": num_requests / wall,
+                "p50": statistics.median(latencies),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+            }
+        )
+    return rows
+
+
+def find_knee(rows: List[Dict[str, Any]], latency_slack: float = 1.5) -> Dict[str, Any]:
+    """Highest-throughput configuration whose p95 stays near the best p95."""
+    best_p95 = min(row["p95"] for row in rows)
+    candidates = [row for row in rows if row["p95"] <= best_p95 * latency_slack]
+    return max(candidates, key=lambda row: row["throughput"])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="JereChat inference worker pool")
+    parser.add_argument("--sweep", action="store_true", help="Run the benchmark sweep")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--threads", default="1,2")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    if not args.sweep:
+        parser.print_help()
+        return
+
+    rows = run_sweep(
+        args.checkpoint,
+        [int(n) for n in args.workers.split(",")],
+        [int(n) for n in args.threads.split(",")],
+        args.requests,
+        args.concurrency,
+    )
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        print(
+            f"{row['workers']:>7} {row['threads']:>7} {row['throughput']:>9.1f} "
+            f"{row['p50'] * 1000:>8.1f} {row['p95'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f}"
+        )
+    knee = find_knee(rows)
+    print(f"Knee: {knee['workers']} workers x {knee['threads']} threads")
+
+
+if __name__ == "__main__":
+    main()
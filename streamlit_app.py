@@ -1,15 +1,21 @@
 import datetime
+import math
 import re
+import threading
 import time
-from typing import Any, Dict, List, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+from typing import Any, Dict, List, Optional, Tuple
 
 import streamlit as st
 import streamlit.components.v1 as components
-from supabase import Client, create_client
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 import jerechat as jc
 from constants import (
     DEFAULT_CHECKPOINT_PATH,
+    MAX_LENGTH,
     MODEL_17PRO,
     MODEL_17PRO_DISPLAY,
     MODEL_RAMPION2,
@@ -19,11 +25,21 @@ from constants import (
 )
 from database import (
     get_ab_test_results,
+    get_feedback_version,
     get_response_time_stats,
+    iter_feedback_rows,
     save_original_feedback,
     save_preference_feedback,
 )
-from jerechat import ab_testing, rampion2_model
+from jerechat import ab_testing, instrumentation, warmup
+from jerechat.admission import AdmissionController, OverloadedError
+from jerechat.conversation import ConversationContext
+from jerechat.inference_client import InferenceClient
+from jerechat.invitations import AttemptLimiter, get_invitation_index
+from jerechat.model_cache import ModelCache, ModelSpec, checkpoint_loader, parse_catalog
+from jerechat.session_store import ChatStore
+from jerechat.text import normalizeString
+from jerechat.singleflight import SingleFlight
 
 st.set_page_config(
     page_title="JereChat", page_icon="✨", initial_sidebar_state="expanded"
@@ -78,6 +94,196 @@ st.iframe(
 )
 
 
+def get_model_catalog() -> Dict[str, ModelSpec]:
+    """Models the app can serve, from the ``[models]`` secrets table.
+
+    Without one, the catalog is the two bundled checkpoints, which
+    ``rampion2_checkpoint_path`` and ``pro17_checkpoint_path`` can override.
+    """
+    configured = st.secrets.get("models")
+    if configured:
+        return parse_catalog(configured)
+    return {
+        MODEL_RAMPION2: ModelSpec(
+            MODEL_RAMPION2,
+            st.secrets.get("rampion2_checkpoint_path", DEFAULT_CHECKPOINT_PATH),
+            MODEL_RAMPION2_DISPLAY,
+        ),
+        MODEL_17PRO: ModelSpec(
+            MODEL_17PRO,
+            st.secrets.get("pro17_checkpoint_path", PRO17_CHECKPOINT_PATH),
+            MODEL_17PRO_DISPLAY,
+        ),
+    }
+
+
+def get_checkpoint_path(model_version):
+    """Return the configured checkpoint path for a model version."""
+    return get_model_catalog()[model_version].checkpoint
+
+
+def get_arena_models() -> Tuple[List[str], int]:
+    """The models to draw comparisons from and how many arms each one shows.
+
+    ``arena_models`` lists catalog ids to draw from (default: the whole
+    catalog); ``arena_size`` is the number of arms per message (default 2).
+    """
+    catalog = get_model_catalog()
+    models = [m for m in st.secrets.get("arena_models", list(catalog)) if m in catalog]
+    return models, max(2, min(int(st.secrets.get("arena_size", 2)), len(models)))
+
+
+@st.cache_resource
+def get_allocator() -> Optional[ab_testing.AdaptiveAllocator]:
+    """Process-wide adaptive arm allocator, if ``adaptive_allocation`` is on."""
+    if not st.secrets.get("adaptive_allocation", False):
+        return None
+    return ab_testing.AdaptiveAllocator(
+        lambda after_id: iter_feedback_rows(
+            "id, model_version, feedback_type, response_time, weight", after_id
+        ),
+        sync_interval=float(st.secrets.get("allocation_sync_seconds", 300)),
+        epsilon=float(st.secrets.get("allocation_epsilon", 0.1)),
+        cost_per_second=float(st.secrets.get("allocation_cost_per_second", 0.0)),
+    )
+
+
+def get_load_options() -> Dict[str, Any]:
+    """Keyword arguments for ``rampion2_model.load_model`` from the secrets."""
+    return {
+        "shortlist_size": st.secrets.get("shortlist_size"),
+        "shortlist_threshold": float(st.secrets.get("shortlist_threshold", 0.5)),
+    }
+
+
+@st.cache_resource
+def _create_model_cache(
+    budget_bytes: int,
+    warmup_batch_sizes: Tuple[int, ...],
+    load_options: Tuple[Tuple[str, Any], ...],
+) -> ModelCache:
+    loader = checkpoint_loader(warmup_batch_sizes, **dict(load_options))
+    return ModelCache({}, budget_bytes, loader)
+
+
+def get_model_cache() -> ModelCache:
+    """Process-wide cache of loaded models, shared by every session.
+
+    Each model loads (and, unless ``model_warmup`` is off, warms up) on
+    first use. The least recently used models are evicted once the cache
+    holds more than ``model_cache_budget_mb``. A catalog change hot-reloads
+    the affected models in the background.
+    """
+    batch_sizes = ()
+    if st.secrets.get("model_warmup", True):
+        batch_sizes = tuple(int(n) for n in st.secrets.get("warmup_batch_sizes", [1]))
+    cache = _create_model_cache(
+        int(float(st.secrets.get("model_cache_budget_mb", 2048)) * 1024 * 1024),
+        batch_sizes,
+        tuple(sorted(get_load_options().items())),
+    )
+    cache.set_catalog(get_model_catalog())
+    return cache
+
+
+class SpeculativeStats:
+    """Process-wide speculative decoding counters, and why it was refused."""
+
+    def __init__(self):
+        self.drafted = 0
+        self.accepted = 0
+        self.refused: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add(self, searcher) -> None:
+        with self._lock:
+            self.drafted += searcher.drafted
+            self.accepted += searcher.accepted
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+
+@st.cache_resource
+def get_speculative_stats() -> SpeculativeStats:
+    return SpeculativeStats()
+
+
+def get_speculative_models() -> Optional[Tuple[str, str]]:
+    """The ``(target, draft)`` catalog ids to decode speculatively, if enabled.
+
+    ``speculative_target_model`` (default 1.7 Pro) is decoded with
+    ``speculative_draft_model`` (default Rampion 2) as the draft. Returns
+    None when ``speculative_decoding`` is off or either id is not in the
+    catalog.
+    """
+    if not st.secrets.get("speculative_decoding", False):
+        return None
+    catalog = get_model_catalog()
+    target = st.secrets.get("speculative_target_model", MODEL_17PRO)
+    draft = st.secrets.get("speculative_draft_model", MODEL_RAMPION2)
+    if target not in catalog or draft not in catalog:
+        return None
+    return target, draft
+
+
+def get_speculative_searcher(draft, target):
+    """Return a searcher for ``target`` that drafts with ``draft``.
+
+    ``draft`` and ``target`` are pinned ``(searcher, voc)`` pairs. The
+    searcher is built for this one decode (construction is cheap), so it
+    never keeps a model alive after the cache evicts it. Returns None when
+    the vocabularies differ; the refusal is shown in the debug sidebar.
+    """
+    from jerechat import rampion2_model
+
+    num_draft_tokens = int(st.secrets.get("speculative_draft_tokens", 4))
+    try:
+        searcher = rampion2_model.SpeculativeGreedySearchDecoder(
+            draft[0], target[0], draft[1], target[1], num_draft_tokens
+        )
+    except ValueError as e:
+        stats = get_speculative_stats()
+        if stats.refused is None:
+            print(f"Speculative decoding disabled: {e}")
+        stats.refused = str(e)
+        return None
+    get_speculative_stats().refused = None
+    return searcher
+
+
+def start_background_warmup() -> None:
+    """Import torch and supabase, and load the arena models, once a page has painted."""
+    if not st.secrets.get("background_warmup", True):
+        return
+    if st.secrets.get("inference_server_address"):
+        # Generation runs in the inference server; only feedback needs warming
+        warmup.start_background_imports(("supabase",))
+        return
+    warmup.start_background_imports(warmup.HEAVY_MODULES)
+    if st.secrets.get("model_warmup", True):
+        get_model_cache().start_preload(tuple(get_arena_models()[0]))
+
+
+@st.cache_resource
+def get_attempt_limiter() -> AttemptLimiter:
+    """Process-wide limit on invitation code attempts per client."""
+    return AttemptLimiter(
+        max_attempts=int(st.secrets.get("invitation_max_attempts", 5)),
+        window=float(st.secrets.get("invitation_attempt_window", 60.0)),
+    )
+
+
+def get_client_id() -> str:
+    """Identify the client for rate limiting: its IP, else its session."""
+    ip_address = st.context.ip_address
+    if isinstance(ip_address, str) and ip_address:
+        return ip_address
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "anonymous"
+
+
 def check_invitation_code():
     """Check if user has entered a valid and not expired invitation code."""
     if "invitation_verified" not in st.session_state:
@@ -137,32 +343,46 @@ def check_invitation_code():
                 submitted = st.form_submit_button("Submit")
 
             if submitted:
-                code_found = False
-                today = datetime.date.today()
-
-                for code_info in valid_codes:
-                    if code == code_info["code_number"]:
-                        code_found = True
-                        expiry_date = datetime.datetime.strptime(
-                            code_info["code_expiry_date"], "%Y-%m-%d"
-                        ).date()
-                        if today > expiry_date:
-                            st.error(
-                                f"❌ This invitation code expired on {expiry_date}. Please request a new one."
-                            )
-                        else:
-                            st.session_state.invitation_verified = True
-                            st.session_state.active_code = code_info
-                            st.rerun()
-                        break
-
-                if not code_found:
-                    st.error("❌ Invalid invitation code. Please try again.")
+                client_id = get_client_id()
+                retry_after = get_attempt_limiter().attempt(client_id)
+                if retry_after:
+                    instrumentation.increment(
+                        "invitation_attempts_total", labels={"result": "rate_limited"}
+                    )
+                    st.error(
+                        f"❌ Too many attempts. Please try again in {math.ceil(retry_after)} seconds."
+                    )
+                else:
+                    with instrumentation.span("invitation_check"):
+                        invitation = get_invitation_index(valid_codes).get(code)
+
+                    if invitation is None:
+                        instrumentation.increment(
+                            "invitation_attempts_total", labels={"result": "invalid"}
+                        )
+                        st.error("❌ Invalid invitation code. Please try again.")
+                    elif invitation.is_expired():
+                        instrumentation.increment(
+                            "invitation_attempts_total", labels={"result": "expired"}
+                        )
+                        st.error(
+                            f"❌ This invitation code expired on {invitation.expiry_date}. Please request a new one."
+                        )
+                    else:
+                        instrumentation.increment(
+                            "invitation_attempts_total", labels={"result": "accepted"}
+                        )
+                        get_attempt_limiter().reset(client_id)
+                        st.session_state.invitation_verified = True
+                        st.session_state.active_code = invitation.info
+                        st.rerun()
 
         with st.sidebar:
             st.markdown("## Don't have an invitation code?")
             st.info("Please contact Jeremy to obtain an invitation code.")
 
+        start_background_warmup()
+
         # Prevent the rest of the app from running
         st.stop()
 
@@ -170,17 +390,118 @@ def check_invitation_code():
 # Check invitation code before showing the app
 check_invitation_code()
 
+@st.cache_data(ttl=float(st.secrets.get("stats_cache_ttl", 60)), show_spinner=False)
+def load_ab_test_results(
+    feedback_version: int, models: Tuple[str, ...]
+) -> Dict[str, Dict[str, float]]:
+    """Shared A/B results, refetched only after new feedback (or the TTL)."""
+    return get_ab_test_results(models)
+
+
+@st.cache_resource
+def get_preference_analytics():
+    """Process-wide ratings engine; each refresh only reads new feedback rows."""
+    # Imported here so the first paint does not wait for NumPy
+    from jerechat.preference_analytics import PreferenceAnalytics
+
+    return PreferenceAnalytics()
+
+
+@st.cache_data(ttl=float(st.secrets.get("stats_cache_ttl", 60)), show_spinner=False)
+def load_preference_report(feedback_version: int) -> Dict[str, Any]:
+    """Shared ratings report, recomputed only after new feedback (or the TTL)."""
+    from jerechat.preference_analytics import ANALYTICS_COLUMNS
+
+    analytics = get_preference_analytics()
+    analytics.refresh(
+        lambda after_id: iter_feedback_rows(ANALYTICS_COLUMNS, after_id)
+    )
+    return analytics.report(int(st.secrets.get("rating_bootstrap_samples", 200)))
+
+
+@st.fragment(run_every=st.secrets.get("stats_refresh_seconds", 30) or None)
+def render_ab_dashboard() -> None:
+    """Sidebar A/B dashboard; refreshes on its own without a full rerun."""
+    with st.expander("📊 A/B Test Dashboard", expanded=False):
+        st.markdown("### Preference Stats")
+        try:
+            # Arena models first, then the rest of the catalog
+            catalog = get_model_catalog()
+            arena = get_arena_models()[0]
+            models = tuple(arena + [m for m in catalog if m not in arena])
+            ab_results = load_ab_test_results(get_feedback_version(), models)
+
+            # One row per model: its preference counts and rate
+            for model in models:
+                stats = ab_results[model]
+                st.markdown(f"#### {catalog[model].display_name}")
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("👍 Preferred", f"{stats['good']:g}")
+                with col2:
+                    st.metric("👎 Not Preferred", f"{stats['bad']:g}")
+                total = stats["good"] + stats["bad"]
+                if total > 0:
+                    st.metric("Preference Rate", f"{stats['good'] / total * 100:.1f}%")
+
+            report = load_preference_report(get_feedback_version())
+            if report["ratings"]:
+                st.markdown("### Ratings")
+                ranked = sorted(
+                    report["ratings"].items(), key=lambda item: -item[1]["rating"]
+                )
+                for model, rating in ranked:
+                    spec = catalog.get(model)
+                    interval = (
+                        f" ({rating['low']:.0f}–{rating['high']:.0f})"
+                        if "low" in rating
+                        else ""
+                    )
+                    st.caption(
+                        f"{spec.display_name if spec is not None else model}: "
+                        f"{rating['rating']:.0f}{interval}, "
+                        f"{rating['wins']} of {rating['comparisons']} won"
+                    )
+                for decision in report["decisions"]:
+                    if decision["decision"] != "continue":
+                        first, second = (
+                            catalog[m].display_name if m in catalog else m
+                            for m in decision["pair"]
+                        )
+                        st.caption(f"{first} vs {second}: {decision['decision']}")
+
+            allocator = get_allocator()
+            if allocator is not None:
+                st.markdown("### Allocation")
+                for model, arm in sorted(allocator.snapshot().items()):
+                    spec = catalog.get(model)
+                    st.caption(
+                        f"{spec.display_name if spec is not None else model}: "
+                        f"{arm['preference_rate']:.0%} preferred "
+                        f"({arm['good']:g} of {arm['good'] + arm['bad']:g}), "
+                        f"{arm['latency']:.2f}s mean response"
+                    )
+
+        except Exception as e:
+            st.warning(f"Could not load stats: {e}")
+
+
 # -----------------------------------------------------------------------------
 # Sidebar with 'My Code' section
 with st.sidebar:
     st.markdown("## My Code")
-    if "active_code" in st.session_state and st.session_state.active_code:
-        code_info = st.session_state.active_code
-        expiry_date = datetime.datetime.strptime(
-            code_info["code_expiry_date"], "%Y-%m-%d"
-        ).date()
+    invitation = (
+        get_invitation_index(st.secrets.get("invitation_codes", [])).get(
+            st.session_state.active_code.get("code_number")
+        )
+        if "active_code" in st.session_state and st.session_state.active_code
+        else None
+    )
+    if invitation is not None:
+        code_info = invitation.info
+        expiry_date = invitation.expiry_date
         today = datetime.date.today()
-        days_remaining = (expiry_date - today).days
+        days_remaining = invitation.days_remaining(today)
 
         status = "✅ Valid" if today <= expiry_date else "❌ Expired"
         status_color = "green" if today <= expiry_date else "red"
@@ -208,115 +529,270 @@ with st.sidebar:
     st.divider()
 
     # A/B Testing Monitoring Dashboard
-    with st.expander("📊 A/B Test Dashboard", expanded=False):
-        st.markdown("### Preference Stats")
-        try:
-            ab_results = get_ab_test_results()
-
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown(f"#### {MODEL_17PRO_DISPLAY}")
-                st.metric("👍 Preferred", ab_results[MODEL_17PRO]["good"])
-                st.metric("👎 Not Preferred", ab_results[MODEL_17PRO]["bad"])
-
-            with col2:
-                st.markdown(f"#### {MODEL_RAMPION2_DISPLAY}")
-                st.metric("👍 Preferred", ab_results[MODEL_RAMPION2]["good"])
-                st.metric("👎 Not Preferred", ab_results[MODEL_RAMPION2]["bad"])
-
-            # Calculate preference rate
-            total_15pro = (
-                ab_results[MODEL_17PRO]["good"] + ab_results[MODEL_17PRO]["bad"]
-            )
-            total_r2 = (
-                ab_results[MODEL_RAMPION2]["good"] + ab_results[MODEL_RAMPION2]["bad"]
-            )
-
-            if total_15pro > 0:
-                rate_15pro = (ab_results[MODEL_17PRO]["good"] / total_15pro) * 100
-                st.metric(
-                    f"{MODEL_17PRO_DISPLAY} Preference Rate", f"{rate_15pro:.1f}%"
-                )
-
-            if total_r2 > 0:
-                rate_r2 = (ab_results[MODEL_RAMPION2]["good"] / total_r2) * 100
-                st.metric(
-                    f"{MODEL_RAMPION2_DISPLAY} Preference Rate", f"{rate_r2:.1f}%"
-                )
-
-        except Exception as e:
-            st.warning(f"Could not load stats: {e}")
+    render_ab_dashboard()
 
 # -----------------------------------------------------------------------------
 # Constants (keeping UI-related constants)
 HISTORY_LENGTH = 5
 DEBUG_MODE = st.query_params.get("debug", "false").lower() == "true"
 
+if st.secrets.get("tracing", False):
+    instrumentation.enable()
+if st.secrets.get("trace_jsonl_path"):
+    instrumentation.set_jsonl_sink(st.secrets.get("trace_jsonl_path"))
+
+if DEBUG_MODE:
+    with st.sidebar:
+        with st.expander("Metrics", expanded=False):
+            st.code(instrumentation.export_prometheus(), language="text")
+
 # -----------------------------------------------------------------------------
 # Model response generation
 
 
-def get_response(prompt, model_version):
-    """Generate response using specified model"""
-    start_time = time.time()
+@st.cache_resource
+def get_inference_client() -> Optional[InferenceClient]:
+    """Return a pooled client for the inference server, if one is configured."""
+    address = st.secrets.get("inference_server_address")
+    if not address:
+        return None
+    return InferenceClient(
+        address,
+        pool_size=int(st.secrets.get("inference_server_pool_size", 4)),
+        timeout=float(st.secrets.get("inference_server_timeout", 30.0)),
+    )
 
-    try:
-        if model_version == MODEL_RAMPION2:
-            checkpoint_path = st.secrets.get(
-                "rampion2_checkpoint_path", DEFAULT_CHECKPOINT_PATH
-            )
 
-            if "rampion2_model" not in st.session_state:
-                with st.spinner("Loading Rampion 2 model..."):
-                    searcher, voc = rampion2_model.load_model(checkpoint_path)
-                    if searcher and voc:
-                        st.session_state.rampion2_model = (searcher, voc)
-                    else:
-                        return None, None
+@st.cache_resource
+def get_inflight_responses() -> SingleFlight:
+    """Process-wide table of in-flight generations, shared by all sessions."""
+    return SingleFlight("generate")
 
-            searcher, voc = st.session_state.rampion2_model
-            normalized_prompt = rampion2_model.normalizeString(prompt)
-            response_text = rampion2_model.generate_response(
-                searcher, voc, normalized_prompt
-            )
-        elif model_version == MODEL_17PRO:
-            # NEW: Load 1.7 Pro using 4000_checkpoint.tar
-            checkpoint_path = st.secrets.get(
-                "pro17_checkpoint_path", PRO17_CHECKPOINT_PATH
-            )
 
-            if "pro17_model" not in st.session_state:
-                with st.spinner("Loading JereChat 1.7 Pro..."):
-                    searcher, voc = rampion2_model.load_model(checkpoint_path)
-                    if searcher and voc:
-                        st.session_state.pro17_model = (searcher, voc)
-                    else:
-                        return None, None
+@st.cache_resource
+def get_admission_controller() -> AdmissionController:
+    """Process-wide limit on concurrent generations across all sessions."""
+    return AdmissionController(
+        max_concurrent=int(st.secrets.get("max_concurrent_generations", 4)),
+        max_queue=int(st.secrets.get("max_queued_generations", 16)),
+        timeout=float(st.secrets.get("generation_queue_timeout", 10.0)),
+        fair=bool(st.secrets.get("fair_queuing", True)),
+    )
 
-            searcher, voc = st.session_state.pro17_model
-            normalized_prompt = rampion2_model.normalizeString(prompt)
-            response_text = rampion2_model.generate_response(
-                searcher, voc, normalized_prompt
-            )
-            # If bad words in the response text, remove
-            # Get list of bad words from secrets
-            bad_words = st.secrets.get("bad_words", [])
-            # Replace each bad word with asterisks
-            for word in bad_words:
-                if word.lower() in response_text.lower():
-                    # Create a regex pattern that matches the word with any capitalization
-                    pattern = re.compile(re.escape(word), re.IGNORECASE)
-                    # Replace with asterisks of same length
-                    response_text = pattern.sub("*", response_text)
+
+def get_conversation_context(model_version) -> Optional[ConversationContext]:
+    """Return this session's encoder-state context for a model, if enabled.
+
+    Context is only kept for in-process decoding; the inference server is
+    stateless across requests.
+    """
+    if not st.secrets.get("conversation_context", False):
+        return None
+    if get_inference_client() is not None:
+        return None
+    contexts = st.session_state.setdefault("conversation_contexts", {})
+    if model_version not in contexts:
+        contexts[model_version] = ConversationContext(
+            HISTORY_LENGTH,
+            int(st.secrets.get("conversation_context_max_bytes", 1 << 20)),
+        )
+    return contexts[model_version]
+
+
+def generate_local(
+    prompt, model_version, memory=None, normalized_prompt=None, memory_version=None
+):
+    """Generate a response in-process with the shared, cached model.
+
+    The model is pinned in the model cache while it decodes, so it cannot
+    be evicted mid-request. With ``memory`` (earlier turns' encoder outputs)
+    the decoder also attends over previous turns, unless ``memory_version``
+    (the checkpoint that encoded them) is not the one now serving. Returns
+    the response text, this turn's encoder outputs when ``memory`` is given
+    (otherwise None), and the checkpoint version that decoded it.
+    """
+    # Imported here so pages that never generate do not import torch
+    from jerechat import rampion2_model
+
+    cache = get_model_cache()
+    with ExitStack() as pinned:
+        if cache.is_resident(model_version):
+            loaded = pinned.enter_context(cache.acquire(model_version))
         else:
-            # Fallback - this should not be called with current logic
-            return None, None
+            with st.spinner(f"Loading {get_model_display_name(model_version)}..."):
+                loaded = pinned.enter_context(cache.acquire(model_version))
+        if loaded is None:
+            return None, None, None
+
+        searcher, voc = loaded.searcher, loaded.voc
+        speculative = get_speculative_models()
+        if speculative is not None and speculative[0] == model_version:
+            draft = pinned.enter_context(cache.acquire(speculative[1]))
+            if draft is not None:
+                searcher = get_speculative_searcher(draft, loaded) or searcher
+                if searcher is not loaded.searcher:
+                    pinned.callback(get_speculative_stats().add, searcher)
+        if normalized_prompt is None:
+            with instrumentation.span("normalize"):
+                normalized_prompt = rampion2_model.normalizeString(prompt)
+        if memory is None:
+            response = rampion2_model.generate_response(searcher, voc, normalized_prompt)
+            return response, None, loaded.version
+        if memory_version is not None and memory_version != loaded.version:
+            # Encoder outputs of replaced weights; start the context afresh
+            memory = ()
+        response, turn_outputs = rampion2_model.generate_response_with_context(
+            searcher, voc, normalized_prompt, memory
+        )
+        return response, turn_outputs, loaded.version
 
-        response_time = time.time() - start_time
-        response_text = response_text.replace("||", "  \n\n")
-        return response_text, response_time
+
+@instrumentation.traced("get_response")
+def get_response(prompt, model_version, normalized_prompt=None):
+    """Generate response using specified model.
+
+    Pass ``normalized_prompt`` to reuse a normalization shared with other
+    models. Identical concurrent requests (same checkpoint, normalized prompt
+    and decode settings) share a single generation and its timing. Returns
+    ``(response_text, response_time, checkpoint_version)``. Raises
+    OverloadedError when the admission controller sheds the request.
+    """
+    if model_version not in get_model_catalog():
+        # Fallback - this should not be called with current logic
+        return None, None, None
+
+    if normalized_prompt is None:
+        normalized_prompt = normalizeString(prompt)
+    context = get_conversation_context(model_version)
+    memory = context.snapshot() if context is not None else None
+    memory_version = context.version if context is not None else None
+    key = (
+        model_version,
+        get_checkpoint_path(model_version),
+        normalized_prompt.strip(),
+        MAX_LENGTH,
+        context.fingerprint() if context is not None else None,
+    )
+    client_id = get_user_id()
+    try:
+        (response_text, response_time, turn_outputs, version), _ = (
+            get_inflight_responses().do(
+                key,
+                lambda: compute_response(
+                    prompt,
+                    model_version,
+                    client_id,
+                    memory,
+                    normalized_prompt,
+                    memory_version,
+                ),
+            )
+        )
+        if context is not None and turn_outputs is not None:
+            context.append(turn_outputs, version)
+        return response_text, response_time, version
+    except OverloadedError:
+        raise
     except Exception as e:
-        return None, None
+        return None, None, None
+
+
+def compute_response(
+    prompt,
+    model_version,
+    client_id="anonymous",
+    memory=None,
+    normalized_prompt=None,
+    memory_version=None,
+):
+    """Run one admitted generation (remote or local) and post-process the text.
+
+    Returns ``(response_text, response_time, turn_outputs, checkpoint_version)``.
+    """
+    start_time = time.time()
+
+    with get_admission_controller().admit(client_id):
+        try:
+            client = get_inference_client()
+            turn_outputs = None
+            if client is not None:
+                response_text, version = client.generate_with_version(
+                    model_version, prompt
+                )
+            else:
+                response_text, turn_outputs, version = generate_local(
+                    prompt, model_version, memory, normalized_prompt, memory_version
+                )
+            if response_text is None:
+                return None, None, None, None
+
+            if model_version == MODEL_17PRO:
+                with instrumentation.span("profanity_filter"):
+                    # If bad words in the response text, remove
+                    # Get list of bad words from secrets
+                    bad_words = st.secrets.get("bad_words", [])
+                    # Replace each bad word with asterisks
+                    for word in bad_words:
+                        if word.lower() in response_text.lower():
+                            # Create a regex pattern that matches the word with any capitalization
+                            pattern = re.compile(re.escape(word), re.IGNORECASE)
+                            # Replace with asterisks of same length
+                            response_text = pattern.sub("*", response_text)
+
+            response_time = time.time() - start_time
+            response_text = response_text.replace("||", "  \n\n")
+            return response_text, response_time, turn_outputs, version
+        except Exception as e:
+            return None, None, None, None
+
+
+def get_response_with_breakdown(prompt, model_version, normalized_prompt=None):
+    """Like get_response, plus the per-span timing breakdown in debug mode."""
+    if not DEBUG_MODE:
+        return (*get_response(prompt, model_version, normalized_prompt), None)
+    with instrumentation.capture() as spans:
+        result = get_response(prompt, model_version, normalized_prompt)
+    return (*result, spans)
+
+
+def get_arena_responses(prompt, model_order):
+    """Generate every arm's response to one prompt in parallel.
+
+    The prompt is normalized once for all arms (each checkpoint still maps
+    words through its own vocabulary). Local models are loaded and pinned
+    up front, under a single spinner, so no arm is evicted while another
+    decodes. Returns ``{model: (response_text, response_time,
+    checkpoint_version, timings)}``. Raises OverloadedError if any arm is
+    shed.
+    """
+    with instrumentation.span("normalize"):
+        normalized_prompt = normalizeString(prompt)
+    # Created here rather than in the workers, which share session state
+    for model_version in model_order:
+        get_conversation_context(model_version)
+
+    ctx = get_script_run_ctx()
+
+    def run(model_version):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return get_response_with_breakdown(prompt, model_version, normalized_prompt)
+
+    with ExitStack() as pinned:
+        if get_inference_client() is None:
+            cache = get_model_cache()
+            missing = [m for m in model_order if not cache.is_resident(m)]
+            loading = (
+                st.spinner(f"Loading {', '.join(map(get_model_display_name, missing))}...")
+                if missing
+                else nullcontext()
+            )
+            with loading:
+                for model_version in model_order:
+                    pinned.enter_context(cache.acquire(model_version))
+        with ThreadPoolExecutor(
+            len(model_order), thread_name_prefix="jerechat-arena"
+        ) as pool:
+            return dict(zip(model_order, pool.map(run, model_order)))
 
 
 # -----------------------------------------------------------------------------
@@ -325,11 +801,8 @@ def get_response(prompt, model_version):
 
 def get_model_display_name(model_id: str) -> str:
     """Convert model identifier to display name for UI."""
-    if model_id == MODEL_17PRO:
-        return MODEL_17PRO_DISPLAY
-    elif model_id == MODEL_RAMPION2:
-        return MODEL_RAMPION2_DISPLAY
-    return model_id
+    spec = get_model_catalog().get(model_id)
+    return spec.display_name if spec is not None else model_id
 
 
 def get_user_id() -> str:
@@ -341,9 +814,38 @@ def get_user_id() -> str:
     )
 
 
-def get_response_times(message_index: int) -> Dict[str, float]:
-    """Return response times dict for a given message index from session state."""
-    return st.session_state.get(f"response_times_{message_index}", {})
+def get_chat_store() -> ChatStore:
+    """Return this session's message store, creating it on first use."""
+    if "chat" not in st.session_state:
+        st.session_state.chat = ChatStore(
+            max_messages=int(st.secrets.get("max_session_messages", 100)),
+            max_bytes=int(st.secrets.get("max_session_bytes", 1 << 20)),
+            max_archived=int(st.secrets.get("max_archived_messages", 500)),
+        )
+    return st.session_state.chat
+
+
+def get_session_bytes() -> Dict[str, int]:
+    """Bytes held by this session's messages and conversation contexts."""
+    usage = get_chat_store().nbytes()
+    usage["context"] = sum(
+        context.nbytes()
+        for context in st.session_state.get("conversation_contexts", {}).values()
+    )
+    usage["total"] += usage["context"]
+    return usage
+
+
+def render_timing_breakdown(timings: Optional[List[Dict[str, Any]]]) -> None:
+    """Show the captured spans for one response (debug mode only)."""
+    if not DEBUG_MODE or not timings:
+        return
+    with st.expander("Timing breakdown", expanded=False):
+        lines = [
+            f"{'&nbsp;' * 4 * entry['depth']}`{entry['name']}` {entry['ms']:.2f} ms"
+            for entry in sorted(timings, key=lambda entry: entry["start"])
+        ]
+        st.markdown("  \n".join(lines), unsafe_allow_html=True)
 
 
 def render_user_message(content: str) -> None:
@@ -358,22 +860,25 @@ def render_preferred_message(message: Dict[str, Any]) -> None:
         model_name = get_model_display_name(message.get("model", "Unknown"))
         st.markdown(f"**{model_name}**")
         st.markdown(message.get("content", ""))
+        render_timing_breakdown(message.get("timings", {}).get(message.get("model")))
+
+
+def arm_label(position: int) -> str:
+    """Anonymous label for an arm before the reveal: Model A, Model B, ..."""
+    return f"Model {chr(ord('A') + position)}"
 
 
 def render_comparison_message(
-    index: int,
-    left_model: str,
-    right_model: str,
-    left_response: str,
-    right_response: str,
-    show_buttons: bool = True,
+    message: Dict[str, Any], show_buttons: bool = True
 ) -> None:
     """Render side-by-side assistant responses. Labels are hidden until reveal."""
-    revealed = st.session_state.get(f"revealed_{index}", None)
+    model_order = message["model_order"]
+    responses = message.get("responses", {})
+    timings = message.get("timings") or {}
+    revealed = message.get("revealed")
 
     # Check if this message is being processed
-    processing_key = f"processing_{index}"
-    is_processing = st.session_state.get(processing_key, False)
+    is_processing = message.get("processing", False)
 
     # If a preference was made, show only the preferred side
     if revealed and revealed.get("show_only_preferred"):
@@ -382,43 +887,52 @@ def render_comparison_message(
 
         with st.chat_message("assistant", avatar="data/resources/icon_small.png"):
             preferred_display = get_model_display_name(revealed["preferred"])
-            other_display = get_model_display_name(revealed["other"])
             st.markdown(f"**{preferred_display}**")
-            if revealed["preferred"] == left_model:
-                st.markdown(left_response)
-            else:
-                st.markdown(right_response)
+            st.markdown(responses.get(revealed["preferred"], ""))
+            render_timing_breakdown(timings.get(revealed["preferred"]))
         return
 
-    # Otherwise show both sides, masking model names if not yet revealed
+    # Otherwise show every arm, masking model names if not yet revealed
     # Add processing state to container
     container_class = "preference-loading" if is_processing else "preference-container"
 
     st.markdown(f'<div class="{container_class}">', unsafe_allow_html=True)
 
-    col1, col2 = st.columns(2)
-    with col1:
-        with st.chat_message("assistant", avatar="data/resources/icon_small.png"):
-            left_display = get_model_display_name(left_model) if revealed else "Model A"
-            st.markdown(f"**{left_display}**")
-            st.markdown(left_response)
-
-    with col2:
-        with st.chat_message("assistant", avatar="data/resources/icon_small.png"):
-            right_display = (
-                get_model_display_name(right_model) if revealed else "Model B"
-            )
-            st.markdown(f"**{right_display}**")
-            st.markdown(right_response)
+    for position, (column, model) in enumerate(
+        zip(st.columns(len(model_order)), model_order)
+    ):
+        with column:
+            with st.chat_message("assistant", avatar="data/resources/icon_small.png"):
+                display = get_model_display_name(model) if revealed else arm_label(position)
+                st.markdown(f"**{display}**")
+                st.markdown(responses.get(model, ""))
+                render_timing_breakdown(timings.get(model))
 
     st.markdown("</div>", unsafe_allow_html=True)
 
     # Show preference buttons only when not yet revealed and enabled
     if not revealed and show_buttons:
-        show_preference_buttons(index, left_model, right_model)
+        show_preference_buttons(message)
+
 
+@st.fragment
+def render_message_fragment(message_id: int) -> None:
+    """Render one stored message as a fragment.
 
-def render_history_message(index: int, message: Dict[str, Any]) -> None:
+    Its preference buttons rerun only this fragment, so a click redraws one
+    message instead of the whole conversation.
+    """
+    # Toasts queued by a preference callback are shown from the fragment body
+    toast = st.session_state.pop("pending_toast", None)
+    if toast:
+        st.toast(**toast)
+
+    message = get_chat_store().get(message_id)
+    if message is not None:
+        render_history_message(message)
+
+
+def render_history_message(message: Dict[str, Any]) -> None:
     """Render a single message from chat history based on its role/type."""
     if message["role"] == "user":
         render_user_message(message.get("content", ""))
@@ -426,14 +940,7 @@ def render_history_message(index: int, message: Dict[str, Any]) -> None:
 
     # Assistant messages can be either comparison or preferred-only
     if "model_order" in message:
-        left_model, right_model = message.get(
-            "model_order", ab_testing.get_model_order()
-        )
-        left_response = message.get("left_response", "")
-        right_response = message.get("right_response", "")
-        render_comparison_message(
-            index, left_model, right_model, left_response, right_response
-        )
+        render_comparison_message(message)
     else:
         render_preferred_message(message)
 
@@ -473,187 +980,135 @@ def render_history_message(index: int, message: Dict[str, Any]) -> None:
 #                     st.toast(f"Error saving feedback: {e}", icon=":material/error:")
 
 
-def show_preference_buttons(message_index, left_model, right_model):
-    """Shows preference buttons for side-by-side comparison."""
+def show_preference_buttons(message):
+    """Shows a preference button under each arm of a comparison."""
     st.write("")
 
+    message_index = message["id"]
+    model_order = message["model_order"]
+
     # Check if this preference is currently being processed
-    processing_key = f"processing_{message_index}"
-    is_processing = st.session_state.get(processing_key, False)
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        # Disable button during processing and show loading state
-        button_disabled = is_processing
-        button_help = "Processing..." if is_processing else ""
-
-        if st.button(
-            f":material/arrow_back: Left is better",
-            key=f"prefer-left-{message_index}",
-            use_container_width=True,
-            disabled=button_disabled,
-            help=button_help,
-        ):
-            # Set processing state immediately
-            st.session_state[processing_key] = True
-            # Batch all operations
-            save_preference_smooth(message_index, left_model, right_model)
-
-    with col2:
-        # Disable button during processing and show loading state
-        button_disabled = is_processing
-        button_help = "Processing..." if is_processing else ""
-
-        if st.button(
-            f"Right is better :material/arrow_forward:",
-            key=f"prefer-right-{message_index}",
-            use_container_width=True,
-            disabled=button_disabled,
-            help=button_help,
-        ):
-            # Set processing state immediately
-            st.session_state[processing_key] = True
-            # Batch all operations
-            save_preference_smooth(message_index, right_model, left_model)
-
-
-def save_preference_smooth(message_index, preferred_model, other_model):
-    """Smooth preference save with optimized state management."""
+    is_processing = message.get("processing", False)
+
+    if len(model_order) == 2:
+        labels = [
+            ("left", ":material/arrow_back: Left is better"),
+            ("right", "Right is better :material/arrow_forward:"),
+        ]
+    else:
+        labels = [
+            (chr(ord("a") + position), f"{arm_label(position)} is best")
+            for position in range(len(model_order))
+        ]
+
+    for column, model, (key, label) in zip(
+        st.columns(len(model_order)), model_order, labels
+    ):
+        with column:
+            # Disable button during processing and show loading state
+            st.button(
+                label,
+                key=f"prefer-{key}-{message_index}",
+                use_container_width=True,
+                disabled=is_processing,
+                help="Processing..." if is_processing else "",
+                on_click=save_preference_smooth,
+                args=(message_index, model),
+            )
+
+
+def save_preference_smooth(message_index, preferred_model):
+    """Smooth preference save with optimized state management.
+
+    Runs as the button's on_click callback, before the message's fragment
+    reruns, so the fragment redraws with the preference already applied.
+    The preference is saved once for every recorded pair that contains the
+    preferred model, each pair weighted so the click counts once in the
+    feedback stats and the allocator.
+    """
+    store = get_chat_store()
+    # Set processing state immediately
+    store.update(message_index, processing=True)
     try:
         user_id = get_user_id()
-        chat_history = (
-            st.session_state.messages[: message_index + 1]
-            if "messages" in st.session_state
-            else []
-        )
-        response_times = get_response_times(message_index)
+        chat_history = store.history(message_index)
+        message = store.get(message_index) or {}
+        response_times = message.get("response_times", {})
+        checkpoint_versions = message.get("checkpoint_versions", {})
+        model_order = message.get("model_order", ())
+        pairs = message.get("pairs") or ab_testing.pairwise_assignments(model_order)
+        other_models = [m for m in model_order if m != preferred_model]
 
         # Update UI state first for immediate feedback
         preferred_display = get_model_display_name(preferred_model)
 
         # Update chat history immediately
-        if message_index < len(st.session_state.messages):
-            message = st.session_state.messages[message_index]
-            if message["role"] == "assistant":
-                left_model, right_model = message.get("model_order", (None, None))
-                left_response = message.get("left_response", "")
-                right_response = message.get("right_response", "")
-
-                # Keep only the preferred response
-                preferred_response = (
-                    left_response if preferred_model == left_model else right_response
-                )
-
-                # Update the message to show only preferred response
-                st.session_state.messages[message_index] = {
-                    "role": "assistant",
-                    "content": preferred_response,
-                    "model": preferred_model,
-                    "was_comparison": True,
-                    "other_model": other_model,
-                }
-
-        # Set reveal state
-        st.session_state[f"revealed_{message_index}"] = {
-            "preferred": preferred_model,
-            "other": other_model,
-            "show_only_preferred": True,
-        }
-
-        # Clear processing state
-        processing_key = f"processing_{message_index}"
-        st.session_state[processing_key] = False
-
-        # Show success toast
-        st.toast(
-            f"#####  You liked {preferred_display}!",
-            icon=":material/sentiment_very_satisfied:",
-            duration="long",
-        )
-
-        # Save to database in background (non-blocking)
-        save_preference_feedback(
-            message_index=message_index,
-            preferred_model=preferred_model,
-            other_model=other_model,
-            chat_history=chat_history,
-            user_id=user_id,
-            response_times=response_times,
-        )
-
-        # Rerun to show updated UI
-        st.rerun()
-
-    except Exception as e:
-        # Clear processing state on error
-        processing_key = f"processing_{message_index}"
-        st.session_state[processing_key] = False
-        st.toast(f"Error saving preference: {e}", icon=":material/error:")
-        st.rerun()
-
-
-def reveal_models(message_index, preferred_model, other_model):
-    """Reveal which models were which after preference is chosen."""
-    st.session_state[f"revealed_{message_index}"] = {
-        "preferred": preferred_model,
-        "other": other_model,
-        "show_only_preferred": True,
-    }
-    st.rerun()
-
+        if message.get("role") == "assistant":
+            # Update the message to show only preferred response
+            store.replace(
+                message_index,
+                role="assistant",
+                content=message.get("responses", {}).get(preferred_model, ""),
+                model=preferred_model,
+                was_comparison=True,
+                other_models=other_models,
+                checkpoint_versions=checkpoint_versions,
+            )
 
-def save_preference(message_index, preferred_model, other_model):
-    """Save user preference to Supabase and update chat history."""
-    try:
-        user_id = get_user_id()
-        chat_history = (
-            st.session_state.messages[: message_index + 1]
-            if "messages" in st.session_state
-            else []
+        # Set reveal state and clear processing state
+        store.update(
+            message_index,
+            revealed={
+                "preferred": preferred_model,
+                "others": other_models,
+                "show_only_preferred": True,
+            },
+            processing=False,
         )
 
-        # Get response times from session state
-        response_times = get_response_times(message_index)
-
-        save_preference_feedback(
-            message_index=message_index,
-            preferred_model=preferred_model,
-            other_model=other_model,
-            chat_history=chat_history,
-            user_id=user_id,
-            response_times=response_times,
-        )
-        preferred_display = get_model_display_name(preferred_model)
-        st.toast(
-            f"#####  You liked {preferred_display}!",
-            icon=":material/sentiment_very_satisfied:",
-            duration="long",
-        )
+        # Show success toast
+        st.session_state.pending_toast = {
+            "body": f"#####  You liked {preferred_display}!",
+            "icon": ":material/sentiment_very_satisfied:",
+            "duration": "long",
+        }
 
-        # Update chat history to only show preferred response
-        if message_index < len(st.session_state.messages):
-            message = st.session_state.messages[message_index]
-            if message["role"] == "assistant":
-                left_model, right_model = message.get("model_order", (None, None))
-                left_response = message.get("left_response", "")
-                right_response = message.get("right_response", "")
-
-                # Keep only the preferred response
-                preferred_response = (
-                    left_response if preferred_model == left_model else right_response
+        # Save each pair the preference decides
+        decided = [pair for pair in pairs if preferred_model in pair]
+        weight = 1 / len(decided) if decided else 1.0
+        comparison_id = uuid.uuid4().hex
+        for pair in decided:
+            other_model = pair[1] if pair[0] == preferred_model else pair[0]
+            saved = save_preference_feedback(
+                message_index=message_index,
+                preferred_model=preferred_model,
+                other_model=other_model,
+                chat_history=chat_history,
+                user_id=user_id,
+                response_times=response_times,
+                checkpoint_versions=checkpoint_versions,
+                weight=weight,
+                comparison_id=comparison_id,
+            )
+            allocator = get_allocator()
+            if saved is not None and allocator is not None:
+                allocator.observe(
+                    preferred_model,
+                    "good",
+                    response_times.get(preferred_model),
+                    weight,
+                )
+                allocator.observe(
+                    other_model, "bad", response_times.get(other_model), weight
                 )
 
-                # Update the message to show only preferred response
-                st.session_state.messages[message_index] = {
-                    "role": "assistant",
-                    "content": preferred_response,
-                    "model": preferred_model,
-                    "was_comparison": True,
-                    "other_model": other_model,
-                }
     except Exception as e:
-        st.toast(f"Error saving preference: {e}", icon=":material/error:")
+        # Clear processing state on error
+        store.update(message_index, processing=False)
+        st.session_state.pending_toast = {
+            "body": f"Error saving preference: {e}",
+            "icon": ":material/error:",
+        }
 
 
 @st.dialog("Disclaimer")
@@ -697,14 +1152,10 @@ user_first_interaction = (
     user_just_asked_initial_question or user_just_clicked_suggestion
 )
 
-has_message_history = (
-    "messages" in st.session_state and len(st.session_state.messages) > 0
-)
+has_message_history = len(get_chat_store()) > 0
 
 # Show a different UI when the user hasn't asked a question yet.
 if not user_first_interaction and not has_message_history:
-    st.session_state.messages = []
-
     with st.container():
         st.chat_input("Ask a question...", key="initial_question")
 
@@ -732,6 +1183,8 @@ if not user_first_interaction and not has_message_history:
         unsafe_allow_html=True,
     )
 
+    start_background_warmup()
+
     st.stop()
 
 # Show chat input at the bottom when a question has been asked.
@@ -746,9 +1199,10 @@ if not user_message:
 with title_row:
 
     def clear_conversation():
-        st.session_state.messages = []
+        get_chat_store().clear()
         st.session_state.initial_question = None
         st.session_state.selected_suggestion = None
+        st.session_state.pop("conversation_contexts", None)
 
     st.button(
         "Restart",
@@ -756,12 +1210,45 @@ with title_row:
         on_click=clear_conversation,
     )
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+chat = get_chat_store()
+
+if DEBUG_MODE:
+    usage = get_session_bytes()
+    st.sidebar.caption(
+        f"Session state: {usage['total'] / 1024:.1f} KiB "
+        f"({len(chat)} live, {chat.archived_count} archived messages)"
+    )
+    if get_inference_client() is None:
+        cache = get_model_cache()
+        st.sidebar.caption(
+            f"Model cache: {cache.resident_bytes() / 2**20:.0f} of "
+            f"{cache.budget_bytes / 2**20:.0f} MiB, "
+            f"{cache.loads} loads, {cache.evictions} evictions, {cache.reloads} reloads"
+        )
+        for model_id, model_status in cache.status().items():
+            seconds = model_status["load_seconds"]
+            st.sidebar.caption(
+                f"{get_model_display_name(model_id)}: {model_status['state']}"
+                + (f" {model_status['version']}" if model_status["version"] else "")
+                + (f" (loaded in {seconds:.1f}s)" if seconds is not None else "")
+                + (f", {model_status['draining']} draining" if model_status["draining"] else "")
+            )
+    speculative = get_speculative_stats()
+    if speculative.refused:
+        st.sidebar.caption(f"Speculative decoding refused: {speculative.refused}")
+    elif speculative.drafted:
+        st.sidebar.caption(
+            f"Speculative decoding: {speculative.acceptance_rate:.0%} of draft tokens accepted"
+        )
+
+if chat.archived_count:
+    st.caption(
+        f":material/history: {chat.archived_count} earlier messages are no longer shown."
+    )
 
 # Display chat messages from history as speech bubbles.
-for i, message in enumerate(st.session_state.messages):
-    render_history_message(i, message)
+for message in chat.messages:
+    render_message_fragment(message["id"])
 
 if user_message:
     # When the user posts a message...
@@ -769,56 +1256,48 @@ if user_message:
     # Streamlit's Markdown engine interprets "$" as LaTeX code
     user_message = user_message.replace("$", r"\$")
 
-    # Get random model order for this comparison
-    left_model, right_model = ab_testing.get_model_order()
+    # Draw this comparison's arms, in random display order
+    arena_models, arena_size = get_arena_models()
+    allocator = get_allocator()
+    if allocator is not None:
+        model_order = allocator.choose(arena_models, arena_size, get_user_id())
+    else:
+        model_order = ab_testing.get_model_order(arena_models, arena_size)
 
     # Display user message
     with st.chat_message("user"):
         st.text(user_message)
 
-    # Generate responses from both models
+    # Generate responses from every arm at once
     with st.spinner("Thinking..."):
-        left_response, left_time = get_response(user_message, left_model)
-        right_response, right_time = get_response(user_message, right_model)
-
-        # Store response times
-        st.session_state[f"response_times_{len(st.session_state.messages)}"] = {
-            left_model: left_time,
-            right_model: right_time,
-        }
+        try:
+            results = get_arena_responses(user_message, model_order)
+        except OverloadedError:
+            st.warning(
+                "JereChat is very busy right now. Please try again in a moment.",
+                icon=":material/hourglass_top:",
+            )
+            st.stop()
 
     # Handle timeouts or errors by notifying user and preventing None rendering
-    if left_response is None:
-        st.error("Model request timed out.")
-        left_response = ""
-    if right_response is None:
-        st.error("Model request timed out.")
-        right_response = ""
-
-    # Display side-by-side comparison (before reveal)
-    render_comparison_message(
-        index=len(st.session_state.messages)
-        + 1,  # temporary index for UI before append
-        left_model=left_model,
-        right_model=right_model,
-        left_response=left_response,
-        right_response=right_response,
-        show_buttons=False,
-    )
+    for response, _, _, _ in results.values():
+        if response is None:
+            st.error("Model request timed out.")
 
     # Add to chat history
-    st.session_state.messages.append({"role": "user", "content": user_message})
-    st.session_state.messages.append(
-        {
-            "role": "assistant",
-            "model_order": (left_model, right_model),
-            "left_response": left_response,
-            "right_response": right_response,
-        }
+    chat.add("user", content=user_message)
+    assistant_message = chat.add(
+        "assistant",
+        model_order=model_order,
+        pairs=ab_testing.pairwise_assignments(model_order),
+        responses={model: r[0] or "" for model, r in results.items()},
+        response_times={model: r[1] for model, r in results.items()},
+        checkpoint_versions={model: r[2] for model, r in results.items()},
+        timings={model: r[3] for model, r in results.items()} if DEBUG_MODE else {},
     )
 
-    # Show preference buttons
-    show_preference_buttons(len(st.session_state.messages) - 1, left_model, right_model)
+    # Display side-by-side comparison with its preference buttons
+    render_message_fragment(assistant_message["id"])
 
 # Add disclaimer banner at the very bottom
 st.markdown("---")
@@ -830,3 +1309,5 @@ st.markdown(
 """,
     unsafe_allow_html=True,
 )
+
+start_background_warmup()